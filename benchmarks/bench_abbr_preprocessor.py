@@ -0,0 +1,156 @@
+"""Benchmark of abbreviation lookup in AbbrPreprocessor
+
+Compare throughput of the previous implementation (regex and exact lookup of the whole Latin run,
+Cartesian product of all expansions) with the current one (precompiled regex, trie lookup, lazy expansion).
+
+Usage:
+    python benchmarks/bench_abbr_preprocessor.py
+    python benchmarks/bench_abbr_preprocessor.py --abbr-dict ~/.cache/norm/abb_dict.json
+
+Without --abbr-dict, a synthetic abbreviation dictionary is generated.
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import string
+import argparse
+
+import jaconv
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from japanese_disease_normalizer.preprocessor.abbr_preprocessor import AbbrPreprocessor, AbbrEntry
+
+TEXTS = ["高", "血症", "の疑い", "術後", "による", "急性", "慢性", "合併", "既往あり", "にて入院", "陽性", ""]
+NAMES = ["白血病", "肺疾患", "心筋梗塞", "腎不全", "糖尿病", "肝炎", "靱帯損傷", "症候群", "抗原", "感染症"]
+
+
+def legacy_preprocess(abbr_dict, word):
+    """AbbrPreprocessor.preprocess before the trie lookup and the lazy expansion"""
+    word = jaconv.z2h(word, kana=False, ascii=True, digit=True)
+    iters = re.finditer(r'([a-zA-Z][a-zA-Z\s]*)', word)
+
+    pos = 0
+    output_words = []
+    for ite in iters:
+        s_pos, e_pos = ite.span()
+        abbr = ite.groups()[0].strip()
+
+        if pos != s_pos:
+            output_words.append(word[pos:s_pos])
+
+        s_word = [abbr]
+        if abbr in abbr_dict:
+            s_word += [w.name for w in abbr_dict[abbr]]
+        elif word.lower() in abbr_dict:
+            s_word += [w.name for w in abbr_dict[abbr.lower()]]
+
+        output_words.append(s_word)
+        pos = e_pos
+
+    output_words.append(word[pos:])
+
+    def flatten_words(word_list):
+        if len(word_list) == 0:
+            return [[]]
+
+        if isinstance(word_list[0], str):
+            results = [[word_list[0]] + l for l in flatten_words(word_list[1:])]
+        elif isinstance(word_list[0], list):
+            results = [[w] + l for w in word_list[0] for l in flatten_words(word_list[1:])]
+        return results
+
+    results = flatten_words(output_words)
+    return [''.join(l) for l in results]
+
+
+def generate_abbr_dict(size, seed=0):
+    rng = random.Random(seed)
+    abbrs = set()
+    while len(abbrs) < size:
+        abbrs.add("".join(rng.choice(string.ascii_uppercase) for _ in range(rng.randint(2, 5))))
+    abbr_dict = {}
+    for abbr in sorted(abbrs):
+        abbr_dict[abbr] = [
+            AbbrEntry(abbr, rng.choice(TEXTS[:6]) + rng.choice(NAMES), rng.randint(1, 100))
+            for _ in range(rng.randint(1, 4))
+        ]
+    return abbr_dict
+
+
+def generate_queries(abbr_dict, n, seed=0):
+    rng = random.Random(seed)
+    abbrs = list(abbr_dict.keys())
+    queries = []
+    for _ in range(n):
+        query = rng.choice(TEXTS)
+        for _ in range(rng.randint(0, 3)):
+            abbr = rng.choice(abbrs)
+            r = rng.random()
+            if r < 0.2:
+                # two abbreviations in one Latin run
+                abbr = abbr + " " + rng.choice(abbrs)
+            elif r < 0.3:
+                abbr = abbr.lower()
+            elif r < 0.4:
+                abbr = jaconv.h2z(abbr, ascii=True)
+            query += abbr + rng.choice(TEXTS)
+        queries.append(query)
+    return queries
+
+
+def measure(func, queries, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for query in queries:
+            func(query)
+        best = min(best, time.perf_counter() - start)
+    return len(queries) / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of abbreviation lookup")
+    parser.add_argument("--abbr-dict", help="path of abb_dict.json (synthetic if omitted)")
+    parser.add_argument("--size", type=int, default=20000, help="number of abbreviations of the synthetic dictionary")
+    parser.add_argument("--queries", type=int, default=5000, help="number of queries")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.abbr_dict:
+        with open(os.path.expanduser(args.abbr_dict)) as f:
+            raw = json.load(f)
+        abbr_dict = {key: [AbbrEntry(key, v[1], v[0]) for v in raw[key]] for key in raw.keys()}
+    else:
+        abbr_dict = generate_abbr_dict(args.size, args.seed)
+    queries = generate_queries(abbr_dict, args.queries, args.seed)
+
+    start = time.perf_counter()
+    model = AbbrPreprocessor(abbr_dict=abbr_dict)
+    print("abbreviations: %d, queries: %d, trie build: %.1f ms" % (
+        len(abbr_dict), len(queries), (time.perf_counter() - start) * 1000))
+
+    legacy = [legacy_preprocess(abbr_dict, query) for query in queries]
+    current = [model.preprocess(query) for query in queries]
+    print("candidates per query: legacy %.2f, trie %.2f" % (
+        sum(map(len, legacy)) / len(queries), sum(map(len, current)) / len(queries)))
+    print("queries with more abbreviations found by trie: %d" % sum(
+        len(c) > len(l) for l, c in zip(legacy, current)))
+
+    same = [q for q, l, c in zip(queries, legacy, current) if sorted(l) == sorted(c)]
+    print("legacy (same)  : %8.0f queries/s on %d queries with the same candidates" % (
+        measure(lambda q: legacy_preprocess(abbr_dict, q), same, args.repeat), len(same)))
+    print("trie (same)    : %8.0f queries/s" % measure(model.preprocess, same, args.repeat))
+    print("legacy         : %8.0f queries/s" % measure(lambda q: legacy_preprocess(abbr_dict, q), queries, args.repeat))
+    print("trie (split)   : %8.0f queries/s" % measure(model.split, queries, args.repeat))
+    print("trie           : %8.0f queries/s" % measure(model.preprocess, queries, args.repeat))
+    model.max_candidates = 10
+    print("trie (max 10)  : %8.0f queries/s" % measure(model.preprocess, queries, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
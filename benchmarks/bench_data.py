@@ -0,0 +1,51 @@
+"""Synthetic disease names shared by the benchmarks
+
+Names are combinations of laterality, course, organ, disease and suffix (PARTS).
+Random two-kanji organ names are added so that the vocabulary is as large as that of the real dictionary.
+"""
+import random
+
+from japanese_disease_normalizer.utils import DictEntry
+
+PARTS = [
+    ["", "左", "右", "両側", "多発性"],
+    ["", "急性", "慢性", "再発性", "難治性", "先天性", "続発性", "原発性", "特発性", "遺伝性", "感染性"],
+    ["", "骨髄性", "リンパ性", "肝", "腎", "肺", "胃", "大腸", "膵", "心", "脳", "甲状腺", "皮膚"],
+    ["", "白血病", "癌", "炎", "腫瘍", "梗塞", "不全", "症", "出血", "潰瘍", "線維症", "結石", "肥大"],
+    ["", "疑い", "術後", "合併", "I型", "II型", "III型"],
+]
+
+
+KANJI = "胸腹頸腰背膝肘肩股足手指眼耳鼻口舌歯咽喉食道管胆嚢脾膀胱卵巣精子宮乳房骨筋腱靭帯関節血液神経髄膜視網角結核梅毒麻疹風疹水痘帯状"
+
+
+def sample_parts(rng, size):
+    """PARTS with random organ names for a dictionary of the size
+
+    Args:
+        rng random.Random: random generator
+        size int: number of entries of the dictionary
+
+    Returns:
+        List[List[str]]: candidates of each part
+    """
+    organs = sorted(set(rng.choice(KANJI) + rng.choice(KANJI) for _ in range(size // 10)))
+    return PARTS[:2] + [PARTS[2] + organs] + PARTS[3:]
+
+
+def generate_dictionary(size, seed=0):
+    """Generate dictionary whose names are their own normalized forms
+
+    Args:
+        size int: number of entries
+        seed int: random seed
+
+    Returns:
+        List[DictEntry]: entries sorted by name
+    """
+    rng = random.Random(seed)
+    parts = sample_parts(rng, size)
+    names = set()
+    while len(names) < size:
+        names.add("".join(rng.choice(part) for part in parts) or "症")
+    return [DictEntry(name, "X00", name, "S") for name in sorted(names)]
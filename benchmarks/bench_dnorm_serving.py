@@ -0,0 +1,77 @@
+"""Benchmark of DNorm serving modes
+
+Compare per-query latency of DNorm.predict with three scoring modes:
+full scoring against norms_vec (calc_score), candidate scoring with the inverted index (default),
+and the frozen projection (DNorm.freeze).
+
+Usage:
+    python benchmarks/bench_dnorm_serving.py
+    python benchmarks/bench_dnorm_serving.py --dict ~/.cache/norm/MANBYO_SABC.csv --model ~/.cache/Dnorm/dnorm.pkl
+
+Without --dict, a synthetic dictionary is generated. Without --model, tf-idf is fitted on the dictionary
+and W is the identity with random off-diagonal weights, which resembles a trained W.
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+import numpy as np
+from scipy.sparse import random as sparse_random
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from bench_data import generate_dictionary
+from japanese_disease_normalizer.utils import load_dict
+from japanese_disease_normalizer.converter.dnorm.dnorm import DNorm
+
+
+def measure(model, queries, k):
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        model.predict([query], k=k)
+        latencies.append(time.perf_counter() - start)
+    latencies = np.array(latencies) * 1000
+    return np.percentile(latencies, 50), np.percentile(latencies, 99), latencies.mean()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of DNorm serving modes")
+    parser.add_argument("--dict", help="path of the manbyo dictionary (synthetic if omitted)")
+    parser.add_argument("--model", help="path of dnorm.pkl (identity-like W if omitted)")
+    parser.add_argument("--size", type=int, default=20000, help="size of the synthetic dictionary")
+    parser.add_argument("--queries", type=int, default=500, help="number of queries")
+    parser.add_argument("--k", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    dictionary = load_dict(args.dict) if args.dict else generate_dictionary(args.size, args.seed)
+    model = DNorm(dictionary, args.model)
+    if args.model is None:
+        noise = sparse_random(*model.W.shape, density=0.001, random_state=args.seed, format="csr")
+        model.W = (model.W + noise * 0.1).tocsr()
+
+    rng = random.Random(args.seed)
+    queries = [rng.choice(dictionary).name[rng.randint(0, 2):] + rng.choice(["", "の疑い", "だ"]) for _ in range(args.queries)]
+
+    print("dictionary: %d entries, features: %d, W nnz: %d" % (len(dictionary), model.W.shape[0], model.W.nnz))
+    model.score_dictionary = lambda x_vec: model.calc_score(x_vec, model.norms_vec)
+    p50, p99, mean = measure(model, queries, args.k)
+    print("calc_score : p50 %.3f ms, p99 %.3f ms, mean %.3f ms" % (p50, p99, mean))
+
+    del model.score_dictionary
+    p50, p99, mean = measure(model, queries, args.k)
+    print("index      : p50 %.3f ms, p99 %.3f ms, mean %.3f ms" % (p50, p99, mean))
+
+    start = time.perf_counter()
+    model.freeze()
+    print("freeze     : %.1f ms (projected nnz: %d)" % ((time.perf_counter() - start) * 1000, model.projected.nnz))
+    p50, p99, mean = measure(model, queries, args.k)
+    print("frozen     : p50 %.3f ms, p99 %.3f ms, mean %.3f ms" % (p50, p99, mean))
+
+
+if __name__ == "__main__":
+    main()
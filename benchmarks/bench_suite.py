@@ -0,0 +1,375 @@
+"""Benchmark suite of preprocessors, converters and end-to-end normalization
+
+Everything runs offline: a dictionary shaped like MANBYO_SABC.csv, an abbreviation dictionary
+and a DNorm model (tf-idf fitted on the dictionary with identity-like W) are generated under a temporary
+DEFAULT_CACHE_PATH, and mentions are generated from the dictionary with typos, abbreviations and width variants.
+
+Each pipeline/converter pair runs in a fresh process and reports
+- startup: time to build Normalizer (loading and preprocessing the dictionary, building the converter)
+- preprocess, convert and normalize latency (p50/p99/mean in ms) of single queries
+- throughput of normalize and normalize_batch (queries/s)
+- peak memory traced by tracemalloc while building Normalizer and normalizing the corpus, and max RSS of the process
+
+Results are written as JSON, and two result files can be compared.
+
+Usage:
+    python benchmarks/bench_suite.py -o before.json
+    python benchmarks/bench_suite.py -o after.json --configs basic:fuzzy abbr:cascade
+    python benchmarks/bench_suite.py --compare before.json after.json --threshold 0.1
+"""
+import os
+import sys
+import csv
+import json
+import time
+import random
+import string
+import argparse
+import platform
+import tempfile
+import tracemalloc
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import jaconv
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from bench_data import KANJI, sample_parts
+from japanese_disease_normalizer.normalizer import Normalizer
+from japanese_disease_normalizer.utils import DictEntry
+
+DEFAULT_CONFIGS = [
+    "basic:exact", "basic:fuzzy", "basic:bigram", "basic:dnorm", "basic:cascade",
+    "abbr:fuzzy", "abbr:bigram", "abbr:cascade",
+]
+LEVELS = ["S", "A", "B", "C", "D"]
+SUFFIXES = ["の疑い", "術後", "にて入院", "の既往", "あり"]
+# metrics compared by --compare and whether larger is better
+COMPARED_METRICS = [
+    ("startup_s", False),
+    ("normalize_qps", True),
+    ("normalize_batch_qps", True),
+    ("normalize_latency_ms.p50", False),
+    ("normalize_latency_ms.p99", False),
+    ("peak_memory_mb", False),
+]
+
+
+def generate_manbyo(size, seed=0):
+    """Generate dictionary shaped like MANBYO_SABC.csv
+
+    Names are combinations of laterality, course, organ, disease and suffix.
+    The normalized form drops laterality and suffix, so several names share one normalized form and icd code.
+
+    Args:
+        size int: number of entries
+        seed int: random seed
+
+    Returns:
+        List[DictEntry]: entries
+    """
+    rng = random.Random(seed)
+    parts = sample_parts(rng, size)
+    codes = {}
+    entries = {}
+    while len(entries) < size:
+        values = [rng.choice(part) for part in parts]
+        name = "".join(values) or "症"
+        if name in entries:
+            continue
+        norm = "".join(values[1:4]) or name
+        if norm not in codes:
+            codes[norm] = "%s%02d%d" % (rng.choice(string.ascii_uppercase), rng.randint(0, 99), rng.randint(0, 9))
+        entries[name] = DictEntry(name, codes[norm], norm, rng.choice(LEVELS))
+    return [entries[name] for name in sorted(entries)]
+
+
+def generate_abbr_dict(entries, size, seed=0):
+    """Generate abbreviation dictionary in the format of abb_dict.json
+
+    Each abbreviation expands to one or more dictionary names with frequencies.
+
+    Args:
+        entries List[DictEntry]: dictionary
+        size int: number of abbreviations
+        seed int: random seed
+
+    Returns:
+        Dict[str, List[Tuple[int, str]]]: abbreviation to [frequency, expansion] pairs
+    """
+    rng = random.Random(seed)
+    abbr_dict = {}
+    while len(abbr_dict) < size:
+        abbr = "".join(rng.choice(string.ascii_uppercase) for _ in range(rng.randint(2, 4)))
+        expansions = rng.sample(entries, rng.choice([1, 1, 1, 2, 3]))
+        abbr_dict[abbr] = [[rng.randint(1, 100), entry.name] for entry in expansions]
+    return abbr_dict
+
+
+def add_typo(rng, text):
+    if len(text) < 2:
+        return text
+    i = rng.randrange(len(text) - 1)
+    r = rng.random()
+    if r < 0.4:
+        return text[:i] + text[i+1:]
+    elif r < 0.7:
+        return text[:i] + text[i+1] + text[i] + text[i+2:]
+    return text[:i] + rng.choice(KANJI) + text[i+1:]
+
+
+def generate_mentions(entries, abbr_dict, n, seed=0):
+    """Generate mentions from the dictionary
+
+    Mentions are exact names, names with a typo, abbreviations, width variants (full-width ascii and digits,
+    half-width katakana) and names with a suffix, in the ratio 3:2:2:1.5:1.5.
+
+    Args:
+        entries List[DictEntry]: dictionary
+        abbr_dict Dict[str, List[Tuple[int, str]]]: abbreviation dictionary
+        n int: number of mentions
+        seed int: random seed
+
+    Returns:
+        List[str]: mentions
+    """
+    rng = random.Random(seed)
+    abbrs = sorted(abbr_dict.keys())
+    mentions = []
+    for _ in range(n):
+        name = rng.choice(entries).name
+        r = rng.random()
+        if r < 0.3:
+            mention = name
+        elif r < 0.5:
+            mention = add_typo(rng, name)
+        elif r < 0.7:
+            abbr = rng.choice(abbrs)
+            mention = rng.choice(["", "左", "急性"]) + rng.choice([abbr, abbr.lower()]) + rng.choice([""] + SUFFIXES)
+        elif r < 0.85:
+            mention = jaconv.h2z(rng.choice([name, "2型" + name, name + "II型"]), ascii=True, digit=True)
+            mention = jaconv.z2h(mention, kana=True, ascii=False, digit=False) if rng.random() < 0.5 else mention
+        else:
+            mention = name + rng.choice(SUFFIXES)
+        mentions.append(mention)
+    return mentions
+
+
+def prepare_cache(cache_path, size, abbr_size, seed=0):
+    """Write the synthetic dictionary, abbreviation dictionary and DNorm model under cache_path
+
+    Args:
+        cache_path str: directory used as DEFAULT_CACHE_PATH
+        size int: number of dictionary entries
+        abbr_size int: number of abbreviations
+        seed int: random seed
+
+    Returns:
+        Tuple[List[DictEntry], Dict]: dictionary and abbreviation dictionary
+    """
+    from japanese_disease_normalizer.converter.dnorm.dnorm import DNorm
+
+    entries = generate_manbyo(size, seed)
+    abbr_dict = generate_abbr_dict(entries, abbr_size, seed)
+    os.makedirs(os.path.join(cache_path, "norm"), exist_ok=True)
+    with open(os.path.join(cache_path, "norm", "MANBYO_SABC.csv"), "w", newline="") as f:
+        writer = csv.writer(f)
+        for entry in entries:
+            writer.writerow([entry.name, entry.icd, entry.norm, entry.level])
+    with open(os.path.join(cache_path, "norm", "abb_dict.json"), "w") as f:
+        json.dump(abbr_dict, f, ensure_ascii=False)
+
+    # tf-idf fitted on the dictionary with identity W, in the format DNormConverter loads
+    model = DNorm(entries, None)
+    model.save_mmap_model(os.path.join(cache_path, "Dnorm", "dnorm_mmap"))
+    return entries, abbr_dict
+
+
+def latency_stats(latencies):
+    latencies = np.array(latencies) * 1000
+    return {
+        "p50": float(np.percentile(latencies, 50)),
+        "p99": float(np.percentile(latencies, 99)),
+        "mean": float(latencies.mean()),
+    }
+
+
+def time_each(func, queries):
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        func(query)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def max_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes on Linux
+    return rss / (1 << 20) if sys.platform == "darwin" else rss / (1 << 10)
+
+
+def run_config(config, cache_path, mentions, batch_size):
+    """Benchmark one pipeline/converter pair (run in a fresh process)
+
+    Args:
+        config str: pipeline:converter
+        cache_path str: directory used as DEFAULT_CACHE_PATH
+        mentions List[str]: queries
+        batch_size int: number of queries in one normalize_batch call
+
+    Returns:
+        dict: results of the pair
+    """
+    os.environ["DEFAULT_CACHE_PATH"] = cache_path
+    pipeline, converter = config.split(":")
+
+    start = time.perf_counter()
+    normalizer = Normalizer(pipeline, converter)
+    startup = time.perf_counter() - start
+
+    # warm up lazily built tables (e.g. translation table of the compiled pipeline)
+    for mention in mentions[:100]:
+        normalizer.normalize(mention)
+
+    preprocessed = [normalizer.preprocessor.preprocess(mention)[0] for mention in mentions]
+    preprocess_latencies = time_each(normalizer.preprocessor.preprocess, mentions)
+    convert_latencies = time_each(normalizer.converter.convert, preprocessed)
+    normalize_latencies = time_each(normalizer.normalize, mentions)
+
+    start = time.perf_counter()
+    for i in range(0, len(mentions), batch_size):
+        normalizer.normalize_batch(mentions[i:i+batch_size])
+    batch_time = time.perf_counter() - start
+
+    found = sum(entry.name is not None for entry in normalizer.normalize_batch(mentions))
+    del normalizer
+
+    # peak memory is measured separately because tracemalloc slows down allocation
+    tracemalloc.start()
+    normalizer = Normalizer(pipeline, converter)
+    build_peak = tracemalloc.get_traced_memory()[1]
+    for i in range(0, len(mentions), batch_size):
+        normalizer.normalize_batch(mentions[i:i+batch_size])
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        "config": config,
+        "dictionary_size": len(normalizer.manbyo_dict),
+        "startup_s": startup,
+        "dict_preprocess_s": normalizer.dict_preprocess_time,
+        "preprocess_latency_ms": latency_stats(preprocess_latencies),
+        "convert_latency_ms": latency_stats(convert_latencies),
+        "normalize_latency_ms": latency_stats(normalize_latencies),
+        "normalize_qps": len(mentions) / sum(normalize_latencies),
+        "normalize_batch_qps": len(mentions) / batch_time,
+        "found_ratio": found / len(mentions),
+        "build_peak_memory_mb": build_peak / (1 << 20),
+        "peak_memory_mb": peak / (1 << 20),
+        "max_rss_mb": max_rss_mb(),
+    }
+
+
+def get_metric(result, metric):
+    for key in metric.split("."):
+        result = result[key]
+    return result
+
+
+def compare(base_path, new_path, threshold):
+    """Print the change of the metrics between two result files
+
+    Args:
+        base_path str: result file of the baseline
+        new_path str: result file to compare
+        threshold float: relative change regarded as a regression
+
+    Returns:
+        int: number of regressions
+    """
+    with open(base_path) as f:
+        base = {result["config"]: result for result in json.load(f)["results"]}
+    with open(new_path) as f:
+        new = {result["config"]: result for result in json.load(f)["results"]}
+
+    regressions = 0
+    print("%-16s %-26s %12s %12s %9s" % ("config", "metric", "base", "new", "change"))
+    for config in base:
+        if config not in new:
+            print("%-16s missing in %s" % (config, new_path))
+            continue
+        for metric, higher_is_better in COMPARED_METRICS:
+            before, after = get_metric(base[config], metric), get_metric(new[config], metric)
+            change = (after - before) / before if before else 0.0
+            regressed = (change < -threshold) if higher_is_better else (change > threshold)
+            regressions += regressed
+            print("%-16s %-26s %12.3f %12.3f %+8.1f%%%s" % (
+                config, metric, before, after, change * 100, "  REGRESSION" if regressed else ""))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark suite of the normalizer")
+    parser.add_argument("-o", "--output", help="path of the JSON results (stdout if omitted)")
+    parser.add_argument("--configs", nargs="+", default=DEFAULT_CONFIGS, help="pipeline:converter pairs")
+    parser.add_argument("--size", type=int, default=20000, help="number of dictionary entries")
+    parser.add_argument("--abbrs", type=int, default=2000, help="number of abbreviations")
+    parser.add_argument("--queries", type=int, default=2000, help="number of mentions")
+    parser.add_argument("--batch-size", type=int, default=256, help="number of mentions in one normalize_batch call")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "NEW"), help="compare two result files")
+    parser.add_argument("--threshold", type=float, default=0.1, help="relative change regarded as a regression in --compare")
+    args = parser.parse_args()
+
+    if args.compare:
+        regressions = compare(args.compare[0], args.compare[1], args.threshold)
+        sys.exit(1 if regressions > 0 else 0)
+
+    with tempfile.TemporaryDirectory() as cache_path:
+        start = time.perf_counter()
+        entries, abbr_dict = prepare_cache(cache_path, args.size, args.abbrs, args.seed)
+        mentions = generate_mentions(entries, abbr_dict, args.queries, args.seed)
+        print("generated %d entries, %d abbreviations and %d mentions in %.1f s" % (
+            len(entries), len(abbr_dict), len(mentions), time.perf_counter() - start), file=sys.stderr)
+
+        results = []
+        for config in args.configs:
+            # a fresh process for each pair so that startup and memory do not depend on the previous pairs
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+                result = executor.submit(run_config, config, cache_path, mentions, args.batch_size).result()
+            print("%-16s startup %7.2f s, normalize p50 %7.3f ms p99 %7.3f ms, batch %8.0f q/s, peak %7.1f MB" % (
+                config, result["startup_s"], result["normalize_latency_ms"]["p50"],
+                result["normalize_latency_ms"]["p99"], result["normalize_batch_qps"], result["peak_memory_mb"]),
+                file=sys.stderr)
+            results.append(result)
+
+    output = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": np.__version__,
+            "size": args.size,
+            "abbrs": args.abbrs,
+            "queries": args.queries,
+            "batch_size": args.batch_size,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(output, f, indent=2, ensure_ascii=False)
+    else:
+        print(json.dumps(output, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
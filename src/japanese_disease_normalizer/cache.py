@@ -0,0 +1,184 @@
+"""In-memory caches with bounded size
+
+LRUCache evicts the least recently used entry and LFUCache evicts the least frequently used entry
+(the least recently used one among entries with the same frequency).
+Both count hits, misses and evictions.
+"""
+from collections import OrderedDict
+
+
+class BaseCache(object):
+    """Base class of the caches
+
+    Args:
+        maxsize int: maximum number of entries. If 0, nothing is stored.
+
+    Attributes:
+        hits int: number of get calls that found the key
+        misses int: number of get calls that did not find the key
+        evictions int: number of entries removed to keep maxsize
+    """
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        raise NotImplementedError
+
+    def put(self, key, value):
+        raise NotImplementedError
+
+    def keys(self):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __contains__(self, key):
+        return key in self.keys()
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def stats(self):
+        """Statistics of the cache
+
+        Returns:
+            Dict[str, int]: hits, misses, evictions, current size and maximum size of the cache
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self),
+            "maxsize": self.maxsize,
+        }
+
+
+class LRUCache(BaseCache):
+    """Cache with least recently used eviction
+
+    Args:
+        maxsize int: maximum number of entries. If 0, nothing is stored.
+    """
+    def __init__(self, maxsize):
+        super().__init__(maxsize)
+        self.data = OrderedDict()
+
+    def get(self, key, default=None):
+        try:
+            value = self.data[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self.data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        if key in self.data:
+            self.data.move_to_end(key)
+        self.data[key] = value
+        if len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+            self.evictions += 1
+
+    def keys(self):
+        return self.data.keys()
+
+    def clear(self):
+        self.data.clear()
+
+
+class LFUCache(BaseCache):
+    """Cache with least frequently used eviction
+
+    Entries are grouped into buckets by their access count, and each bucket keeps the order of the last access,
+    so get, put and eviction take constant time.
+
+    Args:
+        maxsize int: maximum number of entries. If 0, nothing is stored.
+    """
+    def __init__(self, maxsize):
+        super().__init__(maxsize)
+        self.data = {}
+        self.freq = {}
+        self.buckets = {}
+        self.min_freq = 0
+
+    def touch(self, key):
+        freq = self.freq[key]
+        bucket = self.buckets[freq]
+        del bucket[key]
+        if len(bucket) == 0:
+            del self.buckets[freq]
+            if self.min_freq == freq:
+                self.min_freq = freq + 1
+        self.freq[key] = freq + 1
+        self.buckets.setdefault(freq + 1, OrderedDict())[key] = None
+
+    def get(self, key, default=None):
+        if key not in self.data:
+            self.misses += 1
+            return default
+        self.touch(key)
+        self.hits += 1
+        return self.data[key]
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        if key in self.data:
+            self.data[key] = value
+            self.touch(key)
+            return
+
+        if len(self.data) >= self.maxsize:
+            bucket = self.buckets[self.min_freq]
+            evicted, _ = bucket.popitem(last=False)
+            if len(bucket) == 0:
+                del self.buckets[self.min_freq]
+            del self.data[evicted]
+            del self.freq[evicted]
+            self.evictions += 1
+
+        self.data[key] = value
+        self.freq[key] = 1
+        self.buckets.setdefault(1, OrderedDict())[key] = None
+        self.min_freq = 1
+
+    def keys(self):
+        return self.data.keys()
+
+    def clear(self):
+        self.data.clear()
+        self.freq.clear()
+        self.buckets.clear()
+        self.min_freq = 0
+
+
+def make_cache(maxsize, policy="lru"):
+    """Create cache
+
+    Args:
+        maxsize int: maximum number of entries
+        policy str: eviction policy (lru|lfu)
+
+    Returns:
+        BaseCache: cache
+    """
+    if policy == "lru":
+        return LRUCache(maxsize)
+    elif policy == "lfu":
+        return LFUCache(maxsize)
+    else:
+        raise NotImplementedError("Please specify cache policy by selecting (lru|lfu)")
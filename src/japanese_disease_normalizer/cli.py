@@ -0,0 +1,238 @@
+"""Command-line batch normalizer
+
+Read disease names line by line from a file or stdin, normalize them in chunks and write the results in the input order.
+Only a bounded number of chunks is read ahead, so memory does not grow with the input size.
+With --n-jobs > 1, chunks are normalized by worker processes. The normalizer is built once in the main process
+and handed to each worker once when the worker starts.
+
+Usage:
+    japanese-disease-normalizer names.txt -o normalized.tsv
+    cat records.csv | japanese-disease-normalizer --input-format csv --column diagnosis --output-format jsonl --n-jobs 4
+"""
+import sys
+import csv
+import json
+import time
+import argparse
+import itertools
+import multiprocessing
+from collections import deque
+
+from .normalizer import Normalizer
+
+OUTPUT_FIELDS = ["input", "name", "icd", "norm", "level", "score"]
+
+# normalizer shared by the worker processes
+_worker_normalizer = None
+
+
+def _init_worker(normalizer):
+    global _worker_normalizer
+    _worker_normalizer = normalizer
+
+
+def normalize_chunk(normalizer, names):
+    """Normalize chunk of names into plain rows
+
+    Args:
+        normalizer Normalizer: normalizer
+        names List[str]: disease names
+
+    Returns:
+        List[list]: values of OUTPUT_FIELDS for each name. Score is None if no entry is found.
+    """
+    rows = []
+    for name, (entry, score) in zip(names, normalizer.normalize_batch(names, return_score=True)):
+        if entry is None or entry.name is None:
+            rows.append([name, None, None, None, None, None])
+        else:
+            rows.append([name, entry.name, entry.icd, entry.norm, entry.level, float(score)])
+    return rows
+
+
+def _normalize_chunk(names):
+    return normalize_chunk(_worker_normalizer, names)
+
+
+def read_names(stream, input_format="txt", column=None):
+    """Read disease names lazily
+
+    Args:
+        stream TextIO: input stream
+        input_format str: txt (one name per line) | csv (name in the column of the header) | jsonl (name in the field)
+        column str: column of csv or field of jsonl
+
+    Yields:
+        str: disease name
+    """
+    if input_format == "txt":
+        for line in stream:
+            yield line.rstrip("\r\n")
+    elif input_format == "csv":
+        reader = csv.reader(stream)
+        header = next(reader, None)
+        if header is None:
+            return
+        if column not in header:
+            raise ValueError("column {} is not in the header of the csv".format(column))
+        idx = header.index(column)
+        for row in reader:
+            yield row[idx]
+    elif input_format == "jsonl":
+        for line in stream:
+            if line.strip() == "":
+                continue
+            yield json.loads(line)[column]
+    else:
+        raise NotImplementedError("Please specify input format by selecting (txt|csv|jsonl)")
+
+
+class RowWriter(object):
+    """Writer of the normalized rows
+
+    Args:
+        stream TextIO: output stream
+        output_format str: tsv|csv|jsonl
+    """
+    def __init__(self, stream, output_format="tsv"):
+        self.stream = stream
+        self.output_format = output_format
+        if output_format == "csv":
+            self.writer = csv.writer(stream)
+        elif output_format == "tsv":
+            self.writer = csv.writer(stream, delimiter="\t", lineterminator="\n")
+        elif output_format == "jsonl":
+            self.writer = None
+        else:
+            raise NotImplementedError("Please specify output format by selecting (tsv|csv|jsonl)")
+
+    def write_header(self):
+        if self.writer is not None:
+            self.writer.writerow(OUTPUT_FIELDS)
+
+    def write_rows(self, rows):
+        if self.writer is not None:
+            self.writer.writerows(["" if value is None else value for value in row] for row in rows)
+        else:
+            for row in rows:
+                self.stream.write(json.dumps(dict(zip(OUTPUT_FIELDS, row)), ensure_ascii=False) + "\n")
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if len(chunk) == 0:
+            return
+        yield chunk
+
+
+def run(normalizer, names, writer, n_jobs=1, chunk_size=1000, progress=None):
+    """Normalize names and write the results in the input order
+
+    At most 2 * n_jobs chunks are in flight, so memory does not depend on the number of names.
+
+    Args:
+        normalizer Normalizer: normalizer
+        names Iterable[str]: disease names
+        writer RowWriter: writer of the results
+        n_jobs int: number of worker processes (1 runs in this process)
+        chunk_size int: number of names normalized at once
+        progress Callable[[int], None]: called with the number of names written so far after each chunk
+
+    Returns:
+        int: number of names
+    """
+    count = 0
+    if n_jobs <= 1:
+        for chunk in chunked(names, chunk_size):
+            writer.write_rows(normalize_chunk(normalizer, chunk))
+            count += len(chunk)
+            if progress is not None:
+                progress(count)
+        return count
+
+    with multiprocessing.Pool(n_jobs, initializer=_init_worker, initargs=(normalizer,)) as pool:
+        pending = deque()
+        chunks = chunked(names, chunk_size)
+        while True:
+            while len(pending) < 2 * n_jobs:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                pending.append(pool.apply_async(_normalize_chunk, (chunk,)))
+            if len(pending) == 0:
+                break
+            rows = pending.popleft().get()
+            writer.write_rows(rows)
+            count += len(rows)
+            if progress is not None:
+                progress(count)
+    return count
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Normalize Japanese disease names into the manbyo dictionary")
+    parser.add_argument("input", nargs="?", default="-", help="input file (default: stdin)")
+    parser.add_argument("-o", "--output", default="-", help="output file (default: stdout)")
+    parser.add_argument("--input-format", default="txt", choices=["txt", "csv", "jsonl"])
+    parser.add_argument("--column", default="name", help="column of csv or field of jsonl that has disease names")
+    parser.add_argument("--output-format", default="tsv", choices=["tsv", "csv", "jsonl"])
+    parser.add_argument("--no-header", action="store_true", help="do not write the header of tsv and csv")
+    parser.add_argument("--preprocess-pipeline", default="abbr", choices=["basic", "abbr"])
+    parser.add_argument("--converter", default="fuzzy", choices=["exact", "fuzzy", "bigram", "dnorm", "cascade"])
+    parser.add_argument("--use-cache", action="store_true", help="reuse the preprocessed dictionary and the built converter")
+    parser.add_argument("--result-cache-size", type=int, default=0)
+    parser.add_argument("--n-jobs", type=int, default=1, help="number of worker processes")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="number of names normalized at once")
+    parser.add_argument("--quiet", action="store_true", help="do not report progress and throughput")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = (lambda message: None) if args.quiet else (lambda message: print(message, file=sys.stderr, flush=True))
+
+    build_start = time.perf_counter()
+    normalizer = Normalizer(
+        args.preprocess_pipeline,
+        args.converter,
+        use_cache=args.use_cache,
+        result_cache_size=args.result_cache_size,
+    )
+    report("Built normalizer in %.2f s" % (time.perf_counter() - build_start))
+
+    input_stream = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8", newline="")
+    output_stream = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8", newline="")
+    start = time.perf_counter()
+
+    def progress(count):
+        if count % (args.chunk_size * 100) < args.chunk_size:
+            report("Normalized %d names (%.0f names/s)" % (count, count / (time.perf_counter() - start)))
+
+    try:
+        writer = RowWriter(output_stream, args.output_format)
+        if not args.no_header:
+            writer.write_header()
+        count = run(
+            normalizer,
+            read_names(input_stream, args.input_format, args.column),
+            writer,
+            n_jobs=args.n_jobs,
+            chunk_size=args.chunk_size,
+            progress=progress,
+        )
+    finally:
+        output_stream.flush()
+        if args.input != "-":
+            input_stream.close()
+        if args.output != "-":
+            output_stream.close()
+
+    elapsed = time.perf_counter() - start
+    report("Normalized %d names in %.2f s (%.0f names/s)" % (count, elapsed, count / elapsed if elapsed > 0 else 0))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
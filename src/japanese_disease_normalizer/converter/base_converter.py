@@ -1,6 +1,47 @@
 from abc import ABCMeta, abstractmethod
 
 class BaseConverter(metaclass=ABCMeta):
+    """Base class of the converters
+
+    Attributes:
+        perfect_score float: maximum score that convert can return (None if the score is not bounded).
+            Normalizer stops scoring the other preprocessed names once a result reaches this score.
+        instrumentation Instrumentation: collector of the number of candidates scored (None disables it)
+    """
+    perfect_score = None
+    instrumentation = None
+
     @abstractmethod
     def convert(self):
         pass
+
+    def convert_batch(self, words):
+        """Convert list of words into the normalized form.
+
+        Override this method if the converter can score many words at once.
+
+        Args:
+            words List[str]: surface forms of the diseases
+
+        Returns:
+            List[Tuple[DictEntry, float]]: results of convert in the same order as words
+        """
+        return [self.convert(word) for word in words]
+
+    def convert_topk(self, word, k=10):
+        """Convert word into the k best candidates of the normalized form.
+
+        Override this method if the converter can rank candidates.
+        By default, only the result of convert is returned.
+
+        Args:
+            word str: surface form of the disease
+            k int: maximum number of candidates
+
+        Returns:
+            List[Tuple[DictEntry, float]]: candidates sorted in descending order of score
+        """
+        result, score = self.convert(word)
+        if result.name is None or k < 1:
+            return []
+        return [(result, score)]
@@ -0,0 +1,204 @@
+"""Converter using vectorized fuzzy match.
+
+Fuzzy match by the cosine similarity of character-level bigrams, the same measure as FuzzyMatchConverter.
+Instead of the pure-python simstring database, bigrams are mapped to integer ids
+and the postings of each bigram are stored in CSR-style numpy arrays, so overlap counting is vectorized.
+"""
+import math
+
+import numpy as np
+
+from .. import utils
+from ..dict_store import as_store
+from .base_converter import BaseConverter
+
+SENTINEL_CHAR = " "
+
+
+def extract_bigrams(word):
+    """Extract character-level bigrams in the same way as simstring
+
+    Args:
+        word str: target string
+
+    Returns:
+        List[str]: bigrams including duplicates
+    """
+    padded = SENTINEL_CHAR + word + SENTINEL_CHAR
+    return [padded[i:i+2] for i in range(len(padded) - 1)]
+
+
+class BigramMatchConverter(BaseConverter):
+    """Vectorized fuzzy matcher
+
+    Candidates and their ranking are the same as FuzzyMatchConverter (simstring with cosine measure):
+    a name is a candidate if its number of bigrams is within the bounds given by alpha
+    and the query bigrams (counted with duplicates) found in the name reach the minimum overlap,
+    and candidates are ranked by the cosine similarity of the bigram sets and then by the name.
+
+    Args:
+        dictionary Union[DictionaryStore, List[DictEntry]]: manbyo dictionary
+        alpha float: default minimum value of cosine similarity
+
+    Attributes:
+        store DictionaryStore: manbyo dictionary
+        entry_ids np.ndarray: entry id in the store of each name, sorted by the number of bigrams of the name.
+            Names are read from the store by these ids instead of being copied.
+        sizes np.ndarray: number of bigrams (with duplicates) of each name
+        n_features np.ndarray: number of distinct bigrams of each name
+        vocab Dict[str, int]: bigram to bigram id
+        indptr np.ndarray: postings of bigram i are indices[indptr[i]:indptr[i+1]]
+        indices np.ndarray: name ids of the postings sorted in ascending order
+    """
+    perfect_score = 1.0
+
+    def __init__(self, dictionary, alpha=0.5):
+        self.store = as_store(dictionary)
+        self.alpha = alpha
+
+        entry_ids = self.store.unique_ids()
+        sizes = np.array([len(self.store.get_field(idx, 0)) + 1 for idx in entry_ids.tolist()], dtype=np.int64)
+        # ids are assigned in the order of size so that the size bounds become a range of ids
+        order = np.argsort(sizes, kind="stable")
+        self.entry_ids = entry_ids[order]
+        self.sizes = sizes[order]
+
+        self.vocab = {}
+        feature_ids = []
+        name_ids = []
+        n_features = []
+        for name_id in range(len(self.entry_ids)):
+            name = self.name(name_id)
+            features = set(self.vocab.setdefault(f, len(self.vocab)) for f in extract_bigrams(name))
+            feature_ids.extend(features)
+            name_ids.extend([name_id] * len(features))
+            n_features.append(len(features))
+        self.n_features = np.array(n_features, dtype=np.int64)
+
+        feature_ids = np.array(feature_ids, dtype=np.int64)
+        name_ids = np.array(name_ids, dtype=np.int64)
+        postings = np.lexsort((name_ids, feature_ids))
+        self.indices = name_ids[postings]
+        self.indptr = np.zeros(len(self.vocab) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(feature_ids, minlength=len(self.vocab)), out=self.indptr[1:])
+
+    def name(self, name_id):
+        """Get name of the name id
+
+        Args:
+            name_id int: name id
+
+        Returns:
+            str: name
+        """
+        return self.store.get_field(self.entry_ids[name_id], 0)
+
+    def search(self, word, alpha=None):
+        """Search candidates of the word
+
+        Args:
+            word str: surface form of the disease
+            alpha float: minimum value of cosine similarity (default: self.alpha)
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: name ids of the candidates and their cosine similarity
+        """
+        alpha = self.alpha if alpha is None else alpha
+        features = extract_bigrams(word)
+        query_size = len(features)
+        min_size = int(math.ceil(alpha * alpha * query_size))
+        max_size = int(math.floor(query_size * 1.0 / (alpha * alpha)))
+        start = np.searchsorted(self.sizes, min_size, side="left")
+        end = np.searchsorted(self.sizes, max_size, side="right")
+
+        counts = {}
+        for f in features:
+            counts[f] = counts.get(f, 0) + 1
+
+        candidates = []
+        weights = []
+        for f, count in counts.items():
+            feature_id = self.vocab.get(f)
+            if feature_id is None:
+                continue
+            postings = self.indices[self.indptr[feature_id]:self.indptr[feature_id+1]]
+            postings = postings[np.searchsorted(postings, start):np.searchsorted(postings, end)]
+            candidates.append(postings)
+            weights.append(np.full(len(postings), count, dtype=np.int64))
+
+        if len(candidates) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+
+        candidates = np.concatenate(candidates) - start
+        weights = np.concatenate(weights)
+        # overlap counts query bigrams with duplicates, similarity uses distinct bigrams
+        overlap = np.bincount(candidates, weights=weights, minlength=end - start)
+        common = np.bincount(candidates, minlength=end - start)
+
+        sizes = self.sizes[start:end]
+        tau = np.ceil(alpha * np.sqrt(query_size * sizes))
+        # simstring never returns candidates whose minimum overlap is 1
+        ids = np.flatnonzero((overlap >= tau) & (tau > 1))
+        sims = common[ids] * 1.0 / np.sqrt(len(counts) * self.n_features[start:end][ids])
+        if self.instrumentation is not None:
+            self.instrumentation.count("candidates.BigramMatchConverter", len(ids))
+        return ids + start, sims
+
+    def convert(self, word, alpha=None):
+        """Convert word to normalized form.
+
+        Args:
+            word str: surface form of the disease that you want to normalize
+            alpha float: minimum value of cosine similarity (default: self.alpha)
+
+        Return:
+            DictEntry: DictEntry of normalized disease
+        """
+        ids, sims = self.search(word, alpha)
+        if len(ids) == 0:
+            return utils.DictEntry(None, None, None, None), -float('inf')
+
+        max_sim = sims.max()
+        name_id = min(ids[sims == max_sim], key=self.name)
+        return self.store[self.entry_ids[name_id]], float(max_sim)
+
+    def convert_topk(self, word, k=10, alpha=None):
+        """Convert word into the k best candidates of the normalized form.
+
+        Only candidates whose similarity reaches the k-th largest one are selected by partition and then sorted.
+
+        Args:
+            word str: surface form of the disease that you want to normalize
+            k int: maximum number of candidates
+            alpha float: minimum value of cosine similarity (default: self.alpha)
+
+        Return:
+            List[Tuple[DictEntry, float]]: candidates sorted in descending order of cosine similarity
+        """
+        if k < 1:
+            return []
+        ids, sims = self.search(word, alpha)
+        if len(ids) > k:
+            kth = np.partition(sims, len(sims) - k)[len(sims) - k]
+            # keep ties of the k-th similarity so that they are ordered by name
+            selected = sims >= kth
+            ids, sims = ids[selected], sims[selected]
+
+        results = sorted(zip(sims.tolist(), ids.tolist()), key=lambda x: (-x[0], self.name(x[1])))
+        return [(self.store[self.entry_ids[name_id]], sim) for sim, name_id in results[:k]]
+
+    def convert_batch(self, words, alpha=None):
+        """Convert list of words to normalized form.
+
+        Args:
+            words List[str]: surface forms of the diseases that you want to normalize
+            alpha float: minimum value of cosine similarity (default: self.alpha)
+
+        Return:
+            List[Tuple[DictEntry, float]]: results in the same order as words
+        """
+        results = {}
+        for word in words:
+            if word not in results:
+                results[word] = self.convert(word, alpha)
+        return [results[word] for word in words]
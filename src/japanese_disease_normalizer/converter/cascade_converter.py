@@ -0,0 +1,223 @@
+"""Cascade of converters
+
+CascadeConverter tries cheap converters first and falls back to the expensive ones.
+Each stage has an acceptance threshold, and the result of the first stage whose score reaches its threshold is used,
+so most inputs never reach the later stages (e.g. simstring search or the matrix product of DNorm).
+"""
+import time
+
+from .. import utils
+from ..dict_store import as_store
+from .base_converter import BaseConverter
+from .exact_matcher import ExactMatchConverter
+from .fuzzy_matcher import FuzzyMatchConverter
+from .bigram_matcher import BigramMatchConverter
+from .dnorm.dnorm_converter import DNormConverter
+
+CONVERTERS = {
+    "exact": ExactMatchConverter,
+    "fuzzy": FuzzyMatchConverter,
+    "bigram": BigramMatchConverter,
+    "dnorm": DNormConverter,
+}
+
+DEFAULT_STAGES = [("exact", 1), ("fuzzy", 0.8), ("dnorm", None)]
+
+
+class CascadeConverter(BaseConverter):
+    """Chain of converters with acceptance thresholds
+
+    A stage accepts its result if the result is found and the score is greater than or equal to the threshold.
+    A stage with threshold None accepts any found result.
+    If no stage accepts, the result is not found (name is None) with score -inf.
+    Scores are those of the stage that answered, so they are comparable only within the same stage.
+
+    Args:
+        dictionary Union[DictionaryStore, List[DictEntry]]: manbyo dictionary
+        stages List[Tuple[Union[BaseConverter, str], float]]: converters and their thresholds in the order of trial.
+            You can use str (exact|fuzzy|bigram|dnorm) for the pre-defined converters,
+            which are built over the same store.
+
+    Attributes:
+        store DictionaryStore: manbyo dictionary shared by the pre-defined converters
+        names List[str]: name of each stage (str of stages, or the class name of the converter)
+        converters List[BaseConverter]: converter of each stage
+        thresholds List[float]: threshold of each stage
+        stage_counts List[int]: number of results answered by each stage
+        unanswered int: number of inputs that no stage accepted
+        perfect_score float: perfect score shared by all stages (None if they differ)
+        instrumentation Instrumentation: collector of the time and the answers of each stage, shared with the stages
+            (None disables it)
+    """
+    _instrumentation = None
+
+    def __init__(self, dictionary, stages=None):
+        self.store = as_store(dictionary)
+        if stages is None:
+            stages = DEFAULT_STAGES
+        if len(stages) == 0:
+            raise NotImplementedError("Please specify at least one stage of the cascade")
+
+        self.names = []
+        self.converters = []
+        self.thresholds = []
+        for converter, threshold in stages:
+            if isinstance(converter, str):
+                if converter not in CONVERTERS:
+                    raise NotImplementedError("Please specify converter of the cascade by selecting (exact|fuzzy|bigram|dnorm)")
+                self.names.append(converter)
+                self.converters.append(CONVERTERS[converter](self.store))
+            elif isinstance(converter, BaseConverter):
+                self.names.append(type(converter).__name__)
+                self.converters.append(converter)
+            else:
+                raise NotImplementedError("Please specify converter of the cascade by str or instance of BaseConverter")
+            self.thresholds.append(threshold)
+        self.reset_stats()
+
+    @property
+    def perfect_score(self):
+        # scores of different stages have the same meaning only at the common maximum
+        scores = set(converter.perfect_score for converter in self.converters)
+        return scores.pop() if len(scores) == 1 else None
+
+    @property
+    def instrumentation(self):
+        return self._instrumentation
+
+    @instrumentation.setter
+    def instrumentation(self, instrumentation):
+        self._instrumentation = instrumentation
+        for converter in self.converters:
+            converter.instrumentation = instrumentation
+
+    def reset_stats(self):
+        self.stage_counts = [0] * len(self.converters)
+        self.unanswered = 0
+
+    def stats(self):
+        """Number of results answered by each stage
+
+        Returns:
+            Dict[str, int]: name of the stage to the count, and "unanswered" to the number of inputs no stage accepted
+        """
+        stats = {}
+        for name, count in zip(self.names, self.stage_counts):
+            stats[name] = stats.get(name, 0) + count
+        stats["unanswered"] = self.unanswered
+        return stats
+
+    def accept(self, stage, result, score):
+        threshold = self.thresholds[stage]
+        return result.name is not None and (threshold is None or score >= threshold)
+
+    def convert_with_stage(self, word):
+        """Convert word and report the stage that answered
+
+        Args:
+            word str: surface form of the disease
+
+        Returns:
+            Tuple[DictEntry, float, int]: normalized form, score and index of the stage (-1 if no stage accepted)
+        """
+        instrumentation = self.instrumentation
+        for stage, converter in enumerate(self.converters):
+            if instrumentation is None:
+                result, score = converter.convert(word)
+            else:
+                start = time.perf_counter()
+                result, score = converter.convert(word)
+                instrumentation.record("cascade." + self.names[stage], time.perf_counter() - start)
+            if self.accept(stage, result, score):
+                self.stage_counts[stage] += 1
+                if instrumentation is not None:
+                    instrumentation.count("cascade.answered." + self.names[stage])
+                return result, score, stage
+        self.unanswered += 1
+        if instrumentation is not None:
+            instrumentation.count("cascade.unanswered")
+        return utils.DictEntry(None, None, None, None), -float('inf'), -1
+
+    def convert(self, word):
+        """Convert word into the normalized form by the first confident stage
+
+        Args:
+            word str: surface form of the disease
+
+        Returns:
+            Tuple[DictEntry, float]: normalized form and score of the stage that answered
+        """
+        result, score, _ = self.convert_with_stage(word)
+        return result, score
+
+    def convert_batch_with_stage(self, words):
+        """Convert list of words and report the stages that answered
+
+        Each stage converts only the words that the previous stages did not accept, in one convert_batch call.
+
+        Args:
+            words List[str]: surface forms of the diseases
+
+        Returns:
+            List[Tuple[DictEntry, float, int]]: results of convert_with_stage in the same order as words
+        """
+        results = [(utils.DictEntry(None, None, None, None), -float('inf'), -1)] * len(words)
+        remaining = list(range(len(words)))
+        instrumentation = self.instrumentation
+        for stage, converter in enumerate(self.converters):
+            if len(remaining) == 0:
+                break
+            if instrumentation is None:
+                stage_results = converter.convert_batch([words[i] for i in remaining])
+            else:
+                start = time.perf_counter()
+                stage_results = converter.convert_batch([words[i] for i in remaining])
+                instrumentation.record("cascade." + self.names[stage], time.perf_counter() - start)
+            rejected = []
+            for i, (result, score) in zip(remaining, stage_results):
+                if self.accept(stage, result, score):
+                    self.stage_counts[stage] += 1
+                    results[i] = (result, score, stage)
+                else:
+                    rejected.append(i)
+            if instrumentation is not None:
+                instrumentation.count("cascade.answered." + self.names[stage], len(remaining) - len(rejected))
+            remaining = rejected
+        self.unanswered += len(remaining)
+        if instrumentation is not None and len(remaining) > 0:
+            instrumentation.count("cascade.unanswered", len(remaining))
+        return results
+
+    def convert_batch(self, words):
+        return [(result, score) for result, score, _ in self.convert_batch_with_stage(words)]
+
+    def convert_topk_with_stage(self, word, k=10):
+        """Convert word into the k best candidates and report the stage that answered
+
+        Args:
+            word str: surface form of the disease
+            k int: maximum number of candidates
+
+        Returns:
+            List[Tuple[DictEntry, float, int]]: candidates of the first stage whose best candidate is accepted
+                and index of the stage, sorted in descending order of score
+        """
+        if k < 1:
+            return []
+        for stage, converter in enumerate(self.converters):
+            candidates = converter.convert_topk(word, k)
+            if len(candidates) > 0 and self.accept(stage, *candidates[0]):
+                return [(result, score, stage) for result, score in candidates]
+        return []
+
+    def convert_topk(self, word, k=10):
+        """Convert word into the k best candidates of the first stage whose best candidate is accepted
+
+        Args:
+            word str: surface form of the disease
+            k int: maximum number of candidates
+
+        Returns:
+            List[Tuple[DictEntry, float]]: candidates sorted in descending order of score
+        """
+        return [(result, score) for result, score, _ in self.convert_topk_with_stage(word, k)]
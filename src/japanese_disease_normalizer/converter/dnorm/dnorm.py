@@ -1,41 +1,499 @@
+import os
+import copy
+import json
 import pickle
-import random
+import shutil
+import tempfile
+import time
+from pathlib import Path
+import numpy as np
 from sklearn.feature_extraction.text import TfidfVectorizer
 from scipy.sparse import csr_matrix, vstack
-from tqdm import tqdm
 import MeCab
 
+from ...cache import LRUCache
+from ...index_cache import file_hash
+from ...dict_store import as_store
+from .trainer import DNormTrainer, ParallelDNormTrainer
+
 
 class MeCabTokenizer(object):
-    def __init__(self):
+    """MeCab tokenizer with LRU cache
+
+    Tf-idf vectorizer calls tokenize for every string, so the same dictionary names and queries
+    are parsed many times. Results are kept in a bounded LRU cache.
+
+    Args:
+        cache_size int: maximum number of cached strings (0 disables the cache)
+
+    Attributes:
+        cache LRUCache: parsed strings
+        hits int: number of tokenize calls answered from the cache
+        misses int: number of strings parsed by MeCab
+    """
+    def __init__(self, cache_size=100000):
         self.mecab = MeCab.Tagger('-Owakati')
+        self.cache = LRUCache(cache_size)
 
-    def tokenize(self, word):
+    @property
+    def hits(self):
+        return self.cache.hits
+
+    @property
+    def misses(self):
+        return self.cache.misses
+
+    def parse(self, word):
         words = self.mecab.parse(word).rstrip().split(' ')
         return words
 
+    def tokenize(self, word):
+        words = self.cache.get(word)
+        if words is None:
+            words = self.parse(word)
+            self.cache.put(word, words)
+        return words
+
+    def tokenize_batch(self, words):
+        """Tokenize list of strings
+
+        Each distinct string that is not in the cache is parsed only once.
+        Joining strings into one MeCab call is not used because the context of the neighboring strings
+        can change the segmentation at their boundaries.
+
+        Args:
+            words List[str]: strings to tokenize
+
+        Returns:
+            List[List[str]]: tokens of each string
+        """
+        results = {}
+        for word in words:
+            if word not in results:
+                results[word] = self.tokenize(word)
+        return [results[word] for word in words]
+
+    def cache_info(self):
+        """Statistics of the cache
+
+        Returns:
+            Dict[str, int]: hits, misses, evictions, current size and maximum size of the cache
+        """
+        return self.cache.stats()
+
+    def clear_cache(self):
+        self.cache.clear()
+        self.cache.reset_stats()
+
+
+def sparse_topk(data, indices, n, k):
+    """Select top-k entries of a sparse score vector
+
+    Entries are ordered by score and then by index in descending order,
+    which is the order of the reversed stable argsort of the dense vector.
+    Only the nonzero entries are partitioned; entries with zero score are taken from the largest index
+    when there are less than k positive entries.
+
+    Args:
+        data np.ndarray: nonzero scores
+        indices np.ndarray: indices of the nonzero scores
+        n int: length of the dense vector
+        k int: number of entries to select (k <= n)
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: indices and scores of the top-k entries
+    """
+    positive = data > 0
+    pos_data, pos_indices = data[positive], indices[positive]
+    if len(pos_data) > k:
+        kth = np.partition(pos_data, len(pos_data) - k)[len(pos_data) - k]
+        selected = pos_data >= kth
+        pos_data, pos_indices = pos_data[selected], pos_indices[selected]
+    order = np.lexsort((-pos_indices, -pos_data))[:k]
+    top_indices, top_data = pos_indices[order], pos_data[order]
+    if len(top_indices) == k:
+        return top_indices, top_data
+
+    # fill with zero entries, and negative entries if zeros are not enough
+    rest = k - len(top_indices)
+    nonzero = indices[data != 0]
+    window = np.arange(n - 1, max(n - 1 - rest - len(nonzero), -1), -1)
+    zero_indices = window[~np.isin(window, nonzero)][:rest]
+    top_indices = np.concatenate([top_indices, zero_indices])
+    top_data = np.concatenate([top_data, np.zeros(len(zero_indices))])
+
+    rest = k - len(top_indices)
+    if rest > 0:
+        negative = data < 0
+        neg_data, neg_indices = data[negative], indices[negative]
+        order = np.lexsort((-neg_indices, -neg_data))[:rest]
+        top_indices = np.concatenate([top_indices, neg_indices[order]])
+        top_data = np.concatenate([top_data, neg_data[order]])
+    return top_indices, top_data
+
+
+def analyze_tokens(tokens):
+    """Analyzer of tf-idf for strings already tokenized by MeCabTokenizer"""
+    return tokens
+
+
+MMAP_FORMAT_VERSION = 1
+TFIDF_PARAMS = ["norm", "use_idf", "smooth_idf", "sublinear_tf"]
+
+
+def save_mmap_model(path, tfidf, W, source_hash=None):
+    """Save tf-idf and W in the memory-mappable format
+
+    The model is a directory with
+    - meta.json: format version, shape of W, parameters of tf-idf and hash of the pickled model it was converted from
+    - vocab.txt: features of tf-idf, one per line in the order of their ids
+    - idf.npy: idf vector
+    - W_data.npy, W_indices.npy, W_indptr.npy: CSR arrays of W
+
+    Arrays are raw .npy files, so load_mmap_model can map them read-only and
+    processes on the same host share their pages.
+    The directory is written to a temporary directory first and renamed.
+
+    Args:
+        path str: directory of the model
+        tfidf TfidfVectorizer: fitted tf-idf vectorizer
+        W csr_matrix: weight matrix
+        source_hash str: sha1 of the pickled model (None if not converted from a file)
+    """
+    path = Path(path)
+    vocab = [None] * len(tfidf.vocabulary_)
+    for feature, idx in tfidf.vocabulary_.items():
+        if "\n" in feature:
+            raise ValueError("feature of tf-idf contains newline: {}".format(repr(feature)))
+        vocab[idx] = feature
+
+    # W is mapped read-only, so it must be in canonical format (sorted indices without duplicates)
+    W = csr_matrix(W, copy=True)
+    W.sum_duplicates()
+    meta = {
+        "format_version": MMAP_FORMAT_VERSION,
+        "shape": list(W.shape),
+        "dtype": np.dtype(tfidf.dtype).name,
+        "tfidf": {name: getattr(tfidf, name) for name in TFIDF_PARAMS},
+        "source_hash": source_hash,
+    }
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = Path(tempfile.mkdtemp(dir=str(path.parent), suffix=".tmp"))
+    try:
+        with open(tmp_path / "meta.json", "w") as f:
+            json.dump(meta, f)
+        with open(tmp_path / "vocab.txt", "w", encoding="utf-8") as f:
+            f.write("\n".join(vocab))
+        np.save(tmp_path / "idf.npy", np.asarray(tfidf.idf_))
+        np.save(tmp_path / "W_data.npy", W.data)
+        np.save(tmp_path / "W_indices.npy", W.indices)
+        np.save(tmp_path / "W_indptr.npy", W.indptr)
+
+        if path.exists():
+            shutil.rmtree(str(path))
+        try:
+            os.rename(str(tmp_path), str(path))
+        except OSError:
+            # another process has written the model at the same time
+            if not path.exists():
+                raise
+    finally:
+        if tmp_path.exists():
+            shutil.rmtree(str(tmp_path))
+
+
+def load_mmap_meta(path):
+    """Load meta.json of the model saved by save_mmap_model
+
+    Args:
+        path str: directory of the model
+
+    Returns:
+        dict: format version, shape of W, parameters of tf-idf and source hash
+    """
+    with open(Path(path) / "meta.json") as f:
+        return json.load(f)
+
+
+def mmap_signature(path):
+    """Signature to detect that the model saved by save_mmap_model was replaced
+
+    Args:
+        path str: directory of the model
+
+    Returns:
+        List[Tuple[str, int, int]]: name, size and modification time in ns of each file of the model
+    """
+    path = Path(path)
+    signature = []
+    for name in sorted(os.listdir(str(path))):
+        stat = (path / name).stat()
+        signature.append((name, stat.st_size, stat.st_mtime_ns))
+    return signature
+
+
+def is_mapped(array):
+    """Whether the array is (a view of) a memory-mapped file
+
+    Args:
+        array np.ndarray: array
+
+    Returns:
+        bool: True if the data of the array is in a memory-mapped file
+    """
+    while isinstance(array, np.ndarray):
+        if isinstance(array, np.memmap):
+            return True
+        array = array.base
+    return False
+
+
+def load_mmap_model(path, analyzer, mmap_mode="r"):
+    """Load tf-idf and W saved by save_mmap_model
+
+    Args:
+        path str: directory of the model
+        analyzer callable: analyzer of tf-idf
+        mmap_mode str: mmap_mode of np.load. If None, arrays are read into memory.
+
+    Returns:
+        Tuple[TfidfVectorizer, csr_matrix]: tf-idf vectorizer and W
+    """
+    path = Path(path)
+    meta = load_mmap_meta(path)
+    if meta["format_version"] != MMAP_FORMAT_VERSION:
+        raise NotImplementedError("unsupported model format version: {}".format(meta["format_version"]))
+
+    with open(path / "vocab.txt", encoding="utf-8") as f:
+        vocab = f.read().split("\n")
+
+    tfidf = TfidfVectorizer(analyzer=analyzer, dtype=np.dtype(meta["dtype"]).type, **meta["tfidf"])
+    tfidf.vocabulary_ = {feature: idx for idx, feature in enumerate(vocab)}
+    tfidf.idf_ = np.load(path / "idf.npy", mmap_mode=mmap_mode)
+
+    W = csr_matrix((
+        np.load(path / "W_data.npy", mmap_mode=mmap_mode),
+        np.load(path / "W_indices.npy", mmap_mode=mmap_mode),
+        np.load(path / "W_indptr.npy", mmap_mode=mmap_mode),
+    ), shape=tuple(meta["shape"]), copy=False)
+    return tfidf, W
+
+
+def convert_model(pickle_path, mmap_path):
+    """Convert pickled model (dnorm.pkl) into the memory-mappable format
+
+    The hash of the pickled model is saved in meta.json, so a stale conversion can be detected by needs_conversion.
+
+    Args:
+        pickle_path str: path of the pickled model saved by DNorm.save_model
+        mmap_path str: directory of the converted model
+    """
+    with open(pickle_path, 'rb') as f:
+        model = pickle.load(f)
+    save_mmap_model(mmap_path, model["tfidf"], model["W"], source_hash=file_hash(pickle_path))
+
+
+def needs_conversion(pickle_path, mmap_path):
+    """Whether the memory-mappable model is missing or was converted from another pickled model
+
+    Args:
+        pickle_path str: path of the pickled model
+        mmap_path str: directory of the converted model
+
+    Returns:
+        bool: True if convert_model should be run
+    """
+    if not (Path(mmap_path) / "meta.json").exists():
+        return True
+    return load_mmap_meta(mmap_path).get("source_hash") != file_hash(pickle_path)
+
+
 class DNorm(object):
-    def __init__(self, dictionary, model_path):
+    """DNorm model
+
+    Args:
+        dictionary Union[DictionaryStore, List[DictEntry]]: manbyo dictionary
+        model_path str: path of the pickled model or directory of the memory-mappable model.
+            If None, tf-idf is fitted on the dictionary and W is the identity.
+        frozen bool: whether to precompute W·norms_vecᵀ for serving (see freeze)
+
+    Attributes:
+        store DictionaryStore: manbyo dictionary. Row i of norms_vec is the entry with id i.
+        norms List[str]: names of the entries (decoded from the store on each access)
+        norm2idx NameIndex: read-only mapping from name to the entry id (see DictionaryStore.name2id)
+        mmap_path Path: directory of the memory-mapped model tfidf and W were loaded from (None if not loaded from it).
+            While they are not refitted nor trained, pickles of the model refer to this directory
+            and the unpickled model maps it again instead of holding private copies of the arrays.
+        instrumentation Instrumentation: collector of the time of predict_ids and the number of nonzero scores (None disables it)
+    """
+    instrumentation = None
+
+    def __init__(self, dictionary, model_path, frozen=False):
         self.tokenizer = MeCabTokenizer()
-        self.norms = [d.name for d in dictionary]
-        self.norm2idx = {d.name: idx for idx, d in enumerate(dictionary)}
-        self.dict = {d.name: d for d in dictionary}
+        self.projected = None
+        self.mmap_path = None
+        self.store = as_store(dictionary)
+        norms = self.store.names()
 
         if model_path is None:
             self.tfidf = TfidfVectorizer(analyzer=self.tokenizer.tokenize, use_idf=True, stop_words=None)
-            self.train_tfidf(self.norms)
-            d_num = len(self.tfidf.get_feature_names())
+            self.train_tfidf(norms)
+            d_num = len(self.tfidf.vocabulary_)
             self.W = csr_matrix(([1]*d_num, ([i for i in range(d_num)], [i for i in range(d_num)])), shape=(d_num, d_num))
         else:
             self.load_model(model_path)
 
-        self.norms_vec = self.tfidf.transform(self.norms)
+        self.norms_vec = self.vectorize(norms)
+        self.build_index()
+        if frozen:
+            self.freeze()
+
+    @property
+    def norms(self):
+        return self.store.names()
+
+    @property
+    def norm2idx(self):
+        return self.store.name2id
+
+    def vectorize(self, texts):
+        """Transform strings into tf-idf vectors
+
+        All strings are tokenized in one batch and the token lists are passed to tf-idf,
+        so each distinct string is parsed at most once even if there are more strings than the tokenizer cache.
+
+        Args:
+            texts List[str]: strings
+
+        Returns:
+            csr_matrix: tf-idf vectors
+        """
+        if len(texts) == 0:
+            # tf-idf does not accept an empty input
+            return csr_matrix((0, len(self.tfidf.vocabulary_)), dtype=self.tfidf.dtype)
+        return self.token_vectorizer().transform(self.tokenizer.tokenize_batch(texts))
+
+    def token_vectorizer(self):
+        """Shallow copy of tfidf that takes token lists instead of strings
+
+        The fitted vocabulary and idf are shared with tfidf, whose analyzer is left as is.
+
+        Returns:
+            TfidfVectorizer: tf-idf vectorizer with the pass-through analyzer
+        """
+        tfidf = copy.copy(self.tfidf)
+        tfidf.set_params(analyzer=analyze_tokens)
+        return tfidf
+
+    def build_index(self):
+        """Build inverted index from features to dictionary entries
+
+        index is norms_vecᵀ in CSR, so index.indices[index.indptr[f]:index.indptr[f+1]]
+        is the posting list of the dictionary entries that contain feature f.
+        """
+        self.index = self.norms_vec.T.tocsr()
+        self.index.sort_indices()
+
+    def score_candidates(self, x_vec):
+        """Score queries only against the candidates from the inverted index
+
+        Entries that share no feature with x·W have exactly zero score, so the result equals
+        calc_score(x_vec, norms_vec) while the cost depends on the size of the posting lists.
+
+        Args:
+            x_vec csr_matrix: tf-idf vectors of queries
+
+        Returns:
+            csr_matrix: scores (query x dictionary)
+        """
+        q_vecs = x_vec.dot(self.W).tocsr()
+        indptr = [0]
+        indices, data = [], []
+        for idx in range(q_vecs.shape[0]):
+            features = q_vecs.indices[q_vecs.indptr[idx]:q_vecs.indptr[idx+1]]
+            weights = q_vecs.data[q_vecs.indptr[idx]:q_vecs.indptr[idx+1]]
+            postings = [self.index.indices[self.index.indptr[f]:self.index.indptr[f+1]] for f in features]
+            if sum(len(p) for p in postings) == 0:
+                indptr.append(indptr[-1])
+                continue
+
+            values = [self.index.data[self.index.indptr[f]:self.index.indptr[f+1]] * w for f, w in zip(features, weights)]
+            cands, inverse = np.unique(np.concatenate(postings), return_inverse=True)
+            indices.append(cands)
+            data.append(np.bincount(inverse, weights=np.concatenate(values)))
+            indptr.append(indptr[-1] + len(cands))
+
+        if len(data) == 0:
+            return csr_matrix((q_vecs.shape[0], len(self.store)))
+        return csr_matrix((np.concatenate(data), np.concatenate(indices), np.array(indptr)), shape=(q_vecs.shape[0], len(self.store)))
+
+    def freeze(self):
+        """Precompute the projected dictionary matrix for serving
+
+        W and norms_vec do not change after loading the model, so W·norms_vecᵀ is computed once
+        and stored in CSR (feature x dictionary), where each row is the dictionary entries reached from a query feature.
+        Scoring a query then becomes one sparse product of the query vector and this matrix.
+        The projection is dropped when W is updated by training.
+        """
+        self.projected = self.W.dot(self.norms_vec.T).tocsr()
+        self.projected.sort_indices()
+
+    def unfreeze(self):
+        """Drop the projected dictionary matrix"""
+        self.projected = None
+
+    def score_dictionary(self, x_vec):
+        """Score queries against all dictionary entries
+
+        Args:
+            x_vec csr_matrix: tf-idf vectors of queries
+
+        Returns:
+            csr_matrix: scores (query x dictionary)
+        """
+        if self.projected is not None:
+            return x_vec.dot(self.projected)
+        return self.score_candidates(x_vec)
+
+    @property
+    def mapped(self):
+        """Whether tfidf and W are still the arrays memory-mapped from mmap_path (not refitted nor trained)"""
+        if self.mmap_path is None:
+            return False
+        return all(is_mapped(array) for array in [self.tfidf.idf_, self.W.data, self.W.indices, self.W.indptr])
+
+    def __getstate__(self):
+        # MeCab tagger cannot be pickled, so drop it and the analyzer bound to it
+        state = self.__dict__.copy()
+        del state["tokenizer"]
+        if self.mapped:
+            # re-open the memory-mapped model instead of copying its arrays into the pickle
+            state["tfidf"] = None
+            state["W"] = None
+            state["mmap_signature"] = mmap_signature(self.mmap_path)
+            return state
+        state["mmap_path"] = None
+        state["tfidf"] = copy.copy(self.tfidf)
+        state["tfidf"].set_params(analyzer="word")
+        return state
+
+    def __setstate__(self, state):
+        signature = state.pop("mmap_signature", None)
+        self.__dict__.update(state)
+        self.tokenizer = MeCabTokenizer()
+        if self.tfidf is None:
+            if mmap_signature(self.mmap_path) != signature:
+                raise ValueError("memory-mapped model {} was changed after pickling".format(self.mmap_path))
+            self.tfidf, self.W = load_mmap_model(self.mmap_path, self.tokenizer.tokenize)
+        else:
+            self.tfidf.set_params(analyzer=self.tokenizer.tokenize)
 
     def get_negative_vec(self, x_vec, y):
         idx = self.norm2idx[y]
         if idx == 0:
             neg_vecs = self.norms_vec[1:]
-        elif idx == len(self.norms) - 1:
+        elif idx == len(self.store) - 1:
             neg_vecs = self.norms_vec[:-1]
         else:
             neg_vecs = vstack([self.norms_vec[:idx], self.norms_vec[idx+1:]])
@@ -44,48 +502,112 @@ class DNorm(object):
         rank = sims.argmax()
         return neg_vecs[rank]
 
+    def calc_ranks(self, x_vec, y_idx, max_rank=101, chunk_size=256):
+        """Calculate rank of the gold entries in vectorized form
+
+        Rank is the position of the gold entry in the output of predict (0 is the best),
+        truncated to max_rank. Unknown gold entries (id -1) have max_rank.
+
+        Args:
+            x_vec csr_matrix: tf-idf vectors of queries
+            y_idx np.ndarray: dictionary ids of the gold entries
+            max_rank int: maximum rank
+            chunk_size int: number of queries scored at once
+
+        Returns:
+            np.ndarray: rank of each query
+        """
+        ranks = []
+        for start in range(0, x_vec.shape[0], chunk_size):
+            sims = self.score_dictionary(x_vec[start:start+chunk_size]).toarray()
+            gold = y_idx[start:start+chunk_size]
+            gold_sims = sims[np.arange(len(gold)), gold][:, None]
+            # predict ranks ties by index in descending order
+            later = np.arange(sims.shape[1])[None, :] > gold[:, None]
+            rank = (sims > gold_sims).sum(axis=1) + ((sims == gold_sims) & later).sum(axis=1)
+            rank[gold < 0] = max_rank
+            ranks.append(np.minimum(rank, max_rank))
+        return np.concatenate(ranks) if len(ranks) > 0 else np.zeros(0, dtype=np.int64)
+
     def calc_avg_rank(self, x, y):
-        pred = self.predict(x, k=-1)
-        rank = 0
-        cnt = 0
-        zero = 0
-        for pp, t in zip(pred, y):
-            for idx, p in enumerate(pp):
-                if p == t or idx > 100:
-                    break
-
-            rank += idx
-            cnt += 1
-        return rank / cnt
+        x_vec = self.vectorize(x)
+        y_idx = np.array([self.store.lookup(t) for t in y])
+        return self.calc_ranks(x_vec, y_idx).mean()
 
     def calc_score(self, v1, v2):
         return (v1.dot(self.W)).dot(v2.T)
 
     def predict(self, x, k=1):
-        x = self.tfidf.transform(x)
-        sims = self.calc_score(x, self.norms_vec).toarray()
-        rank = sims.argsort(axis=1)[:, ::-1][:, :k]
-        return [[self.norms[r] for r in rr] for rr in rank], [sims[idx, rr] for idx, rr in enumerate(rank)]
-
-    def train(self, X, Y, val_x, val_y, eta):
-        val_score = [float("inf"), 1e10]
-        x_vec = self.tfidf.transform(X)
-        y_vec = self.tfidf.transform(Y)
-        val_x_vec = self.tfidf.transform(val_x)
-        val_y_vec = self.tfidf.transform(val_y)
-
-        while val_score[-1] < val_score[-2]:
-            idxs = [i for i in range(len(X))]
-            random.shuffle(idxs)
-            for idx in tqdm(idxs):
-                input_x = x_vec[idx]
-                input_y = y_vec[idx]
-                y = Y[idx]
-                neg_vec = self.get_negative_vec(input_x, y)
-                self.update(input_x, input_y, neg_vec, eta)
-            score = self.calc_avg_rank(val_x, val_y)
-            val_score.append(score)
-            print('average rank of validation set : ', score)
+        ranks, scores = self.predict_ids(x, k)
+        return [[self.store.get_field(r, 0) for r in rank] for rank in ranks], scores
+
+    def predict_ids(self, x, k=1):
+        """Rank dictionary entries for each input
+
+        Args:
+            x List[str]: surface forms
+            k int: number of entries for each input. If less than 1, all entries are ranked.
+
+        Returns:
+            Tuple[List[np.ndarray], List[np.ndarray]]: ids of the top-k entries in the store and their scores
+        """
+        instrumentation = self.instrumentation
+        if instrumentation is None:
+            x = self.vectorize(x)
+            sims = self.score_dictionary(x)
+        else:
+            start = time.perf_counter()
+            x = self.vectorize(x)
+            vectorized = time.perf_counter()
+            sims = self.score_dictionary(x)
+            instrumentation.record("dnorm.vectorize", vectorized - start)
+            instrumentation.record("dnorm.score", time.perf_counter() - vectorized)
+            instrumentation.count("candidates.DNorm", sims.nnz)
+        if k < 1 or k >= len(self.store):
+            # ranking of all entries
+            sims = sims.toarray()
+            rank = sims.argsort(axis=1, kind="stable")[:, ::-1]
+            if k > 0:
+                rank = rank[:, :k]
+            return list(rank), [sims[idx, rr] for idx, rr in enumerate(rank)]
+
+        # keep scores sparse and select top-k only from the nonzero entries
+        sims = sims.tocsr()
+        results, scores = [], []
+        for idx in range(sims.shape[0]):
+            start, end = sims.indptr[idx], sims.indptr[idx+1]
+            rank, score = sparse_topk(sims.data[start:end], sims.indices[start:end], len(self.store), k)
+            results.append(rank)
+            scores.append(score)
+        return results, scores
+
+    def train(self, X, Y, val_x, val_y, eta, batch_size=1, n_workers=1, seed=None, sync_every=1000):
+        """Train W by pairwise ranking until the average rank of validation set stops improving
+
+        See DNormTrainer and ParallelDNormTrainer for the details.
+
+        Args:
+            X List[str]: surface forms for training
+            Y List[str]: dictionary names of X
+            val_x List[str]: surface forms for validation
+            val_y List[str]: dictionary names of val_x
+            eta float: learning rate
+            batch_size int: number of samples whose negatives are mined with the same W (1 is the original sequential update)
+            n_workers int: number of worker processes. If more than 1, W is trained in parallel and averaged every sync_every samples.
+            seed int: seed of the shuffle of each epoch. If None, the global random module is used (parallel training uses 0).
+            sync_every int: number of samples each worker trains between the averaging of W
+
+        Returns:
+            List[float]: average rank of the validation set after each epoch
+        """
+        if n_workers > 1:
+            trainer = ParallelDNormTrainer(
+                self, eta, n_workers=n_workers, sync_every=sync_every, batch_size=batch_size,
+                seed=0 if seed is None else seed
+            )
+        else:
+            trainer = DNormTrainer(self, eta, batch_size=batch_size, seed=seed)
+        return trainer.train(X, Y, val_x, val_y)
 
     def update(self, m, x_p, x_n, eta):
         neg_score = self.calc_score(m, x_n)
@@ -95,6 +617,7 @@ class DNorm(object):
         score = pos_score - neg_score
         if score < 1:
             self.W = self.W + eta * (m.T.dot(x_p) - m.T.dot(x_n))
+            self.unfreeze()
 
 
     def save_model(self, path):
@@ -106,7 +629,22 @@ class DNorm(object):
         with open(path, 'wb') as f:
             pickle.dump(d, f)
 
+    def save_mmap_model(self, path):
+        save_mmap_model(path, self.tfidf, self.W)
+
     def load_model(self, path):
+        """Load tf-idf and W
+
+        Args:
+            path str: path of the pickled model, or directory of the memory-mappable model
+        """
+        if Path(path).is_dir():
+            self.tfidf, self.W = load_mmap_model(path, self.tokenizer.tokenize)
+            self.mmap_path = Path(path).resolve()
+            self.unfreeze()
+            return
+
+        self.mmap_path = None
         with open(path, 'rb') as f:
             model = pickle.load(f)
 
@@ -114,6 +652,12 @@ class DNorm(object):
         self.tfidf.set_params(analyzer=self.tokenizer.tokenize)
 
         self.W = model["W"]
+        self.unfreeze()
 
     def train_tfidf(self, dataset):
-        self.tfidf.fit(dataset)
+        # fit on the token lists so that each string is parsed once
+        self.tfidf.set_params(analyzer=analyze_tokens)
+        try:
+            self.tfidf.fit(self.tokenizer.tokenize_batch(dataset))
+        finally:
+            self.tfidf.set_params(analyzer=self.tokenizer.tokenize)
@@ -3,10 +3,13 @@
 DNorm is the disease normalization model based on the ranking model with tf-idf vector.
 """
 import os
+import hashlib
 from pathlib import Path
 
-from .dnorm import DNorm
+from .dnorm import DNorm, convert_model, needs_conversion, load_mmap_meta
 from ... import utils
+from ...index_cache import file_hash
+from ...dict_store import as_store
 from ..base_converter import BaseConverter
 
 
@@ -17,15 +20,27 @@ class DNormConverter(BaseConverter):
     """DNorm converter
 
     Args:
-        dictionary List[DictEntry]: manbyo dictionary
+        dictionary Union[DictionaryStore, List[DictEntry]]: manbyo dictionary
+        frozen bool: whether to precompute W·norms_vecᵀ (see DNorm.freeze).
+            It can be faster to score, but the projection is a private matrix of each process
+            and can be larger than W, so it is disabled by default to keep the memory-mapped model shared.
 
     Attributes:
-        dict Dict[str: DictEntry]: manbyo dictionary
+        store DictionaryStore: manbyo dictionary
         model DNorm: DNorm model
+        instrumentation Instrumentation: collector shared with the model (None disables it)
     """
-    def __init__(self, dictionary):
-        self.dict = {d.name: d for d in dictionary}
-        self.build_model(dictionary)
+    def __init__(self, dictionary, frozen=False):
+        self.store = as_store(dictionary)
+        self.build_model(self.store, frozen=frozen)
+
+    @property
+    def instrumentation(self):
+        return self.model.instrumentation
+
+    @instrumentation.setter
+    def instrumentation(self, instrumentation):
+        self.model.instrumentation = instrumentation
 
     def convert(self, word):
         """Convert surface form of the disease into the normalized form.
@@ -36,27 +51,92 @@ class DNormConverter(BaseConverter):
         Returns:
             DictEntry: DictEntry of normalized form of the disease
         """
-        result, sims = self.model.predict([word], k=1)
+        result, sims = self.model.predict_ids([word], k=1)
         result, sims = result[0][0], sims[0][0]
-        return self.dict[result], sims
+        return self.store[result], sims
+
+    def convert_topk(self, word, k=10):
+        """Convert word into the k best candidates of the normalized form.
+
+        Args:
+            word str: surface form of the disease
+            k int: maximum number of candidates
+
+        Returns:
+            List[Tuple[DictEntry, float]]: candidates sorted in descending order of score
+        """
+        if k < 1:
+            return []
+        results, sims = self.model.predict_ids([word], k=k)
+        return [(self.store[result], sim) for result, sim in zip(results[0], sims[0])]
+
+    def convert_batch(self, words):
+        """Convert list of words into the normalized form.
 
-    def build_model(self, dictionary):
+        All words are vectorized and scored against the dictionary in one matrix product.
+
+        Args:
+            words List[str]: surface forms of the diseases
+
+        Returns:
+            List[Tuple[DictEntry, float]]: results in the same order as words
+        """
+        if len(words) == 0:
+            return []
+        results, sims = self.model.predict_ids(words, k=1)
+        return [(self.store[result[0]], sim[0]) for result, sim in zip(results, sims)]
+
+    def build_model(self, dictionary, frozen=False):
         """Build dnorm
 
-        Load dnorm model from ~/.cache/Dnorm/dnorm.pkl if the path exists.
-        Otherwise, automatically download the dnorm file from remote-url.
-        You can specify the cache directory by setting the environment variable "DEFAULT_CACHE_PATH"
+        Load dnorm model from ~/.cache/Dnorm/dnorm_mmap prepared by get_model_path.
+        Arrays of the converted model are memory-mapped read-only, so processes on the same host share them.
 
         Args:
-            dictionary List[DictEntry]: manbyo dictionary
+            dictionary DictionaryStore: manbyo dictionary
+            frozen bool: whether to precompute W·norms_vecᵀ
         """
-        DEFAULT_CACHE_PATH = os.getenv("DEFAULT_CACHE_PATH", "~/.cache")
-        DEFAULT_DNORM_PATH = Path(os.path.expanduser(
-                os.path.join(DEFAULT_CACHE_PATH, "Dnorm")
-        ))
-        DEFAULT_DNORM_PATH.mkdir(parents=True, exist_ok=True)
+        self.model = DNorm(dictionary, get_model_path(), frozen=frozen)
+
+
+def get_model_path():
+    """Get path of the memory-mappable dnorm model
 
-        if not (DEFAULT_DNORM_PATH / "dnorm.pkl").exists():
-            utils.download_fileobj(BASE_URL, DEFAULT_DNORM_PATH / "dnorm.pkl")
+    Convert ~/.cache/Dnorm/dnorm.pkl into ~/.cache/Dnorm/dnorm_mmap if dnorm_mmap does not exist
+    or was converted from another dnorm.pkl (the hash of dnorm.pkl is kept in dnorm_mmap/meta.json).
+    If neither exists, automatically download the dnorm file from remote-url.
+    You can specify the cache directory by setting the environment variable "DEFAULT_CACHE_PATH"
 
-        self.model = DNorm(dictionary, DEFAULT_DNORM_PATH / "dnorm.pkl")
+    Returns:
+        Path: directory of the memory-mappable model
+    """
+    DEFAULT_CACHE_PATH = os.getenv("DEFAULT_CACHE_PATH", "~/.cache")
+    DEFAULT_DNORM_PATH = Path(os.path.expanduser(
+            os.path.join(DEFAULT_CACHE_PATH, "Dnorm")
+    ))
+    DEFAULT_DNORM_PATH.mkdir(parents=True, exist_ok=True)
+    pickle_path = DEFAULT_DNORM_PATH / "dnorm.pkl"
+    mmap_path = DEFAULT_DNORM_PATH / "dnorm_mmap"
+
+    if not mmap_path.exists() and not pickle_path.exists():
+        utils.download_fileobj(BASE_URL, pickle_path)
+    # dnorm_mmap saved without dnorm.pkl is used as is
+    if pickle_path.exists() and needs_conversion(pickle_path, mmap_path):
+        convert_model(pickle_path, mmap_path)
+    return mmap_path
+
+
+def get_model_hash():
+    """Hash of the dnorm model used by DNormConverter
+
+    Returns:
+        str: hash of dnorm.pkl that dnorm_mmap was converted from, or of the files of dnorm_mmap saved without dnorm.pkl
+    """
+    path = get_model_path()
+    source_hash = load_mmap_meta(path).get("source_hash")
+    if source_hash is not None:
+        return source_hash
+    sha1 = hashlib.sha1()
+    for name in sorted(os.listdir(str(path))):
+        sha1.update(file_hash(path / name).encode("utf-8"))
+    return sha1.hexdigest()
@@ -0,0 +1,287 @@
+"""Training engine of DNorm
+
+DNormTrainer learns W of DNorm with the same pairwise ranking updates as the original training loop, but
+- negatives are mined from the scores of the query against all entries, with the gold entry masked out,
+  instead of copying norms_vec without the gold entry for every sample,
+- updates mᵀ(x_p - x_n) are kept as pending rank-one terms and merged into W in one sparse product,
+  instead of building a new W for every margin violation,
+- average rank of the validation set is computed from the score matrix in vectorized form.
+
+ParallelDNormTrainer shards each epoch across worker processes and averages their updates of W periodically.
+"""
+import random
+import contextlib
+import multiprocessing
+
+import numpy as np
+from scipy.sparse import vstack
+from tqdm import tqdm
+
+
+def masked_argmax(data, indices, n, exclude):
+    """Argmax of a sparse score vector without one entry
+
+    The result is the same as np.argmax of the dense vector whose entry `exclude` is removed,
+    i.e. the first index of the maximum score, where implicit entries have zero score.
+
+    Args:
+        data np.ndarray: nonzero scores
+        indices np.ndarray: sorted indices of the nonzero scores
+        n int: length of the dense vector
+        exclude int: index that must not be selected
+
+    Returns:
+        int: index of the maximum score
+    """
+    keep = indices != exclude
+    data, indices = data[keep], indices[keep]
+    if len(data) > 0:
+        best = data.argmax()
+        if data[best] > 0:
+            return int(indices[best])
+    else:
+        best = None
+
+    # the maximum is zero or negative, so the first implicit zero can win
+    present = np.union1d(indices, [exclude])
+    missing = np.flatnonzero(present != np.arange(len(present)))
+    first_zero = int(missing[0]) if len(missing) > 0 else len(present)
+    if first_zero >= n:
+        return int(indices[best])
+    if best is not None and data[best] == 0:
+        explicit_zero = int(indices[np.flatnonzero(data == 0)[0]])
+        return min(first_zero, explicit_zero)
+    return first_zero
+
+
+class DNormTrainer(object):
+    """Training engine of DNorm
+
+    With batch_size=1, each sample sees all updates of the previous samples and the learned W is
+    the same as the original sequential training (up to floating point summation order).
+    With larger batch_size, negatives of all samples in a mini-batch are mined with the W at the start of the batch.
+
+    Args:
+        model DNorm: model to train. W of the model is updated in place.
+        eta float: learning rate
+        batch_size int: number of samples scored with the same W
+        flush_every int: number of pending updates merged into W at once
+        seed int: seed of the shuffle of each epoch. If None, the global random module is used.
+        verbose bool: whether to show the progress bar
+
+    Attributes:
+        W csr_matrix: W without pending updates
+        pending_m List[csr_matrix]: query vectors of pending updates
+        pending_d List[csr_matrix]: eta * (x_p - x_n) of pending updates
+    """
+    def __init__(self, model, eta, batch_size=1, flush_every=64, seed=None, verbose=True):
+        self.model = model
+        self.eta = eta
+        self.batch_size = batch_size
+        self.flush_every = flush_every
+        self.random = random.Random(seed) if seed is not None else random
+        self.verbose = verbose
+        self.W = model.W.tocsr()
+        self.pending_m = []
+        self.pending_d = []
+
+    def train(self, X, Y, val_x, val_y):
+        """Train W until the average rank of the validation set stops improving
+
+        Args:
+            X List[str]: surface forms for training
+            Y List[str]: dictionary names of X
+            val_x List[str]: surface forms for validation
+            val_y List[str]: dictionary names of val_x
+
+        Returns:
+            List[float]: average rank of the validation set after each epoch
+        """
+        self.model.unfreeze()
+        x_vec = self.model.vectorize(X)
+        y_idx = np.array([self.model.norm2idx[y] for y in Y])
+        val_x_vec = self.model.vectorize(val_x)
+        val_y_idx = np.array([self.model.store.lookup(y) for y in val_y])
+
+        val_score = [float("inf"), 1e10]
+        while val_score[-1] < val_score[-2]:
+            idxs = [i for i in range(len(X))]
+            self.random.shuffle(idxs)
+            self.train_epoch(x_vec, y_idx, idxs)
+            score = self.validate(val_x_vec, val_y_idx)
+            val_score.append(score)
+            print('average rank of validation set : ', score)
+        return val_score[2:]
+
+    def validate(self, val_x_vec, val_y_idx):
+        """Average rank of the validation set
+
+        Args:
+            val_x_vec csr_matrix: tf-idf vectors of the validation inputs
+            val_y_idx np.ndarray: dictionary ids of the gold entries
+
+        Returns:
+            float: average rank (nan if the validation set is empty, which stops training after one epoch)
+        """
+        if val_x_vec.shape[0] == 0:
+            return float("nan")
+        return self.model.calc_ranks(val_x_vec, val_y_idx).mean()
+
+    def train_epoch(self, x_vec, y_idx, idxs):
+        """Run one epoch and write the learned W to the model
+
+        Args:
+            x_vec csr_matrix: tf-idf vectors of the training inputs
+            y_idx np.ndarray: dictionary ids of the gold entries
+            idxs List[int]: order of the samples
+        """
+        for start in tqdm(range(0, len(idxs), self.batch_size), disable=not self.verbose):
+            batch = idxs[start:start+self.batch_size]
+            self.step(x_vec[batch], y_idx[batch])
+        self.flush()
+
+    def project(self, x_vec):
+        """Multiply query vectors by W including pending updates
+
+        Args:
+            x_vec csr_matrix: query vectors
+
+        Returns:
+            csr_matrix: x·W
+        """
+        q_vec = x_vec.dot(self.W)
+        if len(self.pending_m) > 0:
+            # x·(W + Σ mᵢᵀdᵢ) = x·W + (x·Mᵀ)·D
+            q_vec = q_vec + x_vec.dot(vstack(self.pending_m).T).dot(vstack(self.pending_d))
+        return q_vec.tocsr()
+
+    def step(self, m_vecs, y_idx):
+        """Mine negatives and update W for a mini-batch
+
+        Args:
+            m_vecs csr_matrix: query vectors of the batch
+            y_idx np.ndarray: dictionary ids of the gold entries
+        """
+        model = self.model
+        scores = self.project(m_vecs).dot(model.index).tocsr()
+        scores.sort_indices()
+        n = len(model.store)
+        for i in range(m_vecs.shape[0]):
+            data = scores.data[scores.indptr[i]:scores.indptr[i+1]]
+            indices = scores.indices[scores.indptr[i]:scores.indptr[i+1]]
+            neg_idx = masked_argmax(data, indices, n, y_idx[i])
+
+            pos = data[indices == y_idx[i]]
+            pos_score = pos[0] if len(pos) > 0 else 0
+            neg = data[indices == neg_idx]
+            neg_score = neg[0] if len(neg) > 0 else 0
+            if pos_score - neg_score < 1:
+                self.pending_m.append(m_vecs[i])
+                self.pending_d.append(self.eta * (model.norms_vec[y_idx[i]] - model.norms_vec[neg_idx]))
+
+        if len(self.pending_m) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        """Merge pending updates into W and write it to the model"""
+        if len(self.pending_m) > 0:
+            self.W = (self.W + vstack(self.pending_m).T.dot(vstack(self.pending_d))).tocsr()
+            self.pending_m = []
+            self.pending_d = []
+        self.model.W = self.W
+        self.model.unfreeze()
+
+
+# model shared by the worker processes of ParallelDNormTrainer
+_worker_model = None
+
+
+def _init_worker(model):
+    global _worker_model
+    _worker_model = model
+
+
+def _train_shard(args):
+    W, x_vec, y_idx, eta, batch_size, flush_every = args
+    _worker_model.W = W
+    trainer = DNormTrainer(_worker_model, eta, batch_size=batch_size, flush_every=flush_every, verbose=False)
+    trainer.train_epoch(x_vec, y_idx, list(range(len(y_idx))))
+    return trainer.W - W
+
+
+def _calc_ranks(args):
+    W, x_vec, y_idx = args
+    _worker_model.W = W
+    _worker_model.unfreeze()
+    return _worker_model.calc_ranks(x_vec, y_idx)
+
+
+class ParallelDNormTrainer(DNormTrainer):
+    """Parallel training engine of DNorm
+
+    Each epoch is shuffled with the seed and split into shards, one for each worker.
+    Workers train their own copy of W on the next sync_every samples of their shard,
+    then the updates of all workers are averaged into W and the next round starts from the averaged W
+    (iterative parameter mixing). The validation set is also scored in parallel.
+    Shards and averaging do not depend on the scheduling of the processes, so runs with the same seed are reproducible.
+
+    Args:
+        model DNorm: model to train. W of the model is updated in place.
+        eta float: learning rate
+        n_workers int: number of worker processes
+        sync_every int: number of samples each worker trains between the averaging of W
+        batch_size int: number of samples scored with the same W in each worker
+        flush_every int: number of pending updates merged into W at once in each worker
+        seed int: seed of the shuffle of each epoch
+        verbose bool: whether to show the progress bar
+    """
+    def __init__(self, model, eta, n_workers=2, sync_every=1000, batch_size=1, flush_every=64, seed=0, verbose=True):
+        super().__init__(model, eta, batch_size=batch_size, flush_every=flush_every, seed=seed, verbose=verbose)
+        self.n_workers = n_workers
+        self.sync_every = sync_every
+        self.pool = None
+
+    @contextlib.contextmanager
+    def start_workers(self):
+        """Start worker processes unless they are already running"""
+        if self.pool is not None:
+            yield self.pool
+            return
+
+        with multiprocessing.Pool(self.n_workers, initializer=_init_worker, initargs=(self.model,)) as pool:
+            self.pool = pool
+            try:
+                yield pool
+            finally:
+                self.pool = None
+
+    def train(self, X, Y, val_x, val_y):
+        self.model.unfreeze()
+        with self.start_workers():
+            return super().train(X, Y, val_x, val_y)
+
+    def train_epoch(self, x_vec, y_idx, idxs):
+        shards = [idxs[i::self.n_workers] for i in range(self.n_workers)]
+        n_rounds = (max(len(shard) for shard in shards) + self.sync_every - 1) // self.sync_every
+        with self.start_workers() as pool:
+            for r in tqdm(range(n_rounds), disable=not self.verbose):
+                tasks = []
+                for shard in shards:
+                    batch = shard[r*self.sync_every:(r+1)*self.sync_every]
+                    if len(batch) > 0:
+                        tasks.append((self.W, x_vec[batch], y_idx[batch], self.eta, self.batch_size, self.flush_every))
+                deltas = pool.map(_train_shard, tasks)
+                # average of the updates of all workers
+                self.W = (self.W + sum(deltas[1:], deltas[0]) / len(deltas)).tocsr()
+        self.flush()
+
+    def validate(self, val_x_vec, val_y_idx):
+        if val_x_vec.shape[0] == 0:
+            return super().validate(val_x_vec, val_y_idx)
+        size = (val_x_vec.shape[0] + self.n_workers - 1) // self.n_workers
+        tasks = [
+            (self.W, val_x_vec[start:start+size], val_y_idx[start:start+size])
+            for start in range(0, val_x_vec.shape[0], size)
+        ]
+        with self.start_workers() as pool:
+            return np.concatenate(pool.map(_calc_ranks, tasks)).mean()
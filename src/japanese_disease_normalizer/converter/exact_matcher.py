@@ -4,19 +4,22 @@ Convert disease using exact match.
 """
 import csv
 from .. import utils
+from ..dict_store import as_store
 from .base_converter import BaseConverter
 
 class ExactMatchConverter(BaseConverter):
     """ExactMatcher
 
     Args:
-        dictionary List[DictEntry]: manbyo dictionary
+        dictionary Union[DictionaryStore, List[DictEntry]]: manbyo dictionary
 
     Attributes:
-        dict Dict[str: DictEntry]: manbyo dictionary
+        store DictionaryStore: manbyo dictionary
     """
+    perfect_score = 1
+
     def __init__(self, dictionary):
-        self.dict = {d.name: d for d in dictionary}
+        self.store = as_store(dictionary)
 
     def convert(self, word):
         """Convert surface form of the dictionary into the normalized form
@@ -27,4 +30,42 @@ class ExactMatchConverter(BaseConverter):
         Returns:
             DictEntry: normalized form of the input disease.
         """
-        return self.dict.get(word, utils.DictEntry(None, None, None, None)), 1 if word in self.dict else 0
+        idx = self.store.lookup(word)
+        if idx < 0:
+            return utils.DictEntry(None, None, None, None), 0
+        return self.store[idx], 1
+
+    def convert_batch(self, words):
+        """Convert list of words into the normalized form
+
+        Args:
+            words List[str]: surface forms of the diseases
+
+        Returns:
+            List[Tuple[DictEntry, int]]: normalized forms of the input diseases in the same order as words
+        """
+        results = []
+        for word in words:
+            idx = self.store.lookup(word)
+            if idx < 0:
+                results.append((utils.DictEntry(None, None, None, None), 0))
+            else:
+                results.append((self.store[idx], 1))
+        return results
+
+    def convert_topk(self, word, k=10):
+        """Convert word into the candidates of the normalized form
+
+        Exact match has at most one candidate.
+
+        Args:
+            word str: surface form of the disease
+            k int: maximum number of candidates
+
+        Returns:
+            List[Tuple[DictEntry, int]]: matched entry with score 1, or empty list
+        """
+        idx = self.store.lookup(word)
+        if k < 1 or idx < 0:
+            return []
+        return [(self.store[idx], 1)]
@@ -4,6 +4,7 @@ Fuzzy match by simstring. We use the cosine similarity of character-level bigram
 """
 
 import os
+import heapq
 from pathlib import Path
 
 from simstring.feature_extractor.character_ngram import CharacterNgramFeatureExtractor
@@ -12,6 +13,7 @@ from simstring.database.dict import DictDatabase
 from simstring.searcher import Searcher
 
 from .. import utils
+from ..dict_store import as_store
 from .base_converter import BaseConverter
 
 
@@ -19,17 +21,19 @@ class FuzzyMatchConverter(BaseConverter):
     """Fuzzy Matcher
 
     args:
-        dictionary: List[DictEntry]
+        dictionary: Union[DictionaryStore, List[DictEntry]]
 
     attributes:
-        dict Dict[str: DictEntry]: dict of manbyo dictionary
+        store DictionaryStore: manbyo dictionary
         db: DictDatabase of simstring
         searcher: searcher of simstring
     """
+    perfect_score = 1.0
+
     def __init__(self, dictionary):
-        self.dict = {d.name: d for d in dictionary}
+        self.store = as_store(dictionary)
         self.db = DictDatabase(CharacterNgramFeatureExtractor(2))
-        [self.db.add(d) for d in self.dict.keys()]
+        [self.db.add(self.store.get_field(idx, 0)) for idx in self.store.unique_ids().tolist()]
         self.searcher = Searcher(self.db, CosineMeasure())
 
     def convert(self, word, alpha=0.5):
@@ -43,8 +47,52 @@ class FuzzyMatchConverter(BaseConverter):
             DictEntry: DictEntry of normalized disease
         """
         results = self.searcher.ranked_search(word, alpha)
+        if self.instrumentation is not None:
+            self.instrumentation.count("candidates.FuzzyMatchConverter", len(results))
         if len(results) != 0:
             # results = [(sim, word), ...]
-            return self.dict[results[0][1]], results[0][0]
+            return self.store[self.store.lookup(results[0][1])], results[0][0]
         return utils.DictEntry(None, None, None, None), -float('inf')
 
+    def convert_batch(self, words, alpha=0.5):
+        """Convert list of words to normalized form.
+
+        simstring searches one query at a time, so each distinct word is searched only once.
+
+        Args:
+            words List[str]: surface forms of the diseases that you want to normalize
+            alpha float: minimum value of cosine similarity
+
+        Return:
+            List[Tuple[DictEntry, float]]: results in the same order as words
+        """
+        results = {}
+        for word in words:
+            if word not in results:
+                results[word] = self.convert(word, alpha)
+        return [results[word] for word in words]
+
+    def convert_topk(self, word, k=10, alpha=0.5):
+        """Convert word into the k best candidates of the normalized form.
+
+        Candidates are ranked in the same order as ranked_search of simstring,
+        but only k of them are kept in a bounded heap instead of sorting all candidates.
+
+        Args:
+            word str: surface form of the disease that you want to normalize
+            k int: maximum number of candidates
+            alpha float: minimum value of cosine similarity
+
+        Return:
+            List[Tuple[DictEntry, float]]: candidates sorted in descending order of cosine similarity
+        """
+        if k < 1:
+            return []
+        features = self.searcher.feature_extractor.features(word)
+        measure = self.searcher.measure
+        scored = (
+            (measure.similarity(features, self.searcher.feature_extractor.features(name)), name)
+            for name in self.searcher.search(word, alpha)
+        )
+        results = heapq.nsmallest(k, scored, key=lambda x: (-x[0], x[1]))
+        return [(self.store[self.store.lookup(name)], sim) for sim, name in results]
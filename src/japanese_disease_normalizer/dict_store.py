@@ -0,0 +1,364 @@
+"""Columnar store of the manbyo dictionary
+
+DictionaryStore keeps the manbyo dictionary as numpy arrays instead of one DictEntry object per row.
+Every distinct string (name, icd-10 code, normalized form, level) is stored once in a utf-8 string table,
+and each field of the dictionary is an array of string ids.
+Converters share one store and refer to the entries by their integer ids.
+The arrays can be saved as .npy files and memory-mapped read-only.
+"""
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from collections.abc import Mapping
+
+import numpy as np
+
+from . import utils
+
+FIELDS = ["name", "icd", "norm", "level"]
+
+
+class DictEntryView(utils.DictEntry):
+    """Read-only view of one entry of DictionaryStore
+
+    It is a DictEntry (isinstance, dataclasses.asdict) whose fields are read from the store,
+    and compares equal to DictEntry with the same values.
+    Unlike DictEntry, the fields cannot be assigned.
+    It is pickled as a plain DictEntry, so pickling results does not copy the whole store.
+
+    Args:
+        store DictionaryStore: store of the entry
+        idx int: id of the entry
+    """
+    def __init__(self, store, idx):
+        self.store = store
+        self.idx = idx
+
+    @property
+    def name(self):
+        return self.store.get_field(self.idx, 0)
+
+    @property
+    def icd(self):
+        return self.store.get_field(self.idx, 1)
+
+    @property
+    def norm(self):
+        return self.store.get_field(self.idx, 2)
+
+    @property
+    def level(self):
+        return self.store.get_field(self.idx, 3)
+
+    def astuple(self):
+        return (self.name, self.icd, self.norm, self.level)
+
+    def to_entry(self):
+        """Copy the entry into DictEntry
+
+        Returns:
+            DictEntry: entry
+        """
+        return utils.DictEntry(*self.astuple())
+
+    def __eq__(self, other):
+        if isinstance(other, (DictEntryView, utils.DictEntry)):
+            return self.astuple() == (other.name, other.icd, other.norm, other.level)
+        return NotImplemented
+
+    # DictEntry is not hashable either
+    __hash__ = None
+
+    def __repr__(self):
+        return "DictEntryView(name={!r}, icd={!r}, norm={!r}, level={!r})".format(*self.astuple())
+
+    def __reduce__(self):
+        return (utils.DictEntry, self.astuple())
+
+
+class NameIndex(Mapping):
+    """Read-only mapping from name to the id of the last entry with the name
+
+    Names are not copied: they are decoded from the string table of the store when iterated.
+
+    Args:
+        store DictionaryStore: store of the entries
+    """
+    def __init__(self, store):
+        self.store = store
+
+    def __getitem__(self, name):
+        idx = self.store.lookup(name)
+        if idx < 0:
+            raise KeyError(name)
+        return idx
+
+    def __iter__(self):
+        for idx in self.store.unique_ids().tolist():
+            yield self.store.get_field(idx, 0)
+
+    def __len__(self):
+        return len(self.store.unique_ids())
+
+
+class DictionaryStore(object):
+    """Columnar manbyo dictionary
+
+    Use from_entries, from_columns, from_csv or load to create the store.
+
+    Args:
+        string_data np.ndarray: utf-8 bytes of all distinct strings
+        string_offsets np.ndarray: string i is string_data[string_offsets[i]:string_offsets[i+1]]
+        fields np.ndarray: string ids of name, icd, norm and level of each entry (shape: (4, number of entries)).
+            Missing values (None) have id -1.
+
+    Attributes:
+        name2id NameIndex: read-only mapping from name to the id of the last entry with the name
+    """
+    def __init__(self, string_data, string_offsets, fields):
+        self.string_data = string_data
+        self.string_offsets = string_offsets
+        self.fields = fields
+        self._unique_ids = None
+        self._name_index = None
+
+    @classmethod
+    def from_columns(cls, names, icds, norms, levels):
+        """Create store from the values of each field
+
+        Args:
+            names List[str]: names of the entries
+            icds List[str]: icd-10 codes of the entries
+            norms List[str]: normalized forms of the entries
+            levels List[str]: levels of the entries
+
+        Returns:
+            DictionaryStore: store
+        """
+        string2id = {}
+        fields = np.zeros((len(FIELDS), len(names)), dtype=np.int32)
+        for i, column in enumerate([names, icds, norms, levels]):
+            if len(column) != len(names):
+                raise ValueError("all fields must have the same number of entries")
+            fields[i] = [-1 if value is None else string2id.setdefault(value, len(string2id)) for value in column]
+
+        encoded = [string.encode("utf-8") for string in string2id.keys()]
+        string_offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(string) for string in encoded], out=string_offsets[1:])
+        string_data = np.frombuffer(b"".join(encoded), dtype=np.uint8).copy()
+        return cls(string_data, string_offsets, fields)
+
+    @classmethod
+    def from_entries(cls, entries):
+        """Create store from DictEntry list
+
+        Args:
+            entries List[DictEntry]: manbyo dictionary
+
+        Returns:
+            DictionaryStore: store
+        """
+        return cls.from_columns(
+            [entry.name for entry in entries],
+            [entry.icd for entry in entries],
+            [entry.norm for entry in entries],
+            [entry.level for entry in entries],
+        )
+
+    @classmethod
+    def from_csv(cls, path):
+        """Load manbyo dictionary into the store
+
+        Args:
+            path str: path of the manbyo dictionary
+
+        Returns:
+            DictionaryStore: store
+        """
+        return cls.from_entries(utils.load_dict(path))
+
+    @classmethod
+    def load(cls, path, mmap_mode="r"):
+        """Load store saved by save
+
+        Args:
+            path str: directory of the store
+            mmap_mode str: mmap_mode of np.load. If None, arrays are read into memory.
+
+        Returns:
+            DictionaryStore: store
+        """
+        path = Path(path)
+        return cls(
+            np.load(path / "string_data.npy", mmap_mode=mmap_mode),
+            np.load(path / "string_offsets.npy", mmap_mode=mmap_mode),
+            np.load(path / "fields.npy", mmap_mode=mmap_mode),
+        )
+
+    def save(self, path):
+        """Save arrays of the store as .npy files
+
+        The directory is written to a temporary directory first and renamed.
+
+        Args:
+            path str: directory of the store
+        """
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = Path(tempfile.mkdtemp(dir=str(path.parent), suffix=".tmp"))
+        try:
+            np.save(tmp_path / "string_data.npy", self.string_data)
+            np.save(tmp_path / "string_offsets.npy", self.string_offsets)
+            np.save(tmp_path / "fields.npy", self.fields)
+
+            if path.exists():
+                shutil.rmtree(str(path))
+            try:
+                os.rename(str(tmp_path), str(path))
+            except OSError:
+                # another process has written the store at the same time
+                if not path.exists():
+                    raise
+        finally:
+            if tmp_path.exists():
+                shutil.rmtree(str(tmp_path))
+
+    def get_string(self, string_id):
+        if string_id < 0:
+            return None
+        start, end = self.string_offsets[string_id], self.string_offsets[string_id + 1]
+        return self.string_data[start:end].tobytes().decode("utf-8")
+
+    def get_field(self, idx, field):
+        return self.get_string(self.fields[field, idx])
+
+    def column(self, field):
+        """Get values of one field
+
+        Args:
+            field str: name|icd|norm|level
+
+        Returns:
+            List[str]: values of the field in the order of the entries
+        """
+        strings = {}
+        values = []
+        for string_id in self.fields[FIELDS.index(field)].tolist():
+            if string_id not in strings:
+                strings[string_id] = self.get_string(string_id)
+            values.append(strings[string_id])
+        return values
+
+    def names(self):
+        return self.column("name")
+
+    def replace_names(self, names):
+        """Create store whose names are replaced
+
+        Args:
+            names List[str]: new names in the order of the entries
+
+        Returns:
+            DictionaryStore: store with the new names and the same icd, norm and level
+        """
+        return DictionaryStore.from_columns(names, self.column("icd"), self.column("norm"), self.column("level"))
+
+    @property
+    def name2id(self):
+        return NameIndex(self)
+
+    def unique_ids(self):
+        """Get ids of the last entry of each distinct name
+
+        Equal names share the same string id, so the names are not decoded.
+
+        Returns:
+            np.ndarray: entry ids in the order of the first appearance of the names
+        """
+        if self._unique_ids is None:
+            name_ids = np.asarray(self.fields[0])
+            _, first = np.unique(name_ids, return_index=True)
+            _, last = np.unique(name_ids[::-1], return_index=True)
+            last = len(name_ids) - 1 - last
+            self._unique_ids = last[np.argsort(first, kind="stable")]
+        return self._unique_ids
+
+    def build_name_index(self):
+        """Build hash index of the names
+
+        The index is the hashes of the distinct names sorted in ascending order and the entry id of each hash,
+        so lookup is a binary search that decodes only the names with the same hash.
+        It is not pickled because the hash of str differs between processes.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: sorted hashes and entry ids
+        """
+        if self._name_index is None:
+            ids = self.unique_ids()
+            hashes = np.array([hash(self.get_field(idx, 0)) for idx in ids.tolist()], dtype=np.int64)
+            order = np.argsort(hashes, kind="stable")
+            self._name_index = (hashes[order], ids[order])
+        return self._name_index
+
+    def lookup(self, name):
+        """Get id of the entry with the name
+
+        If more than one entry has the name, the last one is used as in {d.name: d for d in dictionary}.
+
+        Args:
+            name str: name of the entry
+
+        Returns:
+            int: id of the entry, or -1 if the name is not in the store
+        """
+        hashes, ids = self.build_name_index()
+        name_hash = hash(name)
+        i = int(hashes.searchsorted(name_hash))
+        while i < len(hashes) and hashes[i] == name_hash:
+            idx = int(ids[i])
+            if self.get_field(idx, 0) == name:
+                return idx
+            i += 1
+        return -1
+
+    def __len__(self):
+        return self.fields.shape[1]
+
+    def __getitem__(self, idx):
+        idx = int(idx)
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError("entry id out of range: {}".format(idx))
+        return DictEntryView(self, idx)
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield DictEntryView(self, idx)
+
+    def __eq__(self, other):
+        if not isinstance(other, DictionaryStore):
+            return NotImplemented
+        return all(self.column(field) == other.column(field) for field in FIELDS)
+
+    def __getstate__(self):
+        # indexes of the names are rebuilt on demand
+        state = self.__dict__.copy()
+        state["_unique_ids"] = None
+        state["_name_index"] = None
+        return state
+
+
+def as_store(dictionary):
+    """Wrap manbyo dictionary into DictionaryStore
+
+    Args:
+        dictionary Union[DictionaryStore, List[DictEntry]]: manbyo dictionary
+
+    Returns:
+        DictionaryStore: the store itself, or a new store of the entries
+    """
+    if isinstance(dictionary, DictionaryStore):
+        return dictionary
+    return DictionaryStore.from_entries(dictionary)
@@ -0,0 +1,116 @@
+"""Cache of prebuilt indexes
+
+Normalizer stores the preprocessed dictionary and the built converter on disk so that
+the next start can skip loading, preprocessing and indexing the manbyo dictionary.
+Each cache file is keyed by the hash of the settings that produced it.
+Keys made with a group (e.g. the path of the dictionary and the pipeline) replace the older entries of the same group,
+so the cache does not grow every time the dictionary, the abbreviation dictionary or the dnorm model is updated.
+You can specify the cache directory by setting the environment variable "DEFAULT_CACHE_PATH"
+"""
+import os
+import pickle
+import hashlib
+import tempfile
+from pathlib import Path
+
+
+def get_cache_dir():
+    """Get directory of the index cache
+
+    Returns:
+        Path: ~/.cache/norm/index (or $DEFAULT_CACHE_PATH/norm/index)
+    """
+    DEFAULT_CACHE_PATH = os.getenv("DEFAULT_CACHE_PATH", "~/.cache")
+    DEFAULT_INDEX_PATH = Path(os.path.expanduser(
+            os.path.join(DEFAULT_CACHE_PATH, "norm", "index")
+    ))
+    DEFAULT_INDEX_PATH.mkdir(parents=True, exist_ok=True)
+    return DEFAULT_INDEX_PATH
+
+
+def file_hash(path):
+    """Calculate sha1 hash of the file
+
+    Args:
+        path str: path of the file
+
+    Returns:
+        str: hex digest of the file content
+    """
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+def make_key(*parts, group=None):
+    """Create cache key from the settings
+
+    Args:
+        parts: settings that determine the cached object (they must have stable repr)
+        group: settings that identify the cached object apart from the content of its sources
+            (e.g. path of the dictionary instead of its hash). If given, the key is prefixed by the hash of group
+            and save removes the entries of the same group under the other keys.
+
+    Returns:
+        str: cache key
+    """
+    key = hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()
+    if group is None:
+        return key
+    return hashlib.sha1(repr(group).encode("utf-8")).hexdigest() + "-" + key
+
+
+def load(key):
+    """Load cached object
+
+    Args:
+        key str: cache key created by make_key
+
+    Returns:
+        object: cached object, or None if the cache does not exist or is broken
+    """
+    path = get_cache_dir() / (key + ".pkl")
+    if not path.exists():
+        return None
+
+    try:
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+    except Exception:
+        return None
+
+
+def save(key, obj):
+    """Save object to the cache
+
+    The file is written to a temporary file first and renamed,
+    so other processes never read a partially written cache.
+    If the key has a group, the entries of the same group under the other keys are removed.
+
+    Args:
+        key str: cache key created by make_key
+        obj object: picklable object
+    """
+    cache_dir = get_cache_dir()
+    fd, tmp_path = tempfile.mkstemp(dir=str(cache_dir), suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, str(cache_dir / (key + ".pkl")))
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    if "-" in key:
+        group = key.split("-")[0]
+        for path in cache_dir.glob(group + "-*.pkl"):
+            if path.name == key + ".pkl":
+                continue
+            try:
+                os.remove(str(path))
+            except OSError:
+                # removed by another process
+                pass
@@ -0,0 +1,101 @@
+"""Opt-in instrumentation of the normalization stages
+
+Instrumentation collects timers and counters reported by Normalizer, PreprocessorPipeline and the converters.
+It is disabled by default: the components keep `instrumentation = None` and only check it,
+so the overhead is one attribute lookup per call.
+
+Names of the timers:
+    normalize, normalize_batch: whole call of Normalizer
+    preprocess: PreprocessorPipeline.preprocess, preprocess.<class name>: each stage of the pipeline
+    convert.<class name>, convert_batch.<class name>: calls of the converter by Normalizer
+    cascade.<stage name>: calls of each stage of CascadeConverter
+    dnorm.vectorize, dnorm.score: tf-idf vectorization and scoring of DNorm
+
+Names of the counters:
+    normalize.inputs: names given to Normalizer
+    preprocess.variants: names generated by the pipeline, normalize.variants: distinct preprocessed names of the inputs
+    normalize.early_exit: normalize stopped by a perfect score
+    result_cache.hits, result_cache.misses, variant_cache.hits, variant_cache.misses: result caches of Normalizer
+    candidates.<class name>: dictionary entries scored by the converter
+    cascade.answered.<stage name>, cascade.unanswered: results of CascadeConverter
+"""
+
+
+class Instrumentation(object):
+    """Timers and counters of the normalization stages
+
+    Callbacks are called with (kind, name, value) for every measurement,
+    where kind is "timer" (value is seconds) or "counter" (value is the increment).
+    Callbacks are not pickled, so worker processes that receive a pickled normalizer only collect their own stats.
+
+    Args:
+        callbacks List[Callable[[str, str, float], None]]: callbacks of the measurements
+
+    Attributes:
+        timers Dict[str, List[float]]: name to [number of calls, total seconds, max seconds]
+        counters Dict[str, int]: name to count
+    """
+    def __init__(self, callbacks=None):
+        self.callbacks = list(callbacks) if callbacks is not None else []
+        self.reset()
+
+    def reset(self):
+        """Clear all timers and counters"""
+        self.timers = {}
+        self.counters = {}
+
+    def add_callback(self, callback):
+        self.callbacks.append(callback)
+
+    def record(self, name, seconds):
+        """Add elapsed time of one call
+
+        Args:
+            name str: name of the timer
+            seconds float: elapsed time
+        """
+        timer = self.timers.get(name)
+        if timer is None:
+            self.timers[name] = [1, seconds, seconds]
+        else:
+            timer[0] += 1
+            timer[1] += seconds
+            if seconds > timer[2]:
+                timer[2] = seconds
+        for callback in self.callbacks:
+            callback("timer", name, seconds)
+
+    def count(self, name, n=1):
+        """Increment counter
+
+        Args:
+            name str: name of the counter
+            n int: increment
+        """
+        self.counters[name] = self.counters.get(name, 0) + n
+        for callback in self.callbacks:
+            callback("counter", name, n)
+
+    def snapshot(self):
+        """Current stats
+
+        Returns:
+            dict: "timers" (name to count, total_ms, mean_ms and max_ms) and "counters" (name to count)
+        """
+        return {
+            "timers": {
+                name: {
+                    "count": count,
+                    "total_ms": total * 1000,
+                    "mean_ms": total * 1000 / count,
+                    "max_ms": max_seconds * 1000,
+                }
+                for name, (count, total, max_seconds) in self.timers.items()
+            },
+            "counters": dict(self.counters),
+        }
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["callbacks"] = []
+        return state
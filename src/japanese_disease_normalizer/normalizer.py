@@ -3,11 +3,17 @@
 Normalizer class normalizes disease names.
 """
 import os
+import time
+import heapq
+import multiprocessing
 from pathlib import Path
 from logging import getLogger, NullHandler
 
 from . import utils
-from .converter import exact_matcher, fuzzy_matcher
+from . import index_cache
+from .cache import make_cache
+from .dict_store import DictionaryStore, as_store
+from .converter import exact_matcher, fuzzy_matcher, bigram_matcher, cascade_converter
 from .converter.dnorm import dnorm_converter
 from .converter.base_converter import BaseConverter
 from .preprocessor.pipeline import PreprocessorPipeline
@@ -17,59 +23,353 @@ BASE_URL = "http://aoi.naist.jp/norm/MANBYO_SABC.csv"
 default_logger = getLogger(__name__)
 default_logger.addHandler(NullHandler())
 
+# pipeline shared by the worker processes of Normalizer.preprocess_dictionary
+_worker_preprocessor = None
+
+
+def _init_worker(preprocessor):
+    global _worker_preprocessor
+    _worker_preprocessor = preprocessor
+
+
+def _preprocess_chunk(names):
+    return [_worker_preprocessor.preprocess_identity(name) for name in names]
+
+
 class Normalizer(object):
     """Normalizer
 
+    The manbyo dictionary is kept in one DictionaryStore (manbyo_dict) shared by the converter.
+
+    When the converter is a CascadeConverter, results of the preprocessed names are ranked by the stage that answered
+    (earlier is better) and then by score, because scores of different stages are not comparable.
+
+    With result_cache_size > 0, results are cached in memory at two levels:
+    raw input to the final entry and its score (result_cache) and preprocessed name to the converter result (variant_cache).
+    Both caches are cleared when preprocessor, manbyo_dict or converter is replaced.
+    If you modify them in place (e.g. retrain the DNorm model), call clear_result_cache.
+
     Args:
         preprocess_pipeline Union[PreprocessorPipeline, str]: pipeline of preprocessor. You can use str (basic|abbr)
-        converter Union[BaseConverter, str]: converter for normalization. You can use str (exact|fuzzy|dnorm)
+        converter Union[BaseConverter, str]: converter for normalization. You can use str (exact|fuzzy|bigram|dnorm|cascade)
+        use_cache bool: whether to store the preprocessed dictionary and the built converter in ~/.cache/norm/index.
+            The cache is keyed by the hash of the manbyo dictionary file, the preprocess pipeline, the abbreviation dictionary,
+            the converter name and the dnorm model, so the next Normalizer with the same settings loads them instead of rebuilding.
+            Note that your own preprocessor is identified only by its class name.
+        result_cache_size int: maximum number of entries of each result cache (0 disables the result cache)
+        result_cache_policy str: eviction policy of the result cache (lru|lfu)
+        n_jobs int: number of worker processes to preprocess the manbyo dictionary (1 runs in this process).
+            The preprocessor must be picklable when n_jobs > 1.
+        cascade_stages List[Tuple[str, float]]: converters and thresholds of the "cascade" converter
+            (default: exact, fuzzy and dnorm; see CascadeConverter)
+        instrumentation Instrumentation: collector of the timers and counters of each stage (None disables it).
+            It is shared with the preprocessor and the converter, also when they are replaced.
+
+    Attributes:
+        dict_preprocess_time float: seconds spent to preprocess the manbyo dictionary (0 if loaded from the cache)
+        result_cache BaseCache: raw input to the normalized entry and its score (None if disabled)
+        variant_cache BaseCache: preprocessed name to the result of the converter (None if disabled)
     """
-    def __init__(self, preprocess_pipeline, converter, logger=None):
+    _instrumentation = None
+
+    def __init__(self, preprocess_pipeline, converter, logger=None, use_cache=False, result_cache_size=0, result_cache_policy="lru", n_jobs=1, cascade_stages=None, instrumentation=None):
         self.logger = logger or default_logger
+        self.cascade_stages = cascade_stages
+        self.dict_preprocess_time = 0.0
+        self.result_cache = None
+        self.variant_cache = None
+        if result_cache_size > 0:
+            self.result_cache = make_cache(result_cache_size, result_cache_policy)
+            self.variant_cache = make_cache(result_cache_size, result_cache_policy)
+
         # load preprocessor
         if isinstance(preprocess_pipeline, PreprocessorPipeline):
             self.preprocessor = preprocess_pipeline
         elif isinstance(preprocess_pipeline, str):
             self.logger.info("Try to use %s preprocess_pipeline", preprocess_pipeline)
             if preprocess_pipeline == "basic":
-                self.preprocessor = PreprocessorPipeline(["NFKC", "fullwidth"])
+                self.preprocessor = PreprocessorPipeline(["NFKC", "fullwidth"], compiled=True)
                 self.logger.info("Basic preprocess_pipeline runs NFKC and fullwidth preprocsessing")
             elif preprocess_pipeline == "abbr":
-                self.preprocessor = PreprocessorPipeline(["abbr", "NFKC", "fullwidth"])
+                self.preprocessor = PreprocessorPipeline(["abbr", "NFKC", "fullwidth"], compiled=True)
                 self.logger.info("abbr preprocess_pipeline runs abbreviation expansion, NFKC and fullwidth preprocsessing")
             else:
                 raise NotImplementedError("Please specify converter by selecting (basic) or creating your own converter inheriting BaseConverter")
         else:
             raise NotImplementedError("Please specify converter by selecting (basic) or creating your own preprocess pipeline instance")
 
-        self.manbyo_dict = self.load_manbyo_dict()
-        self.logger.info("Loaded %s entries", len(self.manbyo_dict))
-        for entry in self.manbyo_dict:
+        dict_key = None
+        if use_cache:
+            manbyo_path = self.get_manbyo_path()
+            # entries of an updated dictionary, abbreviation dictionary or dnorm model replace the older ones
+            dict_group = ("dictionary", str(manbyo_path), self.preprocessor.config)
+            dict_hash = index_cache.file_hash(manbyo_path)
+            dict_key = index_cache.make_key("dictionary", dict_hash, self.preprocessor.config, self.preprocessor.resource_hashes(), group=dict_group)
+
+        self.manbyo_dict = index_cache.load(dict_key) if dict_key is not None else None
+        if self.manbyo_dict is not None:
+            self.logger.info("Loaded %s preprocessed entries from cache", len(self.manbyo_dict))
+        else:
+            self.manbyo_dict = as_store(self.load_manbyo_dict())
+            self.logger.info("Loaded %s entries", len(self.manbyo_dict))
             # 0番目を出現形として使用
-            entry.name = self.preprocessor.preprocess(entry.name)[0]
+            self.manbyo_dict = self.manbyo_dict.replace_names(
+                self.preprocess_dictionary(self.manbyo_dict.names(), n_jobs=n_jobs)
+            )
+            if dict_key is not None:
+                index_cache.save(dict_key, self.manbyo_dict)
 
         # load converter
         if isinstance(converter, str):
             self.logger.info("Try to use %s converter", converter)
-            if converter == "exact":
-                self.converter = exact_matcher.ExactMatchConverter(self.manbyo_dict)
-            elif converter == "fuzzy":
-                self.converter = fuzzy_matcher.FuzzyMatchConverter(self.manbyo_dict)
-            elif converter == "dnorm":
-                self.converter = dnorm_converter.DNormConverter(self.manbyo_dict)
+            converter_key = None
+            if dict_key is not None:
+                settings = [converter]
+                if converter == "cascade" and cascade_stages is not None:
+                    settings.append([tuple(stage) for stage in cascade_stages])
+                parts = list(settings)
+                if self.uses_dnorm(converter):
+                    parts.append(dnorm_converter.get_model_hash())
+                converter_key = index_cache.make_key("converter", dict_key, *parts, group=("converter", dict_group, *settings))
+
+            self.converter = index_cache.load(converter_key) if converter_key is not None else None
+            if self.converter is not None:
+                self.logger.info("Loaded %s converter from cache", converter)
             else:
-                raise NotImplementedError("Please specify converter by selecting (exact|fuzzy|dnorm)")
+                self.converter = self.build_converter(converter)
+                if converter_key is not None:
+                    index_cache.save(converter_key, self.converter)
         elif isinstance(converter, BaseConverter):
             self.logger.info("Try to use your own converter")
             self.converter = converter
         else:
-            raise NotImplementedError("Please specify converter by selecting (exact|fuzzy|dnorm) or creating your own converter inheriting BaseConverter")
+            raise NotImplementedError("Please specify converter by selecting (exact|fuzzy|bigram|dnorm|cascade) or creating your own converter inheriting BaseConverter")
 
-    def load_manbyo_dict(self):
-        """Load manbyo dict
+        if instrumentation is not None:
+            self.instrumentation = instrumentation
+
+    def preprocess_dictionary(self, names, n_jobs=1, chunk_size=None):
+        """Preprocess names of the manbyo dictionary
+
+        Only the first result of the pipeline is used for the dictionary,
+        so it is made by preprocess_identity without expanding the other variants (e.g. abbreviations).
+
+        Args:
+            names List[str]: names of the manbyo dictionary
+            n_jobs int: number of worker processes (1 runs in this process)
+            chunk_size int: number of names sent to a worker at once (default: 4 chunks per worker)
+
+        Returns:
+            List[str]: preprocessed names, the same as [preprocess(name)[0] for name in names]
+        """
+        start = time.perf_counter()
+        if n_jobs > 1 and len(names) > 0:
+            if chunk_size is None:
+                chunk_size = (len(names) + n_jobs * 4 - 1) // (n_jobs * 4)
+            chunks = [names[i:i+chunk_size] for i in range(0, len(names), chunk_size)]
+            with multiprocessing.Pool(n_jobs, initializer=_init_worker, initargs=(self.preprocessor,)) as pool:
+                results = [name for chunk in pool.map(_preprocess_chunk, chunks) for name in chunk]
+        else:
+            results = [self.preprocessor.preprocess_identity(name) for name in names]
+        self.dict_preprocess_time = time.perf_counter() - start
+        self.logger.info("Preprocessed %s entries in %.3f s with %s process(es)", len(names), self.dict_preprocess_time, max(n_jobs, 1))
+        return results
+
+    @property
+    def preprocessor(self):
+        return self._preprocessor
+
+    @preprocessor.setter
+    def preprocessor(self, preprocessor):
+        # results of the converter do not depend on the preprocessor
+        self._preprocessor = preprocessor
+        if self._instrumentation is not None:
+            preprocessor.instrumentation = self._instrumentation
+        if self.result_cache is not None:
+            self.result_cache.clear()
+
+    @property
+    def manbyo_dict(self):
+        return self._manbyo_dict
+
+    @manbyo_dict.setter
+    def manbyo_dict(self, manbyo_dict):
+        self._manbyo_dict = manbyo_dict
+        self.clear_result_cache()
+
+    @property
+    def converter(self):
+        return self._converter
+
+    @converter.setter
+    def converter(self, converter):
+        self._converter = converter
+        if self._instrumentation is not None:
+            converter.instrumentation = self._instrumentation
+        self.clear_result_cache()
+
+    @property
+    def instrumentation(self):
+        return self._instrumentation
+
+    @instrumentation.setter
+    def instrumentation(self, instrumentation):
+        self._instrumentation = instrumentation
+        self.preprocessor.instrumentation = instrumentation
+        self.converter.instrumentation = instrumentation
+
+    def clear_result_cache(self):
+        """Remove all entries of the result cache"""
+        if self.result_cache is not None:
+            self.result_cache.clear()
+            self.variant_cache.clear()
+
+    def cache_stats(self):
+        """Statistics of the result cache
+
+        Returns:
+            Dict[str, Dict[str, int]]: statistics of result cache and variant cache (empty if disabled)
+        """
+        if self.result_cache is None:
+            return {}
+        return {"result": self.result_cache.stats(), "variant": self.variant_cache.stats()}
+
+    @property
+    def staged(self):
+        """Whether the converter reports the stage that answered (CascadeConverter)"""
+        return isinstance(self.converter, cascade_converter.CascadeConverter)
+
+    def rank(self, result):
+        """Key to choose the best result among preprocessed names
+
+        Args:
+            result Tuple[DictEntry, float, int]: result of convert (with the stage if staged)
+
+        Returns:
+            Union[float, Tuple[int, float]]: score, or (earliness of the stage, score) if staged
+        """
+        if self.staged:
+            stage = result[2]
+            return (-stage if stage >= 0 else -len(self.converter.converters), result[1])
+        return result[1]
+
+    def call_converter(self, word):
+        if self.staged:
+            return self.converter.convert_with_stage(word)
+        return self.converter.convert(word)
+
+    def call_converter_batch(self, words):
+        if self.staged:
+            return self.converter.convert_batch_with_stage(words)
+        return self.converter.convert_batch(words)
+
+    def convert(self, word):
+        """Convert preprocessed name by the converter through the variant cache
+
+        Args:
+            word str: preprocessed disease name
+
+        Returns:
+            Tuple[DictEntry, float]: result of the converter (and the stage that answered if staged)
+        """
+        instrumentation = self._instrumentation
+        if self.variant_cache is not None:
+            result = self.variant_cache.get(word)
+            if instrumentation is not None:
+                instrumentation.count("variant_cache.hits" if result is not None else "variant_cache.misses")
+            if result is not None:
+                return result
+
+        if instrumentation is None:
+            result = self.call_converter(word)
+        else:
+            start = time.perf_counter()
+            result = self.call_converter(word)
+            instrumentation.record("convert." + type(self.converter).__name__, time.perf_counter() - start)
+        if self.variant_cache is not None:
+            self.variant_cache.put(word, result)
+        return result
+
+    def convert_variants(self, variants):
+        """Convert preprocessed names by one convert_batch call through the variant cache
+
+        Duplicate names and names found in the variant cache are not converted again.
+
+        Args:
+            variants List[str]: preprocessed disease names
+
+        Returns:
+            Dict[str, Tuple[DictEntry, float]]: preprocessed name to the result of the converter
+                (and the stage that answered if staged)
+        """
+        # 同じ前処理結果は一度だけ変換する
+        results = {}
+        for variant in variants:
+            if variant in results:
+                continue
+            results[variant] = self.variant_cache.get(variant) if self.variant_cache is not None else None
+        variants = [variant for variant, result in results.items() if result is None]
+        instrumentation = self._instrumentation
+        if instrumentation is not None and self.variant_cache is not None:
+            instrumentation.count("variant_cache.hits", len(results) - len(variants))
+            instrumentation.count("variant_cache.misses", len(variants))
+        if len(variants) > 0:
+            if instrumentation is None:
+                converted = self.call_converter_batch(variants)
+            else:
+                start = time.perf_counter()
+                converted = self.call_converter_batch(variants)
+                instrumentation.record("convert_batch." + type(self.converter).__name__, time.perf_counter() - start)
+            for variant, result in zip(variants, converted):
+                results[variant] = result
+                if self.variant_cache is not None:
+                    self.variant_cache.put(variant, result)
+        return results
+
+    def uses_dnorm(self, name):
+        """Whether the pre-defined converter uses the dnorm model
+
+        Args:
+            name str: name of the converter (exact|fuzzy|bigram|dnorm|cascade)
+
+        Returns:
+            bool: True for dnorm and cascade with a dnorm stage
+        """
+        if name == "cascade":
+            stages = self.cascade_stages if self.cascade_stages is not None else cascade_converter.DEFAULT_STAGES
+            return any(stage == "dnorm" for stage, _ in stages)
+        return name == "dnorm"
+
+    def build_converter(self, name):
+        """Build pre-defined converter over the manbyo dictionary
+
+        Args:
+            name str: name of the converter (exact|fuzzy|bigram|dnorm|cascade)
+
+        Returns:
+            BaseConverter: converter
+        """
+        if name == "exact":
+            return exact_matcher.ExactMatchConverter(self.manbyo_dict)
+        elif name == "fuzzy":
+            return fuzzy_matcher.FuzzyMatchConverter(self.manbyo_dict)
+        elif name == "bigram":
+            return bigram_matcher.BigramMatchConverter(self.manbyo_dict)
+        elif name == "dnorm":
+            return dnorm_converter.DNormConverter(self.manbyo_dict)
+        elif name == "cascade":
+            return cascade_converter.CascadeConverter(self.manbyo_dict, self.cascade_stages)
+        else:
+            raise NotImplementedError("Please specify converter by selecting (exact|fuzzy|bigram|dnorm|cascade)")
+
+    def get_manbyo_path(self):
+        """Get path of the manbyo dict
 
         This method create cache folder and download the manbyo dictionary.
         You can specify cache folder by setting environment variable "DEFAULT_CACHE_PATH"
+
+        Returns:
+            Path: path of MANBYO_SABC.csv
         """
         DEFAULT_CACHE_PATH = os.getenv("DEFAULT_CACHE_PATH", "~/.cache")
         DEFAULT_MANBYO_PATH = Path(os.path.expanduser(
@@ -82,30 +382,162 @@ class Normalizer(object):
             self.logger.info("Downloading manbyo dictionary from %s to %s", BASE_URL, str(DEFAULT_MANBYO_PATH / "MANBYO_SABC.csv"))
             utils.download_fileobj(BASE_URL, DEFAULT_MANBYO_PATH / "MANBYO_SABC.csv")
 
-        manbyo_dict = utils.load_dict(DEFAULT_MANBYO_PATH / "MANBYO_SABC.csv")
+        return DEFAULT_MANBYO_PATH / "MANBYO_SABC.csv"
+
+    def load_manbyo_dict(self):
+        """Load manbyo dict
+
+        This method create cache folder and download the manbyo dictionary.
+        You can specify cache folder by setting environment variable "DEFAULT_CACHE_PATH"
+
+        Returns:
+            DictionaryStore: manbyo dictionary
+        """
+        manbyo_dict = DictionaryStore.from_csv(self.get_manbyo_path())
         return manbyo_dict
 
-    def normalize(self, word):
+    def normalize(self, word, return_score=False):
         """Normalize disease name
 
         We choose entry with maximum score if there are more than one entry that preprocessor creates (e.g. disambiguation of abbreviation expansion)
+        Duplicate preprocessed names are converted once.
+        If the converter has perfect_score, preprocessed names are converted in order until one reaches it
+        (at the first stage if the converter is a CascadeConverter).
+        Otherwise, all preprocessed names are converted by one convert_batch call.
+
+        Args:
+            word str: target disease name
+            return_score bool: whether to return the score of the converter with the entry
+
+        Returns:
+            Union[DictEntry, Tuple[DictEntry, float]]: linked entry of input disease name (and its score)
+        """
+        self.logger.info("Input disease name: %s", word)
+        instrumentation = self._instrumentation
+        if instrumentation is not None:
+            start = time.perf_counter()
+            instrumentation.count("normalize.inputs")
+        if self.result_cache is not None:
+            cached = self.result_cache.get(word)
+            if instrumentation is not None:
+                instrumentation.count("result_cache.hits" if cached is not None else "result_cache.misses")
+            if cached is not None:
+                if instrumentation is not None:
+                    instrumentation.record("normalize", time.perf_counter() - start)
+                return cached if return_score else cached[0]
+
+        preprocessed_words = self.preprocessor.preprocess(word)
+        self.logger.info("Preprocessed disease name: %s", str(preprocessed_words))
+        # 同じ前処理結果は一度だけ変換する
+        variants = list(dict.fromkeys(preprocessed_words))
+        if instrumentation is not None:
+            instrumentation.count("normalize.variants", len(variants))
+        perfect_score = self.converter.perfect_score
+        if perfect_score is None and len(variants) > 1:
+            results = self.convert_variants(variants)
+            scored = (results[variant] for variant in variants)
+        else:
+            scored = (self.convert(variant) for variant in variants)
+
+        if perfect_score is not None:
+            perfect_key = (0, perfect_score) if self.staged else perfect_score
+        best, best_key = (None, -float('inf')), None
+        for n_scored, result in enumerate(scored, 1):
+            key = self.rank(result)
+            if best_key is None or key > best_key:
+                best, best_key = result, key
+            if perfect_score is not None and key >= perfect_key:
+                # no other preprocessed name can have a higher score
+                if instrumentation is not None and n_scored < len(variants):
+                    instrumentation.count("normalize.early_exit")
+                break
+        max_word, max_score = best[0], best[1]
+
+        if self.result_cache is not None:
+            self.result_cache.put(word, (max_word, max_score))
+        if instrumentation is not None:
+            instrumentation.record("normalize", time.perf_counter() - start)
+        return (max_word, max_score) if return_score else max_word
+
+    def normalize_topk(self, word, k=10):
+        """Normalize disease name into the k best candidates
+
+        Candidates of all entries that preprocessor creates are merged.
+        If the same dictionary name is found from more than one preprocessed name, the maximum score is used.
+        As in normalize, candidates are ranked by the stage that answered and then by score if staged.
+        The result cache is not used.
 
         Args:
             word str: target disease name
+            k int: maximum number of candidates
 
         Returns:
-            DictEntry: linked entry of input disease name
+            List[Tuple[DictEntry, float]]: candidate entries and their scores sorted in descending order of score
         """
         self.logger.info("Input disease name: %s", word)
         preprocessed_words = self.preprocessor.preprocess(word)
         self.logger.info("Preprocessed disease name: %s", str(preprocessed_words))
-        max_score = -float('inf')
-        max_word = None
-        for preprocessed_word in preprocessed_words:
-            result, sim = self.converter.convert(preprocessed_word)
-            if max_word is None or sim > max_score:
-                max_score = sim
-                max_word = result
 
-        return max_word
+        candidates = {}
+        for preprocessed_word in dict.fromkeys(preprocessed_words):
+            if self.staged:
+                results = self.converter.convert_topk_with_stage(preprocessed_word, k)
+            else:
+                results = self.converter.convert_topk(preprocessed_word, k)
+            for result in results:
+                name = result[0].name
+                if name not in candidates or self.rank(result) > self.rank(candidates[name]):
+                    candidates[name] = result
+
+        return [(result[0], result[1]) for result in heapq.nlargest(k, candidates.values(), key=self.rank)]
+
+    def normalize_batch(self, words, return_score=False):
+        """Normalize list of disease names
+
+        All preprocessed names of all words are converted by one convert_batch call of the converter.
+        As in normalize, we choose entry with maximum score (at the earliest stage if staged) for each word.
+        Words and preprocessed names found in the result cache are not converted again.
+
+        Args:
+            words List[str]: target disease names
+            return_score bool: whether to return the score of the converter with each entry
+
+        Returns:
+            Union[List[DictEntry], List[Tuple[DictEntry, float]]]: linked entries of input disease names (and their scores)
+                in the same order as words
+        """
+        self.logger.info("Input %s disease names", len(words))
+        instrumentation = self._instrumentation
+        if instrumentation is not None:
+            start = time.perf_counter()
+            instrumentation.count("normalize.inputs", len(words))
+        outputs = [None] * len(words)
+        if self.result_cache is not None:
+            outputs = [self.result_cache.get(word) for word in words]
+        targets = [idx for idx, output in enumerate(outputs) if output is None]
+        if instrumentation is not None and self.result_cache is not None:
+            instrumentation.count("result_cache.hits", len(words) - len(targets))
+            instrumentation.count("result_cache.misses", len(targets))
+        preprocessed_words = {idx: self.preprocessor.preprocess(words[idx]) for idx in targets}
+
+        results = self.convert_variants(
+            [variant for variants in preprocessed_words.values() for variant in variants]
+        )
+        if instrumentation is not None:
+            instrumentation.count("normalize.variants", len(results))
+
+        for idx in targets:
+            best, best_key = (None, -float('inf')), None
+            for variant in preprocessed_words[idx]:
+                key = self.rank(results[variant])
+                if best_key is None or key > best_key:
+                    best, best_key = results[variant], key
+            outputs[idx] = (best[0], best[1])
+            if self.result_cache is not None:
+                self.result_cache.put(words[idx], outputs[idx])
 
+        if instrumentation is not None:
+            instrumentation.record("normalize_batch", time.perf_counter() - start)
+        if return_score:
+            return outputs
+        return [output[0] for output in outputs]
@@ -5,6 +5,9 @@ This module expands abbreviation by using abbreviation dictionary.
 import os
 import re
 import json
+import heapq
+import hashlib
+import itertools
 from pathlib import Path
 from dataclasses import dataclass
 
@@ -14,6 +17,11 @@ from .. import utils
 
 BASE_URL = "http://aoi.naist.jp/norm/abb_dic.json"
 
+# run of Latin letters (and spaces between them)
+LATIN_RUN = re.compile(r'([a-zA-Z][a-zA-Z\s]*)')
+# key of the node in AbbrTrie that holds the abbreviations ending at the node
+TERMINAL = ""
+
 
 @dataclass
 class AbbrEntry:
@@ -29,65 +37,252 @@ class AbbrEntry:
     freq: int
 
 
+class AbbrTrie(object):
+    """Trie of abbreviations with case-folded keys
+
+    Args:
+        abbrs List[str]: abbreviations
+
+    Attributes:
+        root dict: nested dict of characters. node[TERMINAL] is the list of abbreviations ending at the node.
+    """
+    def __init__(self, abbrs):
+        self.root = {}
+        for abbr in abbrs:
+            node = self.root
+            for char in abbr.casefold():
+                node = node.setdefault(char, {})
+            node.setdefault(TERMINAL, []).append(abbr)
+
+    def find(self, text):
+        """Find abbreviations in a run of Latin letters
+
+        Matches start and end at word boundaries (the ends of the text or a non-letter character),
+        and the longest match is taken at each start position. The text is scanned once from left to right.
+
+        Args:
+            text str: run of Latin letters and spaces
+
+        Returns:
+            List[Tuple[int, int, List[str]]]: start, end and the abbreviations of each match
+        """
+        folded = text.casefold()
+        if len(folded) != len(text):
+            return []
+
+        matches = []
+        i = 0
+        while i < len(text):
+            if i > 0 and text[i-1].isalpha():
+                i += 1
+                continue
+
+            node = self.root
+            best = None
+            j = i
+            while j < len(folded) and folded[j] in node:
+                node = node[folded[j]]
+                j += 1
+                if TERMINAL in node and (j == len(text) or not text[j].isalpha()):
+                    best = (i, j, node[TERMINAL])
+
+            if best is not None:
+                matches.append(best)
+                i = best[1]
+            else:
+                i += 1
+        return matches
+
+
 class AbbrPreprocessor(BasePreprocessor):
     """Abbreviation prerpocessor
 
+    Expanded forms are generated lazily in descending order of their probability.
+    The probability of an expansion is its freq divided by the sum of freq of the abbreviation,
+    keeping the abbreviation as it is has probability 1, and the probability of an expanded form is
+    the product over all abbreviations in the word. So the input without expansion always comes first.
+
+    Abbreviations are found by AbbrTrie in each run of Latin letters: the whole run,
+    or the longest abbreviations between word boundaries inside the run (e.g. "COPD" and "AML" in "COPD AML").
+    Matching is case-insensitive, and the abbreviation with the same case as the input is preferred.
+
+    Args:
+        max_candidates int: maximum number of expanded forms of one word (None: no limit)
+        beam_width int: maximum number of expansions considered for each abbreviation (None: no limit)
+        abbr_dict Dict[str, List[AbbrEntry]]: abbreviation dictionary. If None, it is loaded by load_abbr_dict.
+
     Attributes:
         abbr_dict Dict[List[AbbrEntry]]: entry of abbriviation
+        trie AbbrTrie: trie of the keys of abbr_dict
+        expansions Dict[str, List[Tuple[str, float]]]: expansions of each key in descending order of probability
     """
-    def __init__(self):
-        self.abbr_dict = self.load_abbr_dict()
+    def __init__(self, max_candidates=None, beam_width=None, abbr_dict=None):
+        self.abbr_dict = abbr_dict if abbr_dict is not None else self.load_abbr_dict()
+        self.max_candidates = max_candidates
+        self.beam_width = beam_width
+        self.build_trie()
+
+    def build_trie(self):
+        """Build trie and expansion probabilities of abbr_dict. Call this again if you modify abbr_dict."""
+        self.trie = AbbrTrie(self.abbr_dict.keys())
+        self.expansions = {key: self.expansion_probs(entries) for key, entries in self.abbr_dict.items()}
 
     def preprocess(self, word):
         """Expand abbreviation
 
-        Because of the ambiguation of abbreviation, we return all of the expanded forms of the abbreviation.
+        Because of the ambiguation of abbreviation, we return the expanded forms of the abbreviation
+        (at most max_candidates) in descending order of probability.
         All expanded forms will be scored by the converter and choose one with muximum score.
 
         Args:
             word str: disease name
 
         Returns:
-            List[str]: all possible names
+            List[str]: possible names
+        """
+        return list(itertools.islice(self.expand(word), self.max_candidates))
+
+    def preprocess_identity(self, word):
+        """Get the form without expansion (the first result of preprocess)
+
+        Each Latin run is only stripped, so the trie and the expansions are not used.
+
+        Args:
+            word str: disease name
+
+        Returns:
+            str: the same string as preprocess(word)[0]
+        """
+        word = jaconv.z2h(word, kana=False, ascii=True, digit=True)
+        return LATIN_RUN.sub(lambda m: m.group(1).strip(), word)
+
+    def split(self, word):
+        """Split word into fixed strings and abbreviations
+
+        Args:
+            word str: disease name
+
+        Returns:
+            List[List[Tuple[str, float]]]: options of each part with their probability.
+                Fixed strings have one option, and abbreviations have the abbreviation itself
+                followed by the expansions in descending order of probability.
         """
         word = jaconv.z2h(word, kana=False, ascii=True, digit=True)
-        iters = re.finditer(r'([a-zA-Z][a-zA-Z\s]*)', word)
 
         pos = 0
-        output_words = []
-        for ite in iters:
+        parts = []
+        for ite in LATIN_RUN.finditer(word):
             s_pos, e_pos = ite.span()
-            abbr = ite.groups()[0].strip()
+            run = ite.group(1).strip()
 
             if pos != s_pos:
-                output_words.append(word[pos:s_pos])
+                parts.append([(word[pos:s_pos], 1.0)])
 
-            s_word = [abbr]
-            if abbr in self.abbr_dict:
-                s_word += [w.name for w in self.abbr_dict[abbr]]
-            elif word.lower() in self.abbr_dict:
-                s_word += [w.name for w in self.abbr_dict[abbr.lower()]]
-
-            output_words.append(s_word)
+            run_pos = 0
+            for start, end, abbrs in self.trie.find(run):
+                if run_pos != start:
+                    parts.append([(run[run_pos:start], 1.0)])
+                abbr = run[start:end]
+                expansions = self.expansions[self.resolve(abbr, abbrs)]
+                parts.append([(abbr, 1.0)] + expansions[:self.beam_width])
+                run_pos = end
+            if run_pos != len(run):
+                parts.append([(run[run_pos:], 1.0)])
             pos = e_pos
 
-        output_words.append(word[pos:])
+        parts.append([(word[pos:], 1.0)])
+        return parts
+
+    def resolve(self, abbr, abbrs):
+        """Choose dictionary key among the keys with the same case-folded form
 
-        def flatten_words(word_list):
-            if len(word_list) == 0:
-                return [[]]
+        Args:
+            abbr str: abbreviation in the input
+            abbrs List[str]: keys of abbr_dict matched case-insensitively
 
-            if isinstance(word_list[0], str):
-                results = [[word_list[0]] + l for l in flatten_words(word_list[1:])]
-            elif isinstance(word_list[0], list):
-                results = [[w] + l for w in word_list[0] for l in flatten_words(word_list[1:])]
-            return results
+        Returns:
+            str: the key with the same case as the input, the lowercase key, or the first key
+        """
+        if abbr in self.abbr_dict:
+            return abbr
+        if abbr.lower() in self.abbr_dict:
+            return abbr.lower()
+        return abbrs[0]
 
-        results = flatten_words(output_words)
-        results = [''.join(l) for l in results]
-        #results = [jaconv.h2z(r, kana=True, digit=True, ascii=True) for r in results]
+    def expansion_probs(self, entries):
+        """Probability of each expansion of an abbreviation
 
-        return results
+        Args:
+            entries List[AbbrEntry]: expansions of the abbreviation
+
+        Returns:
+            List[Tuple[str, float]]: expanded names and p(expansion) = freq / sum of freq, in descending order
+        """
+        total = sum(max(entry.freq, 0) for entry in entries)
+        if total > 0:
+            expansions = [(entry.name, max(entry.freq, 0) / total) for entry in entries]
+        else:
+            expansions = [(entry.name, 1.0 / len(entries)) for entry in entries]
+        # stable sort keeps the order of the dictionary for the same freq
+        expansions.sort(key=lambda x: -x[1])
+        return expansions
+
+    def expand(self, word):
+        """Generate expanded forms of the word lazily
+
+        Combinations of the options of each abbreviation are enumerated best-first with a heap.
+        Each combination is pushed once, from the combination whose last increased option is one step back,
+        so the heap holds at most (number of abbreviations) entries per generated form,
+        and only the forms that the caller consumes are built, also when max_candidates is None.
+        Forms with the same probability are generated in the order of the options.
+
+        Args:
+            word str: disease name
+
+        Yields:
+            str: expanded form in descending order of probability
+        """
+        parts = self.split(word)
+        # only abbreviations have more than one option
+        slots = [i for i, part in enumerate(parts) if len(part) > 1]
+        texts = [part[0][0] for part in parts]
+        if len(slots) == 0:
+            yield ''.join(texts)
+            return
+
+        options = [parts[i] for i in slots]
+
+        def probability(indices):
+            prob = 1.0
+            for option, idx in zip(options, indices):
+                prob *= option[idx][1]
+            return prob
+
+        start = tuple(0 for _ in slots)
+        heap = [(-probability(start), start)]
+        while len(heap) > 0:
+            _, indices = heapq.heappop(heap)
+            for slot, option, idx in zip(slots, options, indices):
+                texts[slot] = option[idx][0]
+            yield ''.join(texts)
+
+            # increase only slots at or after the last increased slot so that each combination is pushed once
+            last = 0
+            for i, idx in enumerate(indices):
+                if idx > 0:
+                    last = i
+            for i in range(last, len(slots)):
+                if indices[i] + 1 < len(options[i]):
+                    child = indices[:i] + (indices[i] + 1,) + indices[i+1:]
+                    heapq.heappush(heap, (-probability(child), child))
+
+    def dict_hash(self):
+        """Hash of the contents of abbr_dict
+
+        Returns:
+            str: hex digest that changes when abbr_dict changes
+        """
+        return hashlib.sha1(repr(sorted(self.abbr_dict.items(), key=lambda item: item[0])).encode("utf-8")).hexdigest()
 
     def load_abbr_dict(self):
         """Load abbreviation dictionary
@@ -4,3 +4,16 @@ class BasePreprocessor(metaclass=ABCMeta):
     @abstractmethod
     def preprocess(self):
         pass
+
+    def preprocess_identity(self, word):
+        """Get the first result of preprocess
+
+        Override this method if the first result can be made without creating the others.
+
+        Args:
+            word str: disease name
+
+        Returns:
+            str: the same string as preprocess(word)[0]
+        """
+        return self.preprocess(word)[0]
@@ -0,0 +1,144 @@
+"""Fused preprocessor
+
+FusedPreprocessor runs a chain of built-in 1-to-1 preprocessors (identical|fullwidth|NFKC) in one str.translate call.
+The result of the chain for each character is computed on first use and kept in the translation table.
+
+The chain can be applied per character only when no character interacts with its neighbors:
+- NFKC composes a character with the preceding one if its decomposition starts with
+  a non-starter (combining character, e.g. U+3099 from half-width dakuten U+FF9E)
+  or with a composition secondary (e.g. Hangul vowel and trailing jamo).
+- fullwidth (jaconv.h2z) joins half-width kana with the following half-width dakuten or handakuten (U+FF9E, U+FF9F).
+Such characters are not put in the table, and words containing them are processed stage by stage as before.
+"""
+import unicodedata
+
+from .base_preprocessor import BasePreprocessor
+from .basic_preprocessor import (
+    IdenticalPreprocessor,
+    FullWidthPreprocessor,
+    NFKCPreprocessor,
+)
+
+FUSABLE_PREPROCESSORS = (IdenticalPreprocessor, FullWidthPreprocessor, NFKCPreprocessor)
+HALFWIDTH_SOUND_MARKS = {"ﾞ", "ﾟ"}
+
+_composition_secondaries = None
+
+
+def composition_secondaries():
+    """Characters that can be the second character of a canonical composition
+
+    Returns:
+        Set[str]: second characters of all canonical decompositions into two characters and Hangul vowel and trailing jamo
+    """
+    global _composition_secondaries
+    if _composition_secondaries is None:
+        secondaries = set()
+        for code in range(0x110000):
+            decomposition = unicodedata.decomposition(chr(code))
+            if decomposition and not decomposition.startswith("<"):
+                chars = decomposition.split()
+                if len(chars) == 2:
+                    secondaries.add(chr(int(chars[1], 16)))
+        # Hangul syllables are composed algorithmically
+        secondaries.update(chr(code) for code in range(0x1161, 0x1176))
+        secondaries.update(chr(code) for code in range(0x11a8, 0x11c3))
+        _composition_secondaries = secondaries
+    return _composition_secondaries
+
+
+def composes_with_previous(char):
+    """Check whether NFKC can join the character with the preceding one
+
+    Args:
+        char str: one character
+
+    Returns:
+        bool: whether the decomposition of the character starts with a non-starter or a composition secondary
+    """
+    first = unicodedata.normalize("NFKD", char)[:1]
+    if first == "":
+        return False
+    return unicodedata.combining(first) != 0 or first in composition_secondaries()
+
+
+def is_local(preprocessor, text):
+    """Check whether the preprocessor gives the same result for the text as a part of a longer string
+
+    Args:
+        preprocessor BasePreprocessor: built-in 1-to-1 preprocessor
+        text str: result of the previous stages for one character
+
+    Returns:
+        bool: whether the preprocessor can be applied to the text independently of its neighbors
+    """
+    if isinstance(preprocessor, NFKCPreprocessor):
+        return not any(composes_with_previous(char) for char in text)
+    if isinstance(preprocessor, FullWidthPreprocessor):
+        return not any(char in HALFWIDTH_SOUND_MARKS for char in text)
+    return True
+
+
+class NotLocal(Exception):
+    """Raised by TranslationTable for characters that depend on their neighbors"""
+
+
+class TranslationTable(dict):
+    """Lazy translation table of str.translate
+
+    Args:
+        preprocessors List[BasePreprocessor]: chain of built-in 1-to-1 preprocessors
+    """
+    def __init__(self, preprocessors):
+        super().__init__()
+        self.preprocessors = preprocessors
+
+    def __missing__(self, code):
+        text = chr(code)
+        for preprocessor in self.preprocessors:
+            if not is_local(preprocessor, text):
+                raise NotLocal()
+            text = preprocessor.preprocess(text)[0]
+        self[code] = text
+        return text
+
+
+class FusedPreprocessor(BasePreprocessor):
+    """Chain of built-in 1-to-1 preprocessors fused into one translation
+
+    The result is the same as applying the preprocessors in order.
+
+    Args:
+        preprocessors List[BasePreprocessor]: built-in 1-to-1 preprocessors (identical|fullwidth|NFKC)
+
+    Attributes:
+        table TranslationTable: result of the chain for each character seen so far
+    """
+    def __init__(self, preprocessors):
+        for preprocessor in preprocessors:
+            if type(preprocessor) not in FUSABLE_PREPROCESSORS:
+                raise NotImplementedError("Only identical, fullwidth and NFKC preprocessors can be fused")
+        self.preprocessors = preprocessors
+        self.table = TranslationTable(preprocessors)
+
+    def convert(self, word):
+        """Apply the chain to the word
+
+        Args:
+            word str: disease name
+
+        Returns:
+            str: preprocessed disease name
+        """
+        try:
+            return word.translate(self.table)
+        except NotLocal:
+            for preprocessor in self.preprocessors:
+                word = preprocessor.preprocess(word)[0]
+            return word
+
+    def preprocess(self, word):
+        return [self.convert(word)]
+
+    def preprocess_identity(self, word):
+        return self.convert(word)
@@ -2,6 +2,7 @@
 
 This module merge some preprocessor into one pipeline system.
 """
+import time
 
 from .base_preprocessor import BasePreprocessor
 from .abbr_preprocessor import AbbrPreprocessor
@@ -10,6 +11,7 @@ from .basic_preprocessor import (
     FullWidthPreprocessor,
     NFKCPreprocessor,
 )
+from .compiled import FusedPreprocessor, FUSABLE_PREPROCESSORS
 
 class PreprocessorPipeline(object):
     """Pipeline of preprocessor
@@ -17,15 +19,31 @@ class PreprocessorPipeline(object):
     You can create pipeline of preprocessor using pre-defined preprocessor (identical|fullwidth|NFKC|abbr)
     or your own preprocessor inherited BasePreprocessor.
 
+    With compiled=True, each run of consecutive built-in 1-to-1 preprocessors (identical|fullwidth|NFKC)
+    is fused into one FusedPreprocessor that translates each word in a single pass,
+    and the list of results fans out only at the other preprocessors (e.g. AbbrPreprocessor).
+    The results are the same as without compiling.
+
     Args:
         preprocessors List[Union[str, BasePreprocessor]]: list of preprocessor
+        compiled bool: whether to fuse built-in 1-to-1 preprocessors
+
+    Attributes:
+        pipelines List[BasePreprocessor]: preprocessors applied in order
+        config List[str]: name of each preprocessor (class path for your own preprocessor)
+        stages List[BasePreprocessor]: preprocessors actually applied (pipelines after fusing)
+        instrumentation Instrumentation: collector of the time of each stage and the number of variants (None disables it)
     """
-    def __init__(self, preprocessors):
+    instrumentation = None
+
+    def __init__(self, preprocessors, compiled=False):
         self.pipelines = []
+        self.config = []
 
         for preprocessor in preprocessors:
             if isinstance(preprocessor, BasePreprocessor):
                 self.pipelines.append(preprocessor)
+                self.config.append(type(preprocessor).__module__ + "." + type(preprocessor).__qualname__)
             elif isinstance(preprocessor, str):
                 if preprocessor == "identical":
                     self.pipelines.append(IdenticalPreprocessor())
@@ -37,9 +55,40 @@ class PreprocessorPipeline(object):
                     self.pipelines.append(AbbrPreprocessor())
                 else:
                     raise NotImplementedError("If you want to use pre-defined preprocessor, please select one from (identical|fullwidth|NFKC)")
+                self.config.append(preprocessor)
             else:
                 raise NotImplementedError("Please specify str or BasePreprocessor instance")
 
+        self.compiled = compiled
+        self.stages = self.compile() if compiled else self.pipelines
+
+    def resource_hashes(self):
+        """Hashes of the resources that the preprocessors load (abbreviation dictionaries)
+
+        Returns:
+            List[str]: hash of each resource in the order of the preprocessors
+        """
+        return [preprocessor.dict_hash() for preprocessor in self.pipelines if isinstance(preprocessor, AbbrPreprocessor)]
+
+    def compile(self):
+        """Fuse runs of built-in 1-to-1 preprocessors
+
+        Returns:
+            List[BasePreprocessor]: stages to apply in order
+        """
+        stages = []
+        fusable = []
+        for preprocessor in self.pipelines + [None]:
+            if preprocessor is not None and type(preprocessor) in FUSABLE_PREPROCESSORS:
+                fusable.append(preprocessor)
+                continue
+            if len(fusable) > 0:
+                stages.append(FusedPreprocessor(fusable))
+                fusable = []
+            if preprocessor is not None:
+                stages.append(preprocessor)
+        return stages
+
     def preprocess(self, word):
         """Perform all preprocess
 
@@ -51,9 +100,44 @@ class PreprocessorPipeline(object):
         Returns:
             List[str]: all preprocessed disease names
         """
+        if self.instrumentation is not None:
+            return self.preprocess_instrumented(word)
+
         results = [word]
-        for preprocessor in self.pipelines:
-            results = [preprocessor.preprocess(w) for w in results]
-            results = [w for ww in results for w in ww]
+        for preprocessor in self.stages:
+            results = self.apply_stage(preprocessor, results)
+        return results
 
+    def preprocess_instrumented(self, word):
+        instrumentation = self.instrumentation
+        start = time.perf_counter()
+        results = [word]
+        for preprocessor in self.stages:
+            stage_start = time.perf_counter()
+            results = self.apply_stage(preprocessor, results)
+            instrumentation.record("preprocess." + type(preprocessor).__name__, time.perf_counter() - stage_start)
+        instrumentation.record("preprocess", time.perf_counter() - start)
+        instrumentation.count("preprocess.variants", len(results))
         return results
+
+    @staticmethod
+    def apply_stage(preprocessor, words):
+        if isinstance(preprocessor, FusedPreprocessor):
+            return [preprocessor.convert(w) for w in words]
+        return [w for r in words for w in preprocessor.preprocess(r)]
+
+    def preprocess_identity(self, word):
+        """Get the first preprocessed name without creating the others
+
+        The first result of the pipeline is the first result of each preprocessor applied in order,
+        so expansions such as abbreviations are skipped.
+
+        Args:
+            word str: disease name
+
+        Returns:
+            str: the same string as preprocess(word)[0]
+        """
+        for preprocessor in self.stages:
+            word = preprocessor.preprocess_identity(word)
+        return word
@@ -0,0 +1,343 @@
+"""HTTP/JSON normalization server
+
+NormalizationServer shares one Normalizer among the clients over HTTP, using only the standard library (asyncio).
+Concurrent requests are coalesced into micro-batches: a batch is closed when it has max_batch_size names
+or max_wait seconds have passed since its first request, and it is normalized by one normalize_batch call
+in an executor, so the event loop keeps accepting requests while the converter runs.
+
+Endpoints:
+    POST /normalize  {"text": "AML"} -> {"input": "AML", "name": ..., "icd": ..., "norm": ..., "level": ..., "score": ...}
+                     {"texts": ["AML", ...]} -> {"results": [{...}, ...]}
+    GET /metrics     number of requests, batch sizes and latencies
+    GET /health      {"status": "ok"}
+
+Usage:
+    japanese-disease-normalizer-server --port 8080 --max-batch-size 64 --max-wait-ms 5
+"""
+import sys
+import json
+import time
+import asyncio
+import argparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from .cli import OUTPUT_FIELDS, normalize_chunk
+from .normalizer import Normalizer
+
+STATUS_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 500: "Internal Server Error"}
+
+
+def percentile(values, q):
+    """Percentile by the nearest-rank method
+
+    Args:
+        values List[float]: sorted values
+        q float: percentile (0-100)
+
+    Returns:
+        float: percentile of the values (None if empty)
+    """
+    if len(values) == 0:
+        return None
+    rank = max(int(-(-q * len(values) // 100)), 1)
+    return values[rank - 1]
+
+
+class ServerMetrics(object):
+    """Metrics of NormalizationServer
+
+    Latencies and batch sizes of the most recent requests and batches are kept for the percentiles.
+
+    Args:
+        window int: number of recent latencies and batch sizes to keep
+
+    Attributes:
+        requests int: number of normalize requests answered
+        names int: number of names normalized
+        errors int: number of requests answered with an error
+        batches int: number of batches
+    """
+    def __init__(self, window=10000):
+        self.requests = 0
+        self.names = 0
+        self.errors = 0
+        self.batches = 0
+        self.max_batch_size = 0
+        self.latencies = deque(maxlen=window)
+        self.batch_sizes = deque(maxlen=window)
+        self.batch_times = deque(maxlen=window)
+
+    def record_request(self, n_names, latency):
+        self.requests += 1
+        self.names += n_names
+        self.latencies.append(latency)
+
+    def record_batch(self, size, elapsed):
+        self.batches += 1
+        self.max_batch_size = max(self.max_batch_size, size)
+        self.batch_sizes.append(size)
+        self.batch_times.append(elapsed)
+
+    def snapshot(self):
+        """Current metrics
+
+        Returns:
+            dict: counts, batch sizes and latencies (ms) of requests and batches
+        """
+        latencies = sorted(self.latencies)
+        batch_times = sorted(self.batch_times)
+        to_ms = lambda value: None if value is None else value * 1000
+        return {
+            "requests": self.requests,
+            "names": self.names,
+            "errors": self.errors,
+            "batches": self.batches,
+            "batch_size": {
+                "mean": sum(self.batch_sizes) / len(self.batch_sizes) if len(self.batch_sizes) > 0 else None,
+                "max": self.max_batch_size,
+            },
+            "latency_ms": {
+                "p50": to_ms(percentile(latencies, 50)),
+                "p99": to_ms(percentile(latencies, 99)),
+                "max": to_ms(latencies[-1] if len(latencies) > 0 else None),
+            },
+            "batch_time_ms": {
+                "p50": to_ms(percentile(batch_times, 50)),
+                "p99": to_ms(percentile(batch_times, 99)),
+            },
+        }
+
+
+class NormalizationServer(object):
+    """HTTP/JSON server with micro-batching
+
+    Normalizer is not thread-safe, so the default executor has one thread and batches are normalized one at a time.
+
+    Args:
+        normalizer Normalizer: normalizer
+        host str: host to bind
+        port int: port to bind (0 chooses a free port)
+        max_batch_size int: maximum number of names in a batch (a request larger than this is a batch of its own)
+        max_wait float: maximum seconds to wait for more requests after the first request of a batch
+        executor Executor: executor of normalize_batch
+
+    Attributes:
+        metrics ServerMetrics: metrics
+        port int: bound port (after start)
+    """
+    def __init__(self, normalizer, host="127.0.0.1", port=8080, max_batch_size=64, max_wait=0.005, executor=None):
+        self.normalizer = normalizer
+        self.host = host
+        self.port = port
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.executor = executor or ThreadPoolExecutor(max_workers=1)
+        self.metrics = ServerMetrics()
+        self.server = None
+        self.queue = None
+        self.batcher = None
+
+    async def start(self):
+        """Bind the port and start the batcher"""
+        self.queue = asyncio.Queue()
+        self.batcher = asyncio.ensure_future(self.batch_loop())
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        """Stop accepting connections and stop the batcher"""
+        self.server.close()
+        await self.server.wait_closed()
+        self.batcher.cancel()
+        try:
+            await self.batcher
+        except asyncio.CancelledError:
+            pass
+
+    async def serve_forever(self):
+        await self.start()
+        try:
+            await self.server.serve_forever()
+        finally:
+            await self.stop()
+
+    def normalize_texts(self, texts):
+        return [dict(zip(OUTPUT_FIELDS, row)) for row in normalize_chunk(self.normalizer, texts)]
+
+    async def normalize(self, texts):
+        """Normalize names in the next batch
+
+        Args:
+            texts List[str]: disease names
+
+        Returns:
+            List[dict]: values of OUTPUT_FIELDS for each name
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((texts, future))
+        return await future
+
+    async def batch_loop(self):
+        loop = asyncio.get_running_loop()
+        # request that did not fit into the previous batch
+        held = None
+        while True:
+            if held is not None:
+                batch, held = [held], None
+            else:
+                batch = [await self.queue.get()]
+            size = len(batch[0][0])
+            deadline = loop.time() + self.max_wait
+            while size < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if size + len(item[0]) > self.max_batch_size:
+                    held = item
+                    break
+                batch.append(item)
+                size += len(item[0])
+
+            texts = [text for item_texts, _ in batch for text in item_texts]
+            start = time.perf_counter()
+            try:
+                results = await loop.run_in_executor(self.executor, self.normalize_texts, texts)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self.metrics.record_batch(len(texts), time.perf_counter() - start)
+
+            pos = 0
+            for item_texts, future in batch:
+                if not future.done():
+                    future.set_result(results[pos:pos+len(item_texts)])
+                pos += len(item_texts)
+
+    async def dispatch(self, method, path, body):
+        """Answer one request
+
+        Args:
+            method str: HTTP method
+            path str: request path
+            body bytes: request body
+
+        Returns:
+            Tuple[int, dict]: status code and JSON payload
+        """
+        if path == "/health":
+            return 200, {"status": "ok"}
+        if path == "/metrics":
+            return 200, self.metrics.snapshot()
+        if path != "/normalize":
+            return 404, {"error": "not found"}
+        if method != "POST":
+            return 405, {"error": "use POST"}
+
+        start = time.perf_counter()
+        try:
+            request = json.loads(body.decode("utf-8"))
+            if isinstance(request, dict) and isinstance(request.get("text"), str):
+                texts = [request["text"]]
+            elif isinstance(request, dict) and isinstance(request.get("texts"), list) \
+                    and all(isinstance(text, str) for text in request["texts"]):
+                texts = request["texts"]
+            else:
+                raise ValueError('request must be {"text": str} or {"texts": [str, ...]}')
+        except ValueError as e:
+            self.metrics.errors += 1
+            return 400, {"error": str(e)}
+
+        try:
+            results = await self.normalize(texts) if len(texts) > 0 else []
+        except Exception as e:
+            self.metrics.errors += 1
+            return 500, {"error": repr(e)}
+        self.metrics.record_request(len(texts), time.perf_counter() - start)
+        if "text" in request:
+            return 200, results[0]
+        return 200, {"results": results}
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                parts = request_line.decode("latin-1").split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    key, _, value = line.decode("latin-1").partition(":")
+                    headers[key.strip().lower()] = value.strip()
+
+                if len(parts) != 3:
+                    status, payload, keep_alive = 400, {"error": "malformed request line"}, False
+                else:
+                    method, path, version = parts
+                    body = await reader.readexactly(int(headers.get("content-length", 0)))
+                    status, payload = await self.dispatch(method, path.split("?")[0], body)
+                    keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+
+                data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                writer.write((
+                    "HTTP/1.1 {} {}\r\n"
+                    "Content-Type: application/json; charset=utf-8\r\n"
+                    "Content-Length: {}\r\n"
+                    "Connection: {}\r\n\r\n"
+                ).format(status, STATUS_REASONS[status], len(data), "keep-alive" if keep_alive else "close").encode("latin-1") + data)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="HTTP/JSON server of the Japanese disease normalizer")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--max-batch-size", type=int, default=64, help="maximum number of names in a batch")
+    parser.add_argument("--max-wait-ms", type=float, default=5, help="maximum wait for more requests of a batch")
+    parser.add_argument("--preprocess-pipeline", default="abbr", choices=["basic", "abbr"])
+    parser.add_argument("--converter", default="fuzzy", choices=["exact", "fuzzy", "bigram", "dnorm", "cascade"])
+    parser.add_argument("--use-cache", action="store_true", help="reuse the preprocessed dictionary and the built converter")
+    parser.add_argument("--result-cache-size", type=int, default=0)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    normalizer = Normalizer(
+        args.preprocess_pipeline,
+        args.converter,
+        use_cache=args.use_cache,
+        result_cache_size=args.result_cache_size,
+    )
+    server = NormalizationServer(
+        normalizer,
+        host=args.host,
+        port=args.port,
+        max_batch_size=args.max_batch_size,
+        max_wait=args.max_wait_ms / 1000,
+    )
+    print("Serving on http://{}:{}".format(args.host, args.port), file=sys.stderr, flush=True)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,26 +1,192 @@
+import pickle
+import warnings
+
 try:
+    import srsly
     from spacy.language import Language
     from spacy.tokens import Doc, Span
+    from spacy.util import minibatch, ensure_path
 except:
     raise NotImplementedError("Spacy is not installed")
 
 from japanese_disease_normalizer.normalizer import Normalizer
+from japanese_disease_normalizer.dict_store import DictEntryView
+from japanese_disease_normalizer.utils import DictEntry
+
+
+# docs are sent between processes of nlp.pipe(n_process > 1) as msgpack, including `ent._.norm`
+@srsly.msgpack_encoders("dict_entry")
+def encode_dict_entry(obj, chain=None):
+    if isinstance(obj, (DictEntry, DictEntryView)):
+        return {"__dict_entry__": [obj.name, obj.icd, obj.norm, obj.level]}
+    return obj if chain is None else chain(obj)
+
+
+@srsly.msgpack_decoders("dict_entry")
+def decode_dict_entry(obj, chain=None):
+    if "__dict_entry__" in obj:
+        return DictEntry(*obj["__dict_entry__"])
+    return obj if chain is None else chain(obj)
+
 
-@Language.factory("manbyo_normalizer")
+@Language.factory(
+    "manbyo_normalizer",
+    default_config={
+        "preprocess_pipeline": "abbr",
+        "converter": "fuzzy",
+        "cascade_stages": None,
+        "result_cache_size": 0,
+    },
+)
 class ManbyoNormalizer:
-    def __init__(self, nlp, name):
-        self.normalizer = Normalizer("abbr", "fuzzy")
-        Span.set_extension("norm", default=None)
+    """Spacy component to set the normalized entry to `ent._.norm`
+
+    Entity texts are deduplicated and normalized by one normalize_batch call for each doc (__call__)
+    or for each batch of docs (pipe).
+    The normalizer is built on first use (or by nlp.initialize), and to_disk saves the built normalizer
+    with the spacy model, so spacy.load restores it by from_disk without preprocessing the dictionary
+    and building the converter again.
+    Pickling the component builds the normalizer first, so the worker processes of nlp.pipe(n_process > 1)
+    started by spawn or forkserver receive the built normalizer and do not rebuild it.
+    Worker processes started by fork share the component of the main process without pickling,
+    so call nlp.initialize() (or read `normalizer`) before nlp.pipe to build it once in the main process.
+    Docs returned from the worker processes have DictEntry in `ent._.norm`.
+
+    Args:
+        nlp Language: spacy pipeline
+        name str: name of the component
+        preprocess_pipeline str: pre-defined preprocess pipeline (basic|abbr)
+        converter str: pre-defined converter (exact|fuzzy|bigram|dnorm|cascade)
+        cascade_stages List[Tuple[str, float]]: converters and acceptance thresholds of the "cascade" converter
+            (e.g. [["exact", 1], ["fuzzy", 0.8], ["dnorm", null]] in the config)
+        result_cache_size int: maximum number of entries of the result cache of the normalizer
+
+    Attributes:
+        normalizer Normalizer: normalizer (built on first access)
+    """
+    def __init__(self, nlp, name, preprocess_pipeline="abbr", converter="fuzzy", cascade_stages=None, result_cache_size=0):
+        self.preprocess_pipeline = preprocess_pipeline
+        self.converter = converter
+        self.cascade_stages = cascade_stages
+        self.result_cache_size = result_cache_size
+        self._normalizer = None
+        if not Span.has_extension("norm"):
+            Span.set_extension("norm", default=None)
+
+    @property
+    def normalizer(self):
+        if self._normalizer is None:
+            self._normalizer = Normalizer(
+                self.preprocess_pipeline,
+                self.converter,
+                result_cache_size=self.result_cache_size,
+                cascade_stages=self.cascade_stages,
+            )
+        return self._normalizer
+
+    @normalizer.setter
+    def normalizer(self, normalizer):
+        self._normalizer = normalizer
+
+    @property
+    def config(self):
+        """Settings of the normalizer saved with it by to_disk"""
+        return {
+            "preprocess_pipeline": self.preprocess_pipeline,
+            "converter": self.converter,
+            "cascade_stages": None if self.cascade_stages is None else [list(stage) for stage in self.cascade_stages],
+            "result_cache_size": self.result_cache_size,
+        }
+
+    def __getstate__(self):
+        # pickled for the worker processes of nlp.pipe, which should not rebuild the normalizer
+        self.normalizer
+        return self.__dict__.copy()
+
+    def initialize(self, get_examples=None, nlp=None):
+        """Build the normalizer (called by nlp.initialize)"""
+        self.normalizer
+
+    def set_norms(self, docs):
+        """Normalize entities of the docs in one batch
+
+        Args:
+            docs List[Doc]: docs with entities
+        """
+        # 同じ病名は一度だけ正規化する
+        texts = list(dict.fromkeys(ent.text for doc in docs for ent in doc.ents))
+        if len(texts) == 0:
+            return
+        norms = dict(zip(texts, self.normalizer.normalize_batch(texts)))
+        for doc in docs:
+            for ent in doc.ents:
+                ent._.set("norm", norms[ent.text])
 
     def __call__(self, doc):
-        for ent in doc.ents:
-            entity = ent.text
-            norm = self.normalizer.normalize(entity)
-            ent._.set("norm", norm)
+        self.set_norms([doc])
         return doc
 
+    def pipe(self, stream, batch_size=128):
+        """Normalize entities of a stream of docs
+
+        Args:
+            stream Iterable[Doc]: docs with entities
+            batch_size int: number of docs normalized in one batch
+
+        Yields:
+            Doc: docs in the same order as stream
+        """
+        for docs in minibatch(stream, size=batch_size):
+            self.set_norms(docs)
+            yield from docs
+
     def to_disk(self, path, exclude=tuple()):
-        pass
+        """Save the built normalizer
+
+        The normalizer is pickled into `normalizer.pkl` in the directory of the component with the settings (config).
+
+        Args:
+            path str: directory of the component
+            exclude Iterable[str]: names of the attributes not to save ("normalizer")
+        """
+        path = ensure_path(path)
+        if not path.exists():
+            path.mkdir(parents=True)
+        if "normalizer" in exclude:
+            return
+        with open(path / "normalizer.pkl", "wb") as f:
+            pickle.dump({"config": self.config, "normalizer": self.normalizer}, f, protocol=pickle.HIGHEST_PROTOCOL)
 
     def from_disk(self, path, exclude=tuple()):
+        """Load the normalizer saved by to_disk
+
+        If the directory has no saved normalizer, or the normalizer was saved with settings different from
+        those of this component, it is built on first use as before.
+        A saved DNorm model refers to its memory-mapped model in ~/.cache/Dnorm,
+        so the normalizer is also rebuilt if that model is missing or has changed.
+
+        Args:
+            path str: directory of the component
+            exclude Iterable[str]: names of the attributes not to load ("normalizer")
+
+        Returns:
+            ManbyoNormalizer: the component itself
+        """
+        path = ensure_path(path) / "normalizer.pkl"
+        if "normalizer" not in exclude and path.exists():
+            try:
+                with open(path, "rb") as f:
+                    saved = pickle.load(f)
+            except (OSError, ValueError) as e:
+                warnings.warn("The saved normalizer cannot be loaded ({}). The normalizer is rebuilt.".format(e))
+                self.normalizer = None
+                return self
+            if saved["config"] == self.config:
+                self.normalizer = saved["normalizer"]
+            else:
+                warnings.warn(
+                    "The saved normalizer was built with {}, which does not match the config of the component {}. "
+                    "The normalizer is rebuilt.".format(saved["config"], self.config)
+                )
+                self.normalizer = None
         return self
@@ -1,8 +1,9 @@
 
 import os
+import itertools
 
 import pytest
-from japanese_disease_normalizer.preprocessor.abbr_preprocessor import AbbrPreprocessor, AbbrEntry
+from japanese_disease_normalizer.preprocessor.abbr_preprocessor import AbbrPreprocessor, AbbrEntry, AbbrTrie
 
 def test_download_abbr_dict(tmpdir, monkeypatch):
     base_dir = tmpdir.mkdir("norm")
@@ -50,3 +51,106 @@ def test_preprocess(input, outputs, tmpdir, monkeypatch):
     outputs.sort()
     for result, output in zip(results, outputs):
         assert result == output
+
+
+@pytest.fixture
+def abbr_model():
+    return AbbrPreprocessor(abbr_dict={
+        "K": [AbbrEntry("K", "角化上皮", 10), AbbrEntry("K", "カリウム", 100), AbbrEntry("K", "クレブシエラ属", 10)],
+        "ACL": [AbbrEntry("ACL", "前十字靱帯", 50), AbbrEntry("ACL", "アルブミン カゼイン レシチン", 50)],
+        "COPD": [AbbrEntry("COPD", "慢性閉塞性肺疾患", 10)],
+        "AML": [AbbrEntry("AML", "急性骨髄性白血病", 10)],
+        "AML M": [AbbrEntry("AML M", "急性骨髄性白血病M", 10)],
+        "CA": [AbbrEntry("CA", "癌抗原", 10)],
+        "ca": [AbbrEntry("ca", "癌", 10)],
+    })
+
+
+def test_expand_order(abbr_model):
+    results = abbr_model.preprocess("KのACLなんじゃ")
+    assert results == [
+        "KのACLなんじゃ",
+        "カリウムのACLなんじゃ",
+        "Kの前十字靱帯なんじゃ",
+        "Kのアルブミン カゼイン レシチンなんじゃ",
+        "カリウムの前十字靱帯なんじゃ",
+        "カリウムのアルブミン カゼイン レシチンなんじゃ",
+        "角化上皮のACLなんじゃ",
+        "クレブシエラ属のACLなんじゃ",
+        "角化上皮の前十字靱帯なんじゃ",
+        "角化上皮のアルブミン カゼイン レシチンなんじゃ",
+        "クレブシエラ属の前十字靱帯なんじゃ",
+        "クレブシエラ属のアルブミン カゼイン レシチンなんじゃ",
+    ]
+
+
+def test_expand_is_complete(abbr_model):
+    word = "K・ACL・K-ACL/K"
+    parts = abbr_model.split(word)
+    results = list(abbr_model.expand(word))
+
+    combinations = []
+    for indices in itertools.product(*[range(len(part)) for part in parts]):
+        prob = 1.0
+        for part, idx in zip(parts, indices):
+            prob *= part[idx][1]
+        combinations.append((-prob, indices))
+    combinations.sort()
+    outputs = [''.join(part[idx][0] for part, idx in zip(parts, indices)) for _, indices in combinations]
+
+    assert len(results) == 4 * 3 * 4 * 3 * 4
+    assert results == outputs
+
+
+@pytest.mark.parametrize(
+    "max_candidates, beam_width, outputs", [
+        (3, None, ["KのACLなんじゃ", "カリウムのACLなんじゃ", "Kの前十字靱帯なんじゃ"]),
+        (None, 1, ["KのACLなんじゃ", "カリウムのACLなんじゃ", "Kの前十字靱帯なんじゃ", "カリウムの前十字靱帯なんじゃ"]),
+        (2, 1, ["KのACLなんじゃ", "カリウムのACLなんじゃ"]),
+        (None, 0, ["KのACLなんじゃ"]),
+    ]
+)
+def test_expand_limit(max_candidates, beam_width, outputs, abbr_model):
+    abbr_model.max_candidates = max_candidates
+    abbr_model.beam_width = beam_width
+    assert abbr_model.preprocess("KのACLなんじゃ") == outputs
+
+
+@pytest.mark.parametrize(
+    "input, outputs", [
+        ("COPD AML", ["COPD AML", "COPD 急性骨髄性白血病", "慢性閉塞性肺疾患 AML", "慢性閉塞性肺疾患 急性骨髄性白血病"]),
+        ("AML Mの疑い", ["AML Mの疑い", "急性骨髄性白血病Mの疑い"]),
+        ("AML MDS", ["AML MDS", "急性骨髄性白血病 MDS"]),
+        ("KCL", ["KCL"]),
+        ("aml", ["aml", "急性骨髄性白血病"]),
+        ("ＡＭＬ", ["AML", "急性骨髄性白血病"]),
+        ("ca", ["ca", "癌"]),
+        ("Ca", ["Ca", "癌"]),
+        ("CA", ["CA", "癌抗原"]),
+    ]
+)
+def test_trie_lookup(input, outputs, abbr_model):
+    assert abbr_model.preprocess(input) == outputs
+
+
+def test_trie_find():
+    trie = AbbrTrie(["AML", "AML M", "K", "ca"])
+    assert trie.find("AML M K CA") == [(0, 5, ["AML M"]), (6, 7, ["K"]), (8, 10, ["ca"])]
+    assert trie.find("AML MK CA") == [(0, 3, ["AML"]), (7, 9, ["ca"])]
+    assert trie.find("AMLK") == []
+
+
+def test_expand_is_lazy(abbr_model):
+    # 4 ** 20 combinations are never enumerated
+    word = "・".join(["K"] * 20)
+    assert abbr_model.max_candidates is None
+    outputs = list(itertools.islice(abbr_model.expand(word), 3))
+    # forms with the same probability are in the order of the options
+    assert outputs == [word, "・".join(["K"] * 19 + ["カリウム"]), "・".join(["K"] * 18 + ["カリウム", "K"])]
+
+
+@pytest.mark.parametrize(
+    "input", ["KのACLなんじゃ", "K・ACL・COPD AML/K", "ＡＭＬ  の疑い", "AML Mの疑い", "糖尿病", "  k  ", ""]
+)
+def test_preprocess_identity(input, abbr_model):
+    assert abbr_model.preprocess_identity(input) == abbr_model.preprocess(input)[0]
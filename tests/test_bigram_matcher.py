@@ -0,0 +1,48 @@
+import pytest
+from japanese_disease_normalizer.converter.bigram_matcher import BigramMatchConverter, extract_bigrams
+from japanese_disease_normalizer.converter.fuzzy_matcher import FuzzyMatchConverter
+
+@pytest.mark.parametrize(
+    "name, icd, norm", [
+    ("疼痛", "R529", "疼痛"),
+    ("頭痛だ", "R51", "頭痛"),
+    ("aobijosdf", None, None),
+    ]
+)
+def test_bigram_match(name, icd, norm, manbyo_dict):
+    converter = BigramMatchConverter(manbyo_dict)
+    result, sim = converter.convert(name)
+    assert result.icd == icd, result.icd
+    assert result.norm == norm, result.norm
+
+def test_extract_bigrams():
+    assert extract_bigrams("ab") == [" a", "ab", "b "]
+    assert extract_bigrams("") == ["  "]
+
+@pytest.mark.parametrize("alpha", [0.3, 0.5, 0.8])
+def test_same_ranking_as_simstring(alpha, manbyo_dict):
+    fuzzy = FuzzyMatchConverter(manbyo_dict)
+    bigram = BigramMatchConverter(manbyo_dict)
+
+    queries = [d.name for d in manbyo_dict] + [d.name[1:] + "だ" for d in manbyo_dict] + ["頭痛だ", "糖尿", "a", ""]
+    for query in queries:
+        ids, sims = bigram.search(query, alpha)
+        results = sorted([[sim, bigram.name(i)] for i, sim in zip(ids, sims)], key=lambda x: (-x[0], x[1]))
+        assert results == fuzzy.searcher.ranked_search(query, alpha), query
+        assert bigram.convert(query, alpha) == fuzzy.convert(query, alpha), query
+
+def test_bigram_match_batch(manbyo_dict):
+    converter = BigramMatchConverter(manbyo_dict)
+    words = ["疼痛", "頭痛だ", "aobijosdf", "頭痛だ"]
+    results = converter.convert_batch(words)
+    assert len(results) == len(words)
+    for word, (result, sim) in zip(words, results):
+        assert (result, sim) == converter.convert(word)
+
+@pytest.mark.parametrize("k", [1, 3, 10])
+@pytest.mark.parametrize("name", ["疼痛", "頭痛だ", "糖尿病だよ", "aobijosdf"])
+def test_bigram_match_topk(name, k, manbyo_dict):
+    fuzzy = FuzzyMatchConverter(manbyo_dict)
+    bigram = BigramMatchConverter(manbyo_dict)
+    results = bigram.convert_topk(name, k)
+    assert [(result.name, sim) for result, sim in results] == [(result.name, sim) for result, sim in fuzzy.convert_topk(name, k)]
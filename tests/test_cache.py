@@ -0,0 +1,63 @@
+import pytest
+
+from japanese_disease_normalizer.cache import LRUCache, LFUCache, make_cache
+
+
+def test_lru_cache():
+    cache = LRUCache(2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+
+    assert list(cache.keys()) == ["a", "c"]
+    assert cache.get("b") is None
+    assert cache.stats() == {"hits": 1, "misses": 1, "evictions": 1, "size": 2, "maxsize": 2}
+
+
+def test_lfu_cache():
+    cache = LFUCache(2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    assert cache.get("a") == 1
+    assert cache.get("b") == 2
+    cache.put("c", 3)
+
+    # b is used less than a
+    assert set(cache.keys()) == {"a", "c"}
+    cache.put("d", 4)
+    # c and d have the same frequency, c is older
+    assert set(cache.keys()) == {"a", "d"}
+    cache.put("a", 5)
+    assert cache.get("a") == 5
+    assert cache.stats() == {"hits": 4, "misses": 0, "evictions": 2, "size": 2, "maxsize": 2}
+
+
+@pytest.mark.parametrize("policy", ["lru", "lfu"])
+def test_cache_clear(policy):
+    cache = make_cache(3, policy)
+    for i in range(10):
+        cache.put(i, i)
+        cache.get(i % 4)
+    assert len(cache) == 3
+    assert cache.evictions == 7
+
+    cache.clear()
+    assert len(cache) == 0
+    assert cache.get(9) is None
+    cache.put(1, 1)
+    assert cache.get(1) == 1
+
+
+@pytest.mark.parametrize("policy", ["lru", "lfu"])
+def test_disabled_cache(policy):
+    cache = make_cache(0, policy)
+    cache.put("a", 1)
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_unknown_policy():
+    with pytest.raises(NotImplementedError):
+        make_cache(10, "fifo")
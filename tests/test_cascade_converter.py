@@ -0,0 +1,91 @@
+import pytest
+from japanese_disease_normalizer.converter.cascade_converter import CascadeConverter
+from japanese_disease_normalizer.converter.exact_matcher import ExactMatchConverter
+from japanese_disease_normalizer.converter.fuzzy_matcher import FuzzyMatchConverter
+from japanese_disease_normalizer.converter.base_converter import BaseConverter
+
+@pytest.mark.parametrize(
+    "name, norm, stage", [
+    ("疼痛", "疼痛", 0),
+    ("頭痛だ", "頭痛", 1),
+    ("aobijosdf", None, -1),
+    ]
+)
+def test_cascade_convert(name, norm, stage, manbyo_dict):
+    converter = CascadeConverter(manbyo_dict, [("exact", 1), ("bigram", 0.5)])
+    result, sim, answered = converter.convert_with_stage(name)
+    assert result.norm == norm
+    assert answered == stage
+    assert converter.convert(name) == (result, sim)
+
+def test_cascade_threshold(manbyo_dict):
+    converter = CascadeConverter(manbyo_dict, [("exact", 1), ("fuzzy", 0.99), ("bigram", None)])
+    result, sim, stage = converter.convert_with_stage("頭痛だ")
+    assert stage == 2
+    assert (result, sim) == FuzzyMatchConverter(manbyo_dict).convert("頭痛だ")
+    assert converter.stats() == {"exact": 0, "fuzzy": 0, "bigram": 1, "unanswered": 0}
+
+def test_cascade_short_circuit(manbyo_dict, mocker):
+    converter = CascadeConverter(manbyo_dict, [("exact", 1), ("fuzzy", 0.5)])
+    convert = mocker.spy(converter.converters[1], "convert")
+    converter.convert("疼痛")
+    assert convert.call_count == 0
+    converter.convert("頭痛だ")
+    assert convert.call_count == 1
+
+def test_cascade_shares_store(manbyo_dict):
+    converter = CascadeConverter(manbyo_dict, [("exact", 1), ("fuzzy", 0.8), ("bigram", None)])
+    for stage in converter.converters:
+        assert stage.store is converter.store
+
+def test_cascade_batch(manbyo_dict, mocker):
+    converter = CascadeConverter(manbyo_dict, [("exact", 1), ("bigram", 0.5)])
+    words = ["疼痛", "頭痛だ", "aobijosdf", "疼痛", "頭痛だ"]
+    convert_batch = mocker.spy(converter.converters[1], "convert_batch")
+    results = converter.convert_batch_with_stage(words)
+
+    assert convert_batch.call_args[0][0] == ["頭痛だ", "aobijosdf", "頭痛だ"]
+    assert results == [converter.convert_with_stage(word) for word in words]
+    assert converter.stats() == {"exact": 4, "bigram": 4, "unanswered": 2}
+    assert converter.convert_batch(words) == [(result, sim) for result, sim, _ in results]
+
+@pytest.mark.parametrize("name, length", [("疼痛", 1), ("頭痛だ", 1), ("aobijosdf", 0)])
+def test_cascade_topk(name, length, manbyo_dict):
+    converter = CascadeConverter(manbyo_dict, [("exact", 1), ("fuzzy", 0.5)])
+    results = converter.convert_topk(name, 3)
+    assert len(results) == length
+    assert converter.convert_topk_with_stage(name, 3) == [(result, sim, 0 if name == "疼痛" else 1) for result, sim in results]
+
+def test_cascade_own_converter(manbyo_dict):
+    class MyConverter(BaseConverter):
+        def convert(self, word):
+            return ExactMatchConverter(manbyo_dict).convert("疼痛")
+
+    converter = CascadeConverter(manbyo_dict, [("exact", 1), (MyConverter(), None)])
+    result, sim, stage = converter.convert_with_stage("aobijosdf")
+    assert result.norm == "疼痛"
+    assert converter.names == ["exact", "MyConverter"]
+
+@pytest.mark.parametrize("stages", [[], [("simstring", 1)], [(None, 1)]])
+def test_cascade_invalid_stages(stages, manbyo_dict):
+    with pytest.raises(NotImplementedError):
+        CascadeConverter(manbyo_dict, stages)
+
+@pytest.mark.parametrize(
+    "stages, perfect_score", [
+    ([("exact", 1), ("fuzzy", 0.8)], 1),
+    ([("exact", 1), ("bigram", 0.8), ("fuzzy", None)], 1),
+    ([("exact", 1), (ExactMatchConverter([]), None), ("bigram", None)], 1),
+    ]
+)
+def test_cascade_perfect_score(stages, perfect_score, manbyo_dict):
+    converter = CascadeConverter(manbyo_dict, stages)
+    assert converter.perfect_score == perfect_score
+
+def test_cascade_no_perfect_score(manbyo_dict):
+    class MyConverter(BaseConverter):
+        def convert(self, word):
+            return ExactMatchConverter(manbyo_dict).convert(word)
+
+    converter = CascadeConverter(manbyo_dict, [("exact", 1), (MyConverter(), None)])
+    assert converter.perfect_score is None
@@ -0,0 +1,78 @@
+import json
+
+import pytest
+from japanese_disease_normalizer import cli
+from japanese_disease_normalizer.normalizer import Normalizer
+
+WORDS = ["頭痛だ", "2型糖尿病", "aobijosdf", "疼痛", "頭痛だ"]
+
+
+@pytest.fixture
+def normalizer(manbyo_dict, mocker):
+    mocker.patch("japanese_disease_normalizer.normalizer.Normalizer.load_manbyo_dict", return_value=manbyo_dict)
+    return Normalizer("basic", "fuzzy")
+
+
+def expected_rows(normalizer, words):
+    rows = []
+    for word in words:
+        entry, score = normalizer.normalize(word, return_score=True)
+        if entry.name is None:
+            rows.append([word, None, None, None, None, None])
+        else:
+            rows.append([word, entry.name, entry.icd, entry.norm, entry.level, score])
+    return rows
+
+
+@pytest.mark.parametrize("n_jobs, chunk_size", [(1, 2), (2, 1), (2, 1000)])
+def test_run(n_jobs, chunk_size, normalizer):
+    class ListWriter(object):
+        rows = []
+
+        def write_rows(self, rows):
+            self.rows.extend(rows)
+
+    writer = ListWriter()
+    progress = []
+    words = WORDS * 3
+    count = cli.run(normalizer, iter(words), writer, n_jobs=n_jobs, chunk_size=chunk_size, progress=progress.append)
+    assert count == len(words)
+    assert writer.rows == expected_rows(normalizer, words)
+    assert progress[-1] == len(words)
+
+
+@pytest.mark.parametrize(
+    "input_format, content", [
+        ("txt", "".join(word + "\n" for word in WORDS)),
+        ("csv", "id,name\n" + "".join("{},{}\n".format(i, word) for i, word in enumerate(WORDS))),
+        ("jsonl", "".join(json.dumps({"name": word}, ensure_ascii=False) + "\n" for word in WORDS)),
+    ]
+)
+def test_read_names(input_format, content, tmpdir):
+    path = tmpdir / "input"
+    path.write_text(content, encoding="utf-8")
+    with open(str(path), encoding="utf-8", newline="") as f:
+        assert list(cli.read_names(f, input_format, "name")) == WORDS
+
+
+def test_main(normalizer, tmpdir, capsys):
+    (tmpdir / "names.txt").write_text("\n".join(WORDS) + "\n", encoding="utf-8")
+    cli.main([
+        str(tmpdir / "names.txt"), "-o", str(tmpdir / "out.jsonl"),
+        "--preprocess-pipeline", "basic", "--output-format", "jsonl", "--n-jobs", "2", "--chunk-size", "2",
+    ])
+    with open(str(tmpdir / "out.jsonl"), encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f]
+    assert [[row[field] for field in cli.OUTPUT_FIELDS] for row in rows] == expected_rows(normalizer, WORDS)
+    assert "Normalized 5 names" in capsys.readouterr().err
+
+
+def test_main_tsv(normalizer, tmpdir, capsys):
+    (tmpdir / "names.txt").write_text("\n".join(WORDS) + "\n", encoding="utf-8")
+    cli.main([str(tmpdir / "names.txt"), "--preprocess-pipeline", "basic", "--quiet"])
+    captured = capsys.readouterr()
+    lines = captured.out.splitlines()
+    assert lines[0] == "\t".join(cli.OUTPUT_FIELDS)
+    assert lines[3] == "aobijosdf\t\t\t\t\t"
+    assert len(lines) == len(WORDS) + 1
+    assert captured.err == ""
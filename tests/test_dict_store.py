@@ -0,0 +1,111 @@
+import dataclasses
+import pickle
+
+import pytest
+
+from japanese_disease_normalizer.utils import DictEntry
+from japanese_disease_normalizer.dict_store import DictionaryStore, DictEntryView, as_store
+from japanese_disease_normalizer.converter import exact_matcher, fuzzy_matcher, bigram_matcher
+
+
+def test_from_entries(manbyo_dict):
+    store = DictionaryStore.from_entries(manbyo_dict)
+
+    assert len(store) == len(manbyo_dict)
+    assert list(store) == manbyo_dict
+    assert store[-1] == manbyo_dict[-1]
+    assert store.names() == [d.name for d in manbyo_dict]
+    # icd codes, norms and levels are shared in the string table
+    assert len(store.string_offsets) - 1 < len(set(d.name for d in manbyo_dict)) * 4
+    with pytest.raises(IndexError):
+        store[len(store)]
+
+
+def test_missing_values():
+    store = DictionaryStore.from_entries([DictEntry("こんにちは", None, "こんにちは", None)])
+    assert store[0] == DictEntry("こんにちは", None, "こんにちは", None)
+
+
+def test_lookup():
+    entries = [
+        DictEntry("頭痛", "R51", "頭痛", "S"),
+        DictEntry("疼痛", "R529", "疼痛", "S"),
+        DictEntry("頭痛", "G439", "片頭痛", "B"),
+    ]
+    store = as_store(entries)
+    assert store.lookup("頭痛") == 2
+    assert store.lookup("疼痛") == 1
+    assert store.lookup("腹痛") == -1
+    assert as_store(store) is store
+    assert store.unique_ids().tolist() == [2, 1]
+    assert dict(store.name2id) == {"頭痛": 2, "疼痛": 1}
+    assert "腹痛" not in store.name2id
+
+
+def test_view():
+    store = DictionaryStore.from_entries([DictEntry("頭痛", "R51", "頭痛", "S")])
+    view = store[0]
+
+    assert isinstance(view, DictEntryView)
+    assert (view.name, view.icd, view.norm, view.level) == ("頭痛", "R51", "頭痛", "S")
+    assert view.to_entry() == DictEntry("頭痛", "R51", "頭痛", "S")
+    assert DictEntry("頭痛", "R51", "頭痛", "S") == view
+    assert view != DictEntry("頭痛", "R51", "頭痛", "A")
+    assert isinstance(view, DictEntry)
+    assert dataclasses.asdict(view) == {"name": "頭痛", "icd": "R51", "norm": "頭痛", "level": "S"}
+    with pytest.raises(AttributeError):
+        view.name = "疼痛"
+
+
+def test_pickle(manbyo_dict):
+    store = DictionaryStore.from_entries(manbyo_dict)
+    store.lookup("頭痛")
+    loaded = pickle.loads(pickle.dumps(store))
+
+    assert loaded == store
+    assert (loaded._unique_ids, loaded._name_index) == (None, None)
+    # views are pickled without the store
+    loaded = pickle.loads(pickle.dumps(store[3]))
+    assert type(loaded) == DictEntry
+    assert loaded == store[3]
+    assert len(pickle.dumps(store[3])) < len(pickle.dumps(store)) / 10
+
+
+@pytest.mark.parametrize("mmap_mode", ["r", None])
+def test_save_load(mmap_mode, manbyo_dict, tmp_path):
+    store = DictionaryStore.from_entries(manbyo_dict)
+    store.save(tmp_path / "store")
+    loaded = DictionaryStore.load(tmp_path / "store", mmap_mode=mmap_mode)
+
+    assert loaded == store
+    assert loaded.fields.flags.writeable == (mmap_mode is None)
+    assert [p.name for p in tmp_path.iterdir()] == ["store"]
+
+
+def test_replace_names(manbyo_dict):
+    store = DictionaryStore.from_entries(manbyo_dict)
+    replaced = store.replace_names([name + "だ" for name in store.names()])
+
+    assert replaced.names() == [d.name + "だ" for d in manbyo_dict]
+    assert replaced.column("icd") == [d.icd for d in manbyo_dict]
+    assert store.names() == [d.name for d in manbyo_dict]
+
+
+@pytest.mark.parametrize(
+    "model", [
+    exact_matcher.ExactMatchConverter,
+    fuzzy_matcher.FuzzyMatchConverter,
+    bigram_matcher.BigramMatchConverter,
+    ]
+)
+def test_converters_share_store(model, manbyo_dict):
+    store = DictionaryStore.from_entries(manbyo_dict)
+    converter = model(store)
+    result, score = converter.convert("頭痛")
+
+    assert converter.store is store
+    assert isinstance(result, DictEntryView)
+    assert result.store is store
+    assert result.name == "頭痛"
+    # names are looked up by id, not copied into the converter
+    assert not any(isinstance(value, (list, dict)) and "悪性リンパ腫" in value for value in vars(converter).values())
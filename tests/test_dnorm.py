@@ -0,0 +1,211 @@
+import pickle
+
+import numpy as np
+import pytest
+from scipy.sparse import csr_matrix
+
+from japanese_disease_normalizer.converter.dnorm.dnorm import DNorm, MeCabTokenizer, sparse_topk, convert_model, is_mapped
+
+
+def dense_predict(model, x, k):
+    sims = model.calc_score(model.tfidf.transform(x), model.norms_vec).toarray()
+    rank = sims.argsort(axis=1, kind="stable")[:, ::-1][:, :k]
+    return [[model.norms[r] for r in rr] for rr in rank], [sims[idx, rr] for idx, rr in enumerate(rank)]
+
+
+@pytest.mark.parametrize(
+    "scores, k", [
+        ([0.0, 0.5, 0.0, 0.9, 0.5], 1),
+        ([0.0, 0.5, 0.0, 0.9, 0.5], 3),
+        ([0.0, 0.5, 0.0, 0.9, 0.5], 4),
+        ([0.0, 0.0, 0.0, 0.0, 0.0], 2),
+        ([-0.3, 0.2, -0.1, 0.0, 0.0], 5),
+        ([-0.3, -0.2, -0.1, -0.2, 0.1], 4),
+    ]
+)
+def test_sparse_topk(scores, k):
+    scores = np.array(scores)
+    sparse = csr_matrix(scores)
+    indices, data = sparse_topk(sparse.data, sparse.indices, len(scores), k)
+
+    true_indices = scores.argsort(kind="stable")[::-1][:k]
+    assert indices.tolist() == true_indices.tolist()
+    assert data.tolist() == scores[true_indices].tolist()
+
+
+@pytest.mark.parametrize("k", [1, 2, 5, 20])
+def test_sparse_predict(k, manbyo_dict):
+    model = DNorm(manbyo_dict, None)
+    x = ["頭痛だ", "２型糖尿病", "悪性リンパ腫だよおおおおお", "xyz", "糖尿病性腎症"]
+
+    results, sims = model.predict(x, k=k)
+    true_results, true_sims = dense_predict(model, x, k)
+    assert results == true_results
+    for sim, true_sim in zip(sims, true_sims):
+        assert sim == pytest.approx(true_sim)
+
+
+def test_sparse_predict_with_negative_weight(manbyo_dict):
+    model = DNorm(manbyo_dict, None)
+    rng = np.random.RandomState(0)
+    model.W = csr_matrix(model.W.toarray() + rng.normal(scale=0.05, size=model.W.shape) * (rng.rand(*model.W.shape) < 0.05))
+    x = ["頭痛だ", "２型糖尿病", "xyz"]
+
+    for k in [1, 3, 10]:
+        results, sims = model.predict(x, k=k)
+        true_results, true_sims = dense_predict(model, x, k)
+        assert results == true_results
+        for sim, true_sim in zip(sims, true_sims):
+            assert sim == pytest.approx(true_sim)
+
+
+def test_frozen_predict(manbyo_dict):
+    model = DNorm(manbyo_dict, None)
+    frozen_model = DNorm(manbyo_dict, None, frozen=True)
+    assert model.projected is None
+    assert frozen_model.projected is not None
+    x = ["頭痛だ", "２型糖尿病", "悪性リンパ腫だよおおおおお", "xyz"]
+
+    for k in [1, 5]:
+        results, sims = model.predict(x, k=k)
+        frozen_results, frozen_sims = frozen_model.predict(x, k=k)
+        assert results == frozen_results
+        for sim, frozen_sim in zip(sims, frozen_sims):
+            assert frozen_sim == pytest.approx(sim)
+
+
+def test_update_unfreezes(manbyo_dict):
+    model = DNorm(manbyo_dict, None, frozen=True)
+    x_vec = model.tfidf.transform(["頭痛だ"])
+    model.update(x_vec, model.norms_vec[model.norm2idx["疼痛"]], model.norms_vec[model.norm2idx["頭痛"]], 0.1)
+    assert model.projected is None
+
+    model.freeze()
+    assert model.score_dictionary(x_vec).toarray() == pytest.approx(model.calc_score(x_vec, model.norms_vec).toarray())
+
+
+@pytest.mark.parametrize("noise", [0.0, 0.05])
+def test_score_candidates(noise, manbyo_dict):
+    model = DNorm(manbyo_dict, None)
+    rng = np.random.RandomState(0)
+    model.W = csr_matrix(model.W.toarray() + rng.normal(scale=noise, size=model.W.shape) * (rng.rand(*model.W.shape) < 0.05))
+    x_vec = model.tfidf.transform(["頭痛だ", "２型糖尿病", "悪性リンパ腫だよおおおおお", "xyz", "糖尿病性腎症"])
+
+    scores = model.score_candidates(x_vec).tocsr()
+    true_scores = model.calc_score(x_vec, model.norms_vec).toarray()
+    assert scores.toarray() == pytest.approx(true_scores)
+
+    # only the entries sharing a feature with the query are scored
+    q_vecs = x_vec.dot(model.W).tocsr()
+    for idx in range(q_vecs.shape[0]):
+        others = np.setdiff1d(np.arange(len(model.norms)), scores[idx].indices)
+        assert model.norms_vec[others].dot(q_vecs[idx].T).nnz == 0
+        assert len(scores[idx].indices) == len(np.unique(model.index[q_vecs[idx].indices].indices))
+
+
+def test_tokenizer_cache():
+    tokenizer = MeCabTokenizer(cache_size=2)
+    words = ["急性骨髄性白血病", "２型糖尿病", "急性骨髄性白血病", "頭痛", "２型糖尿病"]
+    results = [tokenizer.tokenize(word) for word in words]
+
+    assert results == [tokenizer.parse(word) for word in words]
+    assert tokenizer.cache_info() == {"hits": 1, "misses": 4, "evictions": 2, "size": 2, "maxsize": 2}
+    assert list(tokenizer.cache.keys()) == ["頭痛", "２型糖尿病"]
+
+
+@pytest.mark.parametrize("cache_size", [0, 2, 100])
+def test_tokenize_batch(cache_size):
+    tokenizer = MeCabTokenizer(cache_size=cache_size)
+    words = ["急性骨髄性白血病", "２型糖尿病", "急性骨髄性白血病", "頭痛", "", "２型糖尿病"]
+    results = tokenizer.tokenize_batch(words)
+
+    assert results == [tokenizer.parse(word) for word in words]
+    assert tokenizer.misses == 4
+    assert len(tokenizer.cache) == min(cache_size, 4)
+
+
+def test_predict_uses_tokenizer_cache(manbyo_dict):
+    model = DNorm(manbyo_dict, None)
+    x = ["頭痛だ", "２型糖尿病", "頭痛だ"]
+    results, sims = model.predict(x)
+    misses = model.tokenizer.misses
+
+    assert model.predict(x)[0] == results
+    assert model.tokenizer.misses == misses
+
+
+def test_vectorize_parses_once(manbyo_dict, mocker):
+    model = DNorm(manbyo_dict, None)
+    expected = model.tfidf.transform(model.norms)
+    # dictionary larger than the cache
+    model.tokenizer = MeCabTokenizer(cache_size=2)
+    parse = mocker.spy(model.tokenizer, "parse")
+    assert (model.vectorize(model.norms) != expected).nnz == 0
+    assert parse.call_count == len(set(model.norms))
+
+    vocabulary = model.tfidf.vocabulary_
+    parse.reset_mock()
+    model.train_tfidf(model.norms)
+    assert parse.call_count == len(set(model.norms))
+    assert model.tfidf.vocabulary_ == vocabulary
+
+
+@pytest.mark.parametrize("frozen", [True, False])
+def test_mmap_model(frozen, manbyo_dict, tmp_path):
+    model = DNorm(manbyo_dict, None)
+    model.W = model.W + csr_matrix(np.random.RandomState(0).rand(*model.W.shape) * (np.random.RandomState(1).rand(*model.W.shape) < 0.05))
+    model.save_model(tmp_path / "dnorm.pkl")
+    convert_model(tmp_path / "dnorm.pkl", tmp_path / "dnorm_mmap")
+
+    loaded = DNorm(manbyo_dict, tmp_path / "dnorm_mmap", frozen=frozen)
+    assert not loaded.W.data.flags.writeable
+    assert (loaded.W != model.W).nnz == 0
+    assert loaded.tfidf.vocabulary_ == model.tfidf.vocabulary_
+
+    x = ["頭痛だ", "２型糖尿病", "悪性リンパ腫だよおおおおお", "xyz"]
+    model.tfidf.set_params(analyzer=model.tokenizer.tokenize)
+    results, sims = loaded.predict(x, k=3)
+    true_results, true_sims = model.predict(x, k=3)
+    assert results == true_results
+    np.testing.assert_allclose(sims, true_sims)
+
+
+def test_pickle_mmap_model(manbyo_dict, tmp_path):
+    model = DNorm(manbyo_dict, None)
+    model.save_mmap_model(tmp_path / "dnorm_mmap")
+    loaded = DNorm(manbyo_dict, tmp_path / "dnorm_mmap")
+    assert loaded.mapped
+
+    data = pickle.dumps(loaded)
+    assert len(data) < len(pickle.dumps(model))
+    unpickled = pickle.loads(data)
+    assert unpickled.mapped
+    assert all(is_mapped(array) for array in [unpickled.tfidf.idf_, unpickled.W.data, unpickled.W.indices, unpickled.W.indptr])
+    results, sims = unpickled.predict(["頭痛だ", "xyz"], k=3)
+    true_results, true_sims = loaded.predict(["頭痛だ", "xyz"], k=3)
+    assert results == true_results
+    np.testing.assert_allclose(sims, true_sims)
+
+    # trained W is not in the mapped file, so it is pickled
+    loaded.W = loaded.W * 2
+    assert not loaded.mapped
+    unpickled = pickle.loads(pickle.dumps(loaded))
+    assert unpickled.mmap_path is None
+    assert (unpickled.W != loaded.W).nnz == 0
+
+    # the model changed after pickling is not mapped silently
+    model.W = model.W * 2
+    model.save_mmap_model(tmp_path / "dnorm_mmap")
+    with pytest.raises(ValueError):
+        pickle.loads(data)
+
+
+def test_save_mmap_model_overwrite(manbyo_dict, tmp_path):
+    model = DNorm(manbyo_dict, None)
+    model.save_mmap_model(tmp_path / "dnorm_mmap")
+    model.W = model.W * 2
+    model.save_mmap_model(tmp_path / "dnorm_mmap")
+
+    loaded = DNorm(manbyo_dict, tmp_path / "dnorm_mmap")
+    assert (loaded.W != model.W).nnz == 0
+    assert [p.name for p in tmp_path.iterdir()] == ["dnorm_mmap"]
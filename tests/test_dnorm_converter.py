@@ -2,6 +2,9 @@ import os
 
 import pytest
 from japanese_disease_normalizer.converter.dnorm.dnorm_converter import DNormConverter
+from japanese_disease_normalizer.converter.dnorm.dnorm import DNorm, load_mmap_meta
+from japanese_disease_normalizer.index_cache import file_hash
+from japanese_disease_normalizer.instrumentation import Instrumentation
 
 def test_download_model(tmpdir, manbyo_dict, monkeypatch):
     base_dir = tmpdir.mkdir("dnorm")
@@ -9,6 +12,7 @@ def test_download_model(tmpdir, manbyo_dict, monkeypatch):
 
     model = DNormConverter(manbyo_dict)
     assert (base_dir / "Dnorm" / "dnorm.pkl").exists()
+    assert (base_dir / "Dnorm" / "dnorm_mmap" / "W_data.npy").exists()
     assert hasattr(model.model, "tfidf")
     assert hasattr(model.model, "W")
 
@@ -38,3 +42,69 @@ def test_dnorm_match(name, icd, norm, manbyo_dict, tmpdir, monkeypatch):
 
     assert result.icd == icd
     assert result.norm == norm
+
+def test_dnorm_match_batch(manbyo_dict, tmpdir, monkeypatch):
+    base_dir = tmpdir.mkdir("dnorm")
+    monkeypatch.setenv("DEFAULT_CACHE_PATH", str(base_dir))
+
+    converter = DNormConverter(manbyo_dict)
+
+    words = ["疼痛", "頭痛だ", "悪性リンパ腫だよおおおおお"]
+    results = converter.convert_batch(words)
+    assert len(results) == len(words)
+    for word, (result, sim) in zip(words, results):
+        true_result, true_sim = converter.convert(word)
+        assert result == true_result
+        assert sim == pytest.approx(true_sim)
+
+@pytest.mark.parametrize("k", [1, 5])
+def test_dnorm_match_topk(k, manbyo_dict, tmpdir, monkeypatch):
+    base_dir = tmpdir.mkdir("dnorm")
+    monkeypatch.setenv("DEFAULT_CACHE_PATH", str(base_dir))
+
+    converter = DNormConverter(manbyo_dict)
+
+    results = converter.convert_topk("頭痛だ", k)
+    assert len(results) == k
+    assert results[0] == converter.convert("頭痛だ")
+    sims = [sim for result, sim in results]
+    assert sims == sorted(sims, reverse=True)
+
+def test_dnorm_instrumentation(manbyo_dict, tmpdir, monkeypatch):
+    base_dir = tmpdir.mkdir("dnorm")
+    monkeypatch.setenv("DEFAULT_CACHE_PATH", str(base_dir))
+
+    converter = DNormConverter(manbyo_dict)
+    converter.instrumentation = Instrumentation()
+    assert converter.model.instrumentation is converter.instrumentation
+    converter.convert_batch(["疼痛", "頭痛だ"])
+
+    snapshot = converter.instrumentation.snapshot()
+    assert snapshot["timers"]["dnorm.vectorize"]["count"] == 1
+    assert snapshot["timers"]["dnorm.score"]["count"] == 1
+    assert snapshot["counters"]["candidates.DNorm"] > 0
+
+def test_dnorm_not_frozen_by_default(manbyo_dict, tmpdir, monkeypatch):
+    base_dir = tmpdir.mkdir("dnorm")
+    monkeypatch.setenv("DEFAULT_CACHE_PATH", str(base_dir))
+
+    converter = DNormConverter(manbyo_dict)
+    frozen_converter = DNormConverter(manbyo_dict, frozen=True)
+    assert converter.model.projected is None
+    assert frozen_converter.model.projected is not None
+    assert converter.convert_batch(["疼痛", "頭痛だ"]) == frozen_converter.convert_batch(["疼痛", "頭痛だ"])
+
+def test_reconvert_updated_model(manbyo_dict, tmpdir, monkeypatch):
+    base_dir = tmpdir.mkdir("dnorm")
+    monkeypatch.setenv("DEFAULT_CACHE_PATH", str(base_dir))
+
+    converter = DNormConverter(manbyo_dict)
+    assert load_mmap_meta(base_dir / "Dnorm" / "dnorm_mmap")["source_hash"] == file_hash(base_dir / "Dnorm" / "dnorm.pkl")
+
+    # replace dnorm.pkl with a model whose W is doubled
+    model = DNorm(manbyo_dict, base_dir / "Dnorm" / "dnorm.pkl")
+    model.W = model.W * 2
+    model.save_model(base_dir / "Dnorm" / "dnorm.pkl")
+    updated = DNormConverter(manbyo_dict)
+    assert load_mmap_meta(base_dir / "Dnorm" / "dnorm_mmap")["source_hash"] == file_hash(base_dir / "Dnorm" / "dnorm.pkl")
+    assert (updated.model.W != converter.model.W * 2).nnz == 0
@@ -0,0 +1,125 @@
+import random
+
+import numpy as np
+import pytest
+from scipy.sparse import csr_matrix
+
+from japanese_disease_normalizer.converter.dnorm.dnorm import DNorm
+from japanese_disease_normalizer.converter.dnorm.trainer import DNormTrainer, ParallelDNormTrainer, masked_argmax
+
+
+def make_dataset(manbyo_dict):
+    X, Y = [], []
+    for d in manbyo_dict:
+        X += [d.name + "だ", d.name[1:] + "症", "急性" + d.name]
+        Y += [d.name, d.name, d.name]
+    return X, Y
+
+
+def reference_epoch(model, X, Y, eta, idxs):
+    x_vec = model.tfidf.transform(X)
+    y_vec = model.tfidf.transform(Y)
+    for idx in idxs:
+        neg_vec = model.get_negative_vec(x_vec[idx], Y[idx])
+        model.update(x_vec[idx], y_vec[idx], neg_vec, eta)
+
+
+@pytest.mark.parametrize(
+    "scores, exclude", [
+        ([0.0, 0.5, 0.0, 0.9, 0.5], 3),
+        ([0.0, 0.5, 0.0, 0.9, 0.5], 0),
+        ([-0.1, -0.5, 0.0, -0.9], 2),
+        ([-0.1, -0.5, -0.2, -0.9], 0),
+        ([0.0, -0.5, 0.0, -0.9], 0),
+        ([0.0, 0.0, 0.0], 0),
+    ]
+)
+def test_masked_argmax(scores, exclude):
+    scores = np.array(scores)
+    sparse = csr_matrix(scores)
+    true_idx = np.delete(np.arange(len(scores)), exclude)[np.delete(scores, exclude).argmax()]
+    assert masked_argmax(sparse.data, sparse.indices, len(scores), exclude) == true_idx
+
+
+def test_explicit_zero_argmax():
+    # explicit zero before the first implicit zero
+    data, indices = np.array([-0.2, 0.0, -0.1]), np.array([0, 1, 2])
+    assert masked_argmax(data, indices, 5, 4) == 1
+
+
+def test_same_as_sequential_training(manbyo_dict):
+    X, Y = make_dataset(manbyo_dict)
+    idxs = list(range(len(X)))
+    random.Random(0).shuffle(idxs)
+
+    reference = DNorm(manbyo_dict, None)
+    reference_epoch(reference, X, Y, 0.1, idxs)
+
+    model = DNorm(manbyo_dict, None)
+    trainer = DNormTrainer(model, 0.1, batch_size=1, flush_every=8)
+    x_vec = model.tfidf.transform(X)
+    y_idx = np.array([model.norm2idx[y] for y in Y])
+    trainer.train_epoch(x_vec, y_idx, idxs)
+
+    assert (reference.W != DNorm(manbyo_dict, None).W).nnz > 0
+    assert model.W.toarray() == pytest.approx(reference.W.toarray())
+
+
+@pytest.mark.parametrize("batch_size", [1, 16])
+def test_train(batch_size, manbyo_dict):
+    X, Y = make_dataset(manbyo_dict)
+    model = DNorm(manbyo_dict, None, frozen=True)
+    before = model.calc_avg_rank(X, Y)
+
+    random.seed(0)
+    scores = model.train(X, Y, X[::5], Y[::5], 0.1, batch_size=batch_size)
+    assert len(scores) >= 2
+    assert scores[-1] >= scores[-2]
+    assert model.projected is None
+    assert model.calc_avg_rank(X, Y) < before
+
+
+def test_calc_ranks(manbyo_dict):
+    model = DNorm(manbyo_dict, None)
+    x = ["頭痛だ", "２型糖尿病", "悪性リンパ腫だよおおおおお", "xyz"]
+    y = ["頭痛", "糖尿病", "悪性リンパ腫", "疼痛"]
+
+    results, sims = model.predict(x, k=-1)
+    for rank, result, t in zip(model.calc_ranks(model.tfidf.transform(x), np.array([model.norm2idx[t] for t in y])), results, y):
+        assert rank == min(result.index(t), 101)
+    assert model.calc_avg_rank(x, ["存在しない病名"] * 4) == 101
+
+
+def test_parallel_train_reproducible(manbyo_dict):
+    X, Y = make_dataset(manbyo_dict)
+
+    weights = []
+    for _ in range(2):
+        model = DNorm(manbyo_dict, None)
+        before = model.calc_avg_rank(X, Y)
+        scores = model.train(X, Y, X[::5], Y[::5], 0.1, n_workers=2, seed=1, sync_every=50)
+        assert len(scores) >= 2
+        assert model.calc_avg_rank(X, Y) < before
+        weights.append(model.W)
+
+    assert (weights[0] != weights[1]).nnz == 0
+
+
+def test_parallel_validate(manbyo_dict):
+    X, Y = make_dataset(manbyo_dict)
+    model = DNorm(manbyo_dict, None)
+    trainer = ParallelDNormTrainer(model, 0.1, n_workers=3, sync_every=50, verbose=False)
+    x_vec = model.tfidf.transform(X)
+    y_idx = np.array([model.norm2idx[y] for y in Y])
+    trainer.train_epoch(x_vec, y_idx, list(range(len(X))))
+
+    assert trainer.validate(x_vec, y_idx) == pytest.approx(model.calc_avg_rank(X, Y))
+
+
+@pytest.mark.parametrize("n_workers", [1, 2])
+def test_empty_validation_set(n_workers, manbyo_dict):
+    X, Y = make_dataset(manbyo_dict)
+    model = DNorm(manbyo_dict, None)
+    scores = model.train(X, Y, [], [], 0.1, n_workers=n_workers, seed=0, sync_every=50)
+    assert len(scores) == 1
+    assert np.isnan(scores[0])
@@ -11,3 +11,25 @@ def test_exact_match(name, icd, norm, manbyo_dict):
     result, sim = converter.convert(name)
     assert result.icd == icd
     assert result.norm == norm
+
+def test_exact_match_batch(manbyo_dict):
+    converter = ExactMatchConverter(manbyo_dict)
+    words = ["疼痛", "頭痛だ", "疼痛"]
+    results = converter.convert_batch(words)
+    assert len(results) == len(words)
+    for word, (result, sim) in zip(words, results):
+        true_result, true_sim = converter.convert(word)
+        assert result == true_result
+        assert sim == true_sim
+
+@pytest.mark.parametrize(
+    "name, length", [
+    ("疼痛", 1),
+    ("頭痛だ", 0)]
+)
+def test_exact_match_topk(name, length, manbyo_dict):
+    converter = ExactMatchConverter(manbyo_dict)
+    results = converter.convert_topk(name, 10)
+    assert len(results) == length
+    for result, sim in results:
+        assert (result, sim) == converter.convert(name)
@@ -13,3 +13,21 @@ def test_fuzzy_match(name, icd, norm, manbyo_dict):
     result, sim = converter.convert(name)
     assert result.icd == icd, result.icd
     assert result.norm == norm, result.norm
+
+def test_fuzzy_match_batch(manbyo_dict):
+    converter = FuzzyMatchConverter(manbyo_dict)
+    words = ["疼痛", "頭痛だ", "aobijosdf", "頭痛だ"]
+    results = converter.convert_batch(words)
+    assert len(results) == len(words)
+    for word, (result, sim) in zip(words, results):
+        true_result, true_sim = converter.convert(word)
+        assert result == true_result
+        assert sim == true_sim
+
+@pytest.mark.parametrize("k", [1, 3, 10])
+@pytest.mark.parametrize("name", ["疼痛", "頭痛だ", "糖尿病だよ", "aobijosdf"])
+def test_fuzzy_match_topk(name, k, manbyo_dict):
+    converter = FuzzyMatchConverter(manbyo_dict)
+    results = converter.convert_topk(name, k)
+    true_results = converter.searcher.ranked_search(name, 0.5)[:k]
+    assert [(result.name, sim) for result, sim in results] == [(name, sim) for sim, name in true_results]
@@ -0,0 +1,49 @@
+from japanese_disease_normalizer import index_cache
+from japanese_disease_normalizer.utils import DictEntry
+
+
+def test_make_key():
+    assert index_cache.make_key("a", ["NFKC", "fullwidth"]) == index_cache.make_key("a", ["NFKC", "fullwidth"])
+    assert index_cache.make_key("a", ["NFKC", "fullwidth"]) != index_cache.make_key("a", ["fullwidth", "NFKC"])
+    assert index_cache.make_key("a", group="g").split("-")[0] == index_cache.make_key("b", group="g").split("-")[0]
+    assert index_cache.make_key("a", group="g").split("-")[0] != index_cache.make_key("a", group="h").split("-")[0]
+
+
+def test_file_hash(tmpdir):
+    path = tmpdir / "dict.csv"
+    path.write_text("疼痛,R529,疼痛,S\n", encoding="utf-8")
+    before = index_cache.file_hash(str(path))
+    assert before == index_cache.file_hash(str(path))
+
+    path.write_text("疼痛,R529,疼痛,A\n", encoding="utf-8")
+    assert before != index_cache.file_hash(str(path))
+
+
+def test_save_and_load(tmpdir, monkeypatch):
+    monkeypatch.setenv("DEFAULT_CACHE_PATH", str(tmpdir))
+
+    key = index_cache.make_key("test")
+    assert index_cache.load(key) is None
+
+    entries = [DictEntry("疼痛", "R529", "疼痛", "S")]
+    index_cache.save(key, entries)
+    assert (tmpdir / "norm" / "index" / (key + ".pkl")).exists()
+    assert index_cache.load(key) == entries
+
+
+def test_save_removes_stale_entries(tmpdir, monkeypatch):
+    monkeypatch.setenv("DEFAULT_CACHE_PATH", str(tmpdir))
+
+    old_key = index_cache.make_key("dictionary", "old hash", group="dict.csv")
+    other_key = index_cache.make_key("dictionary", "old hash", group="other.csv")
+    plain_key = index_cache.make_key("dictionary", "old hash")
+    for key in [old_key, other_key, plain_key]:
+        index_cache.save(key, [DictEntry("疼痛", "R529", "疼痛", "S")])
+
+    new_key = index_cache.make_key("dictionary", "new hash", group="dict.csv")
+    index_cache.save(new_key, [DictEntry("疼痛", "R529", "疼痛", "A")])
+    assert index_cache.load(old_key) is None
+    assert index_cache.load(new_key) == [DictEntry("疼痛", "R529", "疼痛", "A")]
+    # other groups and keys without a group are kept
+    assert index_cache.load(other_key) is not None
+    assert index_cache.load(plain_key) is not None
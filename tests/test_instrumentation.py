@@ -0,0 +1,58 @@
+import pickle
+
+from japanese_disease_normalizer.instrumentation import Instrumentation
+from japanese_disease_normalizer.converter.cascade_converter import CascadeConverter
+from japanese_disease_normalizer.preprocessor.pipeline import PreprocessorPipeline
+
+def test_instrumentation():
+    events = []
+    instrumentation = Instrumentation([lambda *event: events.append(event)])
+    instrumentation.record("convert", 0.001)
+    instrumentation.record("convert", 0.003)
+    instrumentation.count("variants", 3)
+    instrumentation.count("variants")
+
+    snapshot = instrumentation.snapshot()
+    assert snapshot["timers"]["convert"]["count"] == 2
+    assert abs(snapshot["timers"]["convert"]["total_ms"] - 4) < 1e-9
+    assert abs(snapshot["timers"]["convert"]["mean_ms"] - 2) < 1e-9
+    assert abs(snapshot["timers"]["convert"]["max_ms"] - 3) < 1e-9
+    assert snapshot["counters"] == {"variants": 4}
+    assert events == [("timer", "convert", 0.001), ("timer", "convert", 0.003), ("counter", "variants", 3), ("counter", "variants", 1)]
+
+    instrumentation.reset()
+    assert instrumentation.snapshot() == {"timers": {}, "counters": {}}
+
+def test_instrumentation_pickle():
+    instrumentation = Instrumentation([lambda *event: None])
+    instrumentation.count("variants")
+    restored = pickle.loads(pickle.dumps(instrumentation))
+    assert restored.callbacks == []
+    assert restored.counters == {"variants": 1}
+
+def test_pipeline_instrumentation():
+    pipeline = PreprocessorPipeline(["abbr", "NFKC", "fullwidth"], compiled=True)
+    expected = pipeline.preprocess("AML M2の疑い")
+    pipeline.instrumentation = Instrumentation()
+    assert pipeline.preprocess("AML M2の疑い") == expected
+
+    snapshot = pipeline.instrumentation.snapshot()
+    assert snapshot["timers"]["preprocess"]["count"] == 1
+    for stage in pipeline.stages:
+        assert snapshot["timers"]["preprocess." + type(stage).__name__]["count"] == 1
+    assert snapshot["counters"]["preprocess.variants"] == len(expected)
+
+def test_cascade_instrumentation(manbyo_dict):
+    converter = CascadeConverter(manbyo_dict, [("exact", 1), ("bigram", 0.5)])
+    converter.instrumentation = Instrumentation()
+    assert converter.converters[1].instrumentation is converter.instrumentation
+    converter.convert("疼痛")
+    converter.convert_batch(["頭痛だ", "aobijosdf", "疼痛"])
+
+    snapshot = converter.instrumentation.snapshot()
+    assert snapshot["timers"]["cascade.exact"]["count"] == 2
+    assert snapshot["timers"]["cascade.bigram"]["count"] == 1
+    assert snapshot["counters"]["cascade.answered.exact"] == 2
+    assert snapshot["counters"]["cascade.answered.bigram"] == 1
+    assert snapshot["counters"]["cascade.unanswered"] == 1
+    assert snapshot["counters"]["candidates.BigramMatchConverter"] > 0
@@ -1,14 +1,18 @@
 import os
+import json
 
 import pytest
 from japanese_disease_normalizer.normalizer import Normalizer
-from japanese_disease_normalizer.converter import exact_matcher, fuzzy_matcher, dnorm
+from japanese_disease_normalizer.instrumentation import Instrumentation
+from japanese_disease_normalizer.converter import exact_matcher, fuzzy_matcher, bigram_matcher, cascade_converter, dnorm
 from japanese_disease_normalizer.converter.base_converter import BaseConverter
+from japanese_disease_normalizer import utils
 from japanese_disease_normalizer.utils import DictEntry
 from japanese_disease_normalizer.preprocessor.basic_preprocessor import (
     FullWidthPreprocessor,
     NFKCPreprocessor,
 )
+from japanese_disease_normalizer.preprocessor.base_preprocessor import BasePreprocessor
 from japanese_disease_normalizer.preprocessor.pipeline import PreprocessorPipeline
 
 def test_download_manbyo(tmpdir):
@@ -31,7 +35,9 @@ def test_manbyo_cache(tmpdir):
     "name, model", [
     ("exact", exact_matcher.ExactMatchConverter),
     ("fuzzy", fuzzy_matcher.FuzzyMatchConverter),
+    ("bigram", bigram_matcher.BigramMatchConverter),
     ("dnorm", dnorm.dnorm_converter.DNormConverter),
+    ("cascade", cascade_converter.CascadeConverter),
     ]
 )
 def test_load_model(name, model, mocker):
@@ -84,6 +90,7 @@ def test_load_own_pipeline(mocker):
     "input, converter_name, preprocessor_name, output", [
         ("2型糖尿病", "exact", "basic", DictEntry("２型糖尿病", "E11", "２型糖尿病", "S")),
         ("2型糖尿病", "fuzzy", "basic", DictEntry("２型糖尿病", "E11", "２型糖尿病", "S")),
+        ("2型糖尿病", "bigram", "basic", DictEntry("２型糖尿病", "E11", "２型糖尿病", "S")),
         ("2型糖尿病", "dnorm", "basic", DictEntry("２型糖尿病", "E11", "２型糖尿病", "S")),
     ]
 )
@@ -124,3 +131,321 @@ def test_invalid_args(preprocessor_name, converter_name, mocker):
 
     with pytest.raises(NotImplementedError):
         target_model = Normalizer(preprocessor_name, converter_name)
+
+
+@pytest.mark.parametrize(
+    "converter_name, preprocessor_name", [
+        ("exact", "basic"),
+        ("fuzzy", "basic"),
+        ("dnorm", "basic"),
+    ]
+)
+def test_normalize_batch(converter_name, preprocessor_name, manbyo_dict, mocker):
+    mocker.patch("japanese_disease_normalizer.normalizer.Normalizer.load_manbyo_dict", return_value=manbyo_dict)
+
+    target_model = Normalizer(preprocessor_name, converter_name)
+    words = ["2型糖尿病", "頭痛だ", "aobijosdf", "2型糖尿病", "疼痛"]
+    results = target_model.normalize_batch(words)
+    assert len(results) == len(words)
+    for word, result in zip(words, results):
+        output = target_model.normalize(word)
+        assert result.icd == output.icd
+        assert result.norm == output.norm
+
+
+@pytest.mark.parametrize(
+    "converter_name, model", [
+    ("exact", exact_matcher.ExactMatchConverter),
+    ("fuzzy", fuzzy_matcher.FuzzyMatchConverter),
+    ("dnorm", dnorm.dnorm_converter.DNormConverter),
+    ]
+)
+def test_index_cache(converter_name, model, tmpdir, monkeypatch, mocker):
+    base_dir = tmpdir.mkdir("norm")
+    monkeypatch.setenv("DEFAULT_CACHE_PATH", str(base_dir))
+    base_dir.mkdir("norm")
+    with open("tests/sample_dict.csv", "rb") as f:
+        (base_dir / "norm" / "MANBYO_SABC.csv").write_binary(f.read())
+
+    cold_model = Normalizer("basic", converter_name, use_cache=True)
+    assert len((base_dir / "norm" / "index").listdir()) == 2
+
+    load_dict = mocker.spy(Normalizer, "load_manbyo_dict")
+    build_converter = mocker.spy(Normalizer, "build_converter")
+    warm_model = Normalizer("basic", converter_name, use_cache=True)
+    assert load_dict.call_count == 0
+    assert build_converter.call_count == 0
+    assert type(warm_model.converter) == model
+    assert warm_model.manbyo_dict == cold_model.manbyo_dict
+    if converter_name == "dnorm":
+        # the model is mapped again from dnorm_mmap instead of being copied into the cache
+        model = warm_model.converter.model
+        assert all(dnorm.dnorm.is_mapped(array) for array in [model.tfidf.idf_, model.W.data, model.W.indices, model.W.indptr])
+
+    for word in ["2型糖尿病", "頭痛だ", "疼痛"]:
+        assert warm_model.normalize(word) == cold_model.normalize(word)
+
+    # other pipeline does not hit the cache
+    Normalizer(PreprocessorPipeline(["NFKC"]), converter_name, use_cache=True)
+    assert load_dict.call_count == 1
+
+
+def test_index_cache_resources(tmpdir, monkeypatch, mocker):
+    base_dir = tmpdir.mkdir("norm")
+    monkeypatch.setenv("DEFAULT_CACHE_PATH", str(base_dir))
+    base_dir.mkdir("norm")
+    with open("tests/sample_dict.csv", "rb") as f:
+        (base_dir / "norm" / "MANBYO_SABC.csv").write_binary(f.read())
+
+    Normalizer("abbr", "dnorm", use_cache=True)
+    load_dict = mocker.spy(Normalizer, "load_manbyo_dict")
+    build_converter = mocker.spy(Normalizer, "build_converter")
+    Normalizer("abbr", "dnorm", use_cache=True)
+    assert (load_dict.call_count, build_converter.call_count) == (0, 0)
+
+    # other abbreviation dictionary does not hit the cache
+    abbr_dict = json.loads((base_dir / "norm" / "abb_dict.json").read_text("utf-8"))
+    abbr_dict["XYZ"] = [[1, "xyz病"]]
+    (base_dir / "norm" / "abb_dict.json").write_text(json.dumps(abbr_dict), "utf-8")
+    Normalizer("abbr", "dnorm", use_cache=True)
+    assert (load_dict.call_count, build_converter.call_count) == (1, 1)
+    # entries of the old abbreviation dictionary are replaced
+    assert len((base_dir / "norm" / "index").listdir()) == 2
+
+    # other dnorm model does not hit the cache
+    model = dnorm.dnorm.DNorm(utils.load_dict(str(base_dir / "norm" / "MANBYO_SABC.csv")), base_dir / "Dnorm" / "dnorm.pkl")
+    model.W = model.W * 2
+    model.save_model(base_dir / "Dnorm" / "dnorm.pkl")
+    Normalizer("abbr", "dnorm", use_cache=True)
+    assert (load_dict.call_count, build_converter.call_count) == (1, 2)
+    assert len((base_dir / "norm" / "index").listdir()) == 2
+
+
+@pytest.mark.parametrize(
+    "converter_name", ["exact", "fuzzy", "bigram", "dnorm"]
+)
+def test_normalize_topk(converter_name, manbyo_dict, mocker):
+    mocker.patch("japanese_disease_normalizer.normalizer.Normalizer.load_manbyo_dict", return_value=manbyo_dict)
+
+    target_model = Normalizer("basic", converter_name)
+    for word in ["2型糖尿病", "頭痛だ", "糖尿病だよ"]:
+        results = target_model.normalize_topk(word, 5)
+        assert len(results) <= 5
+        assert len(set(result.name for result, sim in results)) == len(results)
+        sims = [sim for result, sim in results]
+        assert sims == sorted(sims, reverse=True)
+        if len(results) > 0:
+            assert results[0][0] == target_model.normalize(word)
+
+
+def test_normalize_topk_merges_variants(manbyo_dict, mocker):
+    mocker.patch("japanese_disease_normalizer.normalizer.Normalizer.load_manbyo_dict", return_value=manbyo_dict)
+
+    class VariantPreprocessor(BasePreprocessor):
+        def preprocess(self, word):
+            return [word, "頭痛", "疼痛"]
+
+    target_model = Normalizer(PreprocessorPipeline([VariantPreprocessor()]), "exact")
+    results = target_model.normalize_topk("頭痛", 10)
+    assert [result.name for result, sim in results] == ["頭痛", "疼痛"]
+
+
+@pytest.mark.parametrize("policy", ["lru", "lfu"])
+def test_result_cache(policy, manbyo_dict, mocker):
+    mocker.patch("japanese_disease_normalizer.normalizer.Normalizer.load_manbyo_dict", return_value=manbyo_dict)
+
+    target_model = Normalizer("basic", "fuzzy", result_cache_size=2, result_cache_policy=policy)
+    convert = mocker.spy(target_model.converter, "convert")
+    words = ["頭痛だ", "頭痛だ", "２型糖尿病", "頭痛だ", "疼痛", "2型糖尿病"]
+    results = [target_model.normalize(word) for word in words]
+
+    assert [result.name for result in results] == ["頭痛", "頭痛", "２型糖尿病", "頭痛", "疼痛", "２型糖尿病"]
+    # 2型糖尿病 has the same preprocessed name as ２型糖尿病
+    assert convert.call_count == 3
+    stats = target_model.cache_stats()
+    assert stats["result"]["hits"] == 2
+    assert stats["result"]["misses"] == 4
+    assert stats["result"]["evictions"] == 2
+    assert stats["variant"]["size"] == 2
+
+
+def test_result_cache_batch(manbyo_dict, mocker):
+    mocker.patch("japanese_disease_normalizer.normalizer.Normalizer.load_manbyo_dict", return_value=manbyo_dict)
+
+    target_model = Normalizer("basic", "bigram", result_cache_size=100)
+    words = ["2型糖尿病", "頭痛だ", "aobijosdf", "2型糖尿病", "疼痛"]
+    target_model.normalize("頭痛だ")
+    convert_batch = mocker.spy(target_model.converter, "convert_batch")
+    results = target_model.normalize_batch(words)
+
+    assert convert_batch.call_args[0][0] == ["２型糖尿病", "ａｏｂｉｊｏｓｄｆ", "疼痛"]
+    assert [result.name for result in results] == [target_model.normalize(word).name for word in words]
+    assert target_model.normalize_batch(words) == results
+    assert convert_batch.call_count == 1
+
+
+def test_result_cache_invalidation(manbyo_dict, mocker):
+    mocker.patch("japanese_disease_normalizer.normalizer.Normalizer.load_manbyo_dict", return_value=manbyo_dict)
+
+    target_model = Normalizer("basic", "fuzzy", result_cache_size=10)
+    assert target_model.normalize("頭痛だ").name == "頭痛"
+    assert target_model.cache_stats()["result"]["size"] == 1
+
+    target_model.converter = exact_matcher.ExactMatchConverter(target_model.manbyo_dict)
+    assert target_model.cache_stats()["result"]["size"] == 0
+    assert target_model.cache_stats()["variant"]["size"] == 0
+    assert target_model.normalize("頭痛だ").name is None
+
+    target_model.preprocessor = PreprocessorPipeline(["identical"])
+    assert target_model.cache_stats()["result"]["size"] == 0
+    assert target_model.cache_stats()["variant"]["size"] == 1
+
+    target_model.manbyo_dict = target_model.manbyo_dict.replace_names(["頭痛だ"] * len(target_model.manbyo_dict))
+    assert target_model.cache_stats()["variant"]["size"] == 0
+
+
+def test_result_cache_disabled(manbyo_dict, mocker):
+    mocker.patch("japanese_disease_normalizer.normalizer.Normalizer.load_manbyo_dict", return_value=manbyo_dict)
+
+    target_model = Normalizer("basic", "exact")
+    assert target_model.result_cache is None
+    assert target_model.cache_stats() == {}
+
+
+@pytest.mark.parametrize("preprocessor_name", ["basic", "abbr"])
+def test_preprocess_dictionary(preprocessor_name, manbyo_dict, mocker):
+    mocker.patch("japanese_disease_normalizer.normalizer.Normalizer.load_manbyo_dict", return_value=manbyo_dict)
+
+    target_model = Normalizer(preprocessor_name, "exact")
+    names = [d.name for d in manbyo_dict] + ["AML M2の疑い", "ＡＭＬ", "高K血症"]
+    outputs = [target_model.preprocessor.preprocess(name)[0] for name in names]
+    assert target_model.manbyo_dict.names() == outputs[:len(manbyo_dict)]
+    assert target_model.dict_preprocess_time > 0
+    assert target_model.preprocess_dictionary(names, n_jobs=2, chunk_size=3) == outputs
+
+
+def test_preprocess_dictionary_parallel(manbyo_dict, mocker):
+    mocker.patch("japanese_disease_normalizer.normalizer.Normalizer.load_manbyo_dict", return_value=manbyo_dict)
+
+    serial_model = Normalizer("basic", "exact")
+    parallel_model = Normalizer("basic", "exact", n_jobs=2)
+    assert parallel_model.manbyo_dict == serial_model.manbyo_dict
+
+
+def test_normalize_early_exit(manbyo_dict, mocker):
+    mocker.patch("japanese_disease_normalizer.normalizer.Normalizer.load_manbyo_dict", return_value=manbyo_dict)
+
+    class MyPipeline(PreprocessorPipeline):
+        def preprocess(self, word):
+            return ["頭痛だ", "頭痛だ", "疼痛", "頭痛", "発熱"]
+
+    target_model = Normalizer(PreprocessorPipeline(["identical"]), "fuzzy")
+    target_model.preprocessor = MyPipeline(["identical"])
+    convert = mocker.spy(target_model.converter, "convert")
+    assert target_model.normalize("頭痛だ").name == "疼痛"
+    assert [call[0][0] for call in convert.call_args_list] == ["頭痛だ", "疼痛"]
+
+
+def test_normalize_variants_batch(manbyo_dict, mocker):
+    mocker.patch("japanese_disease_normalizer.normalizer.Normalizer.load_manbyo_dict", return_value=manbyo_dict)
+
+    class MyConverter(BaseConverter):
+        def convert(self, word):
+            return DictEntry(word, None, word, None), len(word)
+
+    class MyPipeline(PreprocessorPipeline):
+        def preprocess(self, word):
+            return ["頭痛", "頭痛だ", "頭痛", "頭痛だよ", "頭痛だ"]
+
+    target_model = Normalizer(MyPipeline(["identical"]), MyConverter())
+    convert = mocker.spy(target_model.converter, "convert")
+    convert_batch = mocker.spy(target_model.converter, "convert_batch")
+    assert target_model.normalize("頭痛").name == "頭痛だよ"
+    assert convert_batch.call_args[0][0] == ["頭痛", "頭痛だ", "頭痛だよ"]
+    assert convert.call_count == 3
+
+
+def test_normalize_return_score(manbyo_dict, mocker):
+    mocker.patch("japanese_disease_normalizer.normalizer.Normalizer.load_manbyo_dict", return_value=manbyo_dict)
+
+    target_model = Normalizer("basic", "fuzzy", result_cache_size=10)
+    words = ["頭痛だ", "疼痛", "aobijosdf"]
+    results = [target_model.normalize(word, return_score=True) for word in words]
+    assert [result for result, _ in results] == [target_model.normalize(word) for word in words]
+    assert results[1][1] == 1.0
+    assert target_model.normalize_batch(words, return_score=True) == results
+    target_model.clear_result_cache()
+    assert target_model.normalize_batch(words, return_score=True) == results
+
+
+def test_normalizer_instrumentation(manbyo_dict, mocker):
+    mocker.patch("japanese_disease_normalizer.normalizer.Normalizer.load_manbyo_dict", return_value=manbyo_dict)
+
+    instrumentation = Instrumentation()
+    target_model = Normalizer("basic", "fuzzy", result_cache_size=10, instrumentation=instrumentation)
+    assert target_model.preprocessor.instrumentation is instrumentation
+    assert target_model.converter.instrumentation is instrumentation
+    target_model.normalize("頭痛だ")
+    target_model.normalize("頭痛だ")
+    target_model.normalize_batch(["頭痛だ", "疼痛", "aobijosdf"])
+
+    snapshot = instrumentation.snapshot()
+    assert snapshot["timers"]["normalize"]["count"] == 2
+    assert snapshot["timers"]["normalize_batch"]["count"] == 1
+    assert snapshot["timers"]["convert.FuzzyMatchConverter"]["count"] == 1
+    assert snapshot["timers"]["convert_batch.FuzzyMatchConverter"]["count"] == 1
+    assert snapshot["counters"]["normalize.inputs"] == 5
+    assert snapshot["counters"]["result_cache.hits"] == 2
+    assert snapshot["counters"]["result_cache.misses"] == 3
+    assert snapshot["counters"]["variant_cache.misses"] == 3
+    assert snapshot["counters"]["candidates.FuzzyMatchConverter"] > 0
+
+    target_model.converter = exact_matcher.ExactMatchConverter(target_model.manbyo_dict)
+    assert target_model.converter.instrumentation is instrumentation
+    target_model.instrumentation = None
+    assert target_model.preprocessor.instrumentation is None
+    target_model.normalize("疼痛")
+    assert instrumentation.snapshot() == snapshot
+
+
+def test_normalize_early_exit_instrumentation(manbyo_dict, mocker):
+    mocker.patch("japanese_disease_normalizer.normalizer.Normalizer.load_manbyo_dict", return_value=manbyo_dict)
+
+    class MyPipeline(PreprocessorPipeline):
+        def preprocess(self, word):
+            return ["疼痛", "頭痛", "発熱"]
+
+    target_model = Normalizer(MyPipeline(["identical"]), "exact", instrumentation=Instrumentation())
+    target_model.normalize("疼痛")
+    snapshot = target_model.instrumentation.snapshot()
+    assert snapshot["counters"]["normalize.variants"] == 3
+    assert snapshot["counters"]["normalize.early_exit"] == 1
+    assert snapshot["timers"]["convert.ExactMatchConverter"]["count"] == 1
+
+
+def test_cascade_ranks_variants_by_stage(manbyo_dict, tmpdir, monkeypatch, mocker):
+    mocker.patch("japanese_disease_normalizer.normalizer.Normalizer.load_manbyo_dict", return_value=manbyo_dict)
+    monkeypatch.setenv("DEFAULT_CACHE_PATH", str(tmpdir))
+
+    class MyPipeline(PreprocessorPipeline):
+        def preprocess(self, word):
+            return ["悪性リンパ腫だよおおおおお", word]
+
+    target_model = Normalizer(MyPipeline(["identical"]), "cascade", cascade_stages=[("exact", 1), ("dnorm", None)], result_cache_size=10)
+    # dot-product score of dnorm is unbounded
+    model = target_model.converter.converters[1].model
+    model.W = model.W * 2
+    model.freeze()
+    dnorm_result = target_model.converter.convert_with_stage("悪性リンパ腫だよおおおおお")
+    exact_result = target_model.converter.convert_with_stage("疼痛")
+    assert (dnorm_result[2], exact_result[2]) == (1, 0)
+    assert dnorm_result[1] > exact_result[1]
+
+    assert target_model.normalize("疼痛", return_score=True) == exact_result[:2]
+    target_model.clear_result_cache()
+    assert target_model.normalize_batch(["疼痛", "aobijosdf"], return_score=True) == [exact_result[:2], dnorm_result[:2]]
+
+    topk = target_model.normalize_topk("疼痛", 3)
+    assert topk[0] == target_model.normalize("疼痛", return_score=True)
+    assert topk[0][0].name == "疼痛"
+    assert (dnorm_result[0].name, dnorm_result[1]) in [(result.name, sim) for result, sim in topk[1:]]
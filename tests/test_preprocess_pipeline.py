@@ -1,3 +1,5 @@
+import random
+
 import pytest
 
 from japanese_disease_normalizer.preprocessor.basic_preprocessor import BasePreprocessor
@@ -59,3 +61,56 @@ def test_preprocess(input, pipelines, outputs):
     results.sort()
     for output, result in zip(outputs, results):
         assert output == result
+
+
+@pytest.mark.parametrize(
+    "pipelines, stages", [
+        (["NFKC", "fullwidth"], ["FusedPreprocessor"]),
+        (["identical", "NFKC", "fullwidth", "identical"], ["FusedPreprocessor"]),
+        (["abbr", "NFKC", "fullwidth"], ["AbbrPreprocessor", "FusedPreprocessor"]),
+        (["NFKC", "abbr", "fullwidth"], ["FusedPreprocessor", "AbbrPreprocessor", "FusedPreprocessor"]),
+        ([], []),
+    ]
+)
+def test_compile(pipelines, stages):
+    model = PreprocessorPipeline(pipelines, compiled=True)
+    assert [type(stage).__name__ for stage in model.stages] == stages
+
+
+@pytest.mark.parametrize(
+    "pipelines", [
+        ["NFKC", "fullwidth"],
+        ["fullwidth", "NFKC"],
+        ["fullwidth"],
+        ["NFKC"],
+        ["abbr", "NFKC", "fullwidth"],
+    ]
+)
+def test_compiled_preprocess(pipelines, manbyo_dict):
+    rng = random.Random(0)
+    corpus = [d.name for d in manbyo_dict] + [
+        "ｺﾝﾆﾁﾊ〜", "ｶﾞｷﾞｸﾞﾊﾟﾋﾟﾌﾟｳﾞ", "ﾞｶﾟ", "ﾊﾞﾞ", "AML M2の疑い", "ＡＭＬ", "２型糖尿病", "㍻", "①", "ﬁ",
+        "é", "が", "か゛", "각", "각", "ﾝﾟ", "－―‐", "Ｋだよー", "高K血症", "",
+    ]
+    chars = [chr(c) for c in range(0x20, 0x3100)] + list("ｶﾞﾊﾟｺﾝﾆﾁﾊ〜가각゙゚́")
+    corpus += ["".join(rng.choices(chars, k=rng.randint(1, 12))) for _ in range(2000)]
+
+    model = PreprocessorPipeline(pipelines)
+    compiled_model = PreprocessorPipeline(pipelines, compiled=True)
+    for word in corpus:
+        assert compiled_model.preprocess(word) == model.preprocess(word)
+
+
+@pytest.mark.parametrize(
+    "pipelines, compiled", [
+        (["NFKC", "fullwidth"], True),
+        (["NFKC", "fullwidth"], False),
+        (["abbr", "NFKC", "fullwidth"], True),
+        (["abbr", "fullwidth"], False),
+    ]
+)
+def test_preprocess_identity(pipelines, compiled, manbyo_dict):
+    corpus = [d.name for d in manbyo_dict] + ["ｺﾝﾆﾁﾊ〜", "AML M2の疑い", "ＡＭＬ", "高K血症", "K ACL", ""]
+    model = PreprocessorPipeline(pipelines, compiled=compiled)
+    for word in corpus:
+        assert model.preprocess_identity(word) == model.preprocess(word)[0]
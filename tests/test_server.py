@@ -0,0 +1,134 @@
+import json
+import time
+import asyncio
+import threading
+import urllib.request
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from japanese_disease_normalizer.normalizer import Normalizer
+from japanese_disease_normalizer.server import NormalizationServer, percentile
+
+
+@pytest.fixture
+def normalizer(manbyo_dict, mocker):
+    mocker.patch("japanese_disease_normalizer.normalizer.Normalizer.load_manbyo_dict", return_value=manbyo_dict)
+    return Normalizer("basic", "fuzzy")
+
+
+@pytest.fixture
+def run_server():
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    servers = []
+
+    def start(server):
+        asyncio.run_coroutine_threadsafe(server.start(), loop).result(10)
+        servers.append(server)
+        return "http://127.0.0.1:{}".format(server.port)
+
+    yield start
+
+    for server in servers:
+        asyncio.run_coroutine_threadsafe(server.stop(), loop).result(10)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(10)
+    loop.close()
+
+
+def request(url, payload=None):
+    data = None if payload is None else json.dumps(payload).encode("utf-8")
+    req = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(req, timeout=10) as response:
+            return response.status, json.loads(response.read().decode("utf-8"))
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read().decode("utf-8"))
+
+
+def test_normalize(normalizer, run_server):
+    url = run_server(NormalizationServer(normalizer, port=0))
+    status, result = request(url + "/normalize", {"text": "頭痛だ"})
+    entry, score = normalizer.normalize("頭痛だ", return_score=True)
+    assert status == 200
+    assert result == {"input": "頭痛だ", "name": entry.name, "icd": entry.icd, "norm": entry.norm, "level": entry.level, "score": score}
+
+    status, result = request(url + "/normalize", {"texts": ["疼痛", "aobijosdf"]})
+    assert status == 200
+    assert [r["norm"] for r in result["results"]] == ["疼痛", None]
+    assert request(url + "/health") == (200, {"status": "ok"})
+
+
+@pytest.mark.parametrize(
+    "path, payload, status", [
+        ("/normalize", {"txt": "頭痛"}, 400),
+        ("/normalize", {"texts": ["頭痛", 1]}, 400),
+        ("/normalize", None, 405),
+        ("/unknown", None, 404),
+    ]
+)
+def test_errors(path, payload, status, normalizer, run_server):
+    url = run_server(NormalizationServer(normalizer, port=0))
+    assert request(url + path, payload)[0] == status
+
+
+def test_micro_batching(normalizer, run_server, mocker):
+    server = NormalizationServer(normalizer, port=0, max_batch_size=8, max_wait=0.2)
+    url = run_server(server)
+    normalize_batch = mocker.spy(normalizer, "normalize_batch")
+    words = ["頭痛だ", "疼痛", "2型糖尿病", "aobijosdf"] * 4
+
+    with ThreadPoolExecutor(max_workers=len(words)) as executor:
+        results = list(executor.map(lambda word: request(url + "/normalize", {"text": word}), words))
+
+    assert [result["norm"] for _, result in results] == [normalizer.normalize(word).norm for word in words]
+    assert max(len(call[0][0]) for call in normalize_batch.call_args_list) > 1
+    assert all(len(call[0][0]) <= 8 for call in normalize_batch.call_args_list)
+
+    _, metrics = request(url + "/metrics")
+    assert metrics["requests"] == len(words)
+    assert metrics["names"] == len(words)
+    assert metrics["batches"] == normalize_batch.call_count < len(words)
+    assert metrics["batch_size"]["max"] <= 8
+    assert metrics["latency_ms"]["p50"] <= metrics["latency_ms"]["p99"]
+
+
+def test_event_loop_responsive(normalizer, run_server, mocker):
+    original = normalizer.normalize_batch
+
+    def slow_normalize_batch(*args, **kwargs):
+        time.sleep(0.5)
+        return original(*args, **kwargs)
+
+    mocker.patch.object(normalizer, "normalize_batch", side_effect=slow_normalize_batch)
+    url = run_server(NormalizationServer(normalizer, port=0, max_wait=0))
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        future = executor.submit(request, url + "/normalize", {"text": "頭痛だ"})
+        time.sleep(0.1)
+        start = time.perf_counter()
+        assert request(url + "/health") == (200, {"status": "ok"})
+        assert time.perf_counter() - start < 0.3
+        assert future.result()[0] == 200
+
+
+def test_percentile():
+    assert percentile([], 50) is None
+    assert percentile([1, 2, 3, 4], 50) == 2
+    assert percentile(list(range(1, 101)), 99) == 99
+    assert percentile([5], 99) == 5
+
+
+def test_batch_size_limit(normalizer, run_server, mocker):
+    server = NormalizationServer(normalizer, port=0, max_batch_size=4, max_wait=0.2)
+    url = run_server(server)
+    normalize_batch = mocker.spy(normalizer, "normalize_batch")
+    payloads = [{"texts": ["頭痛だ", "疼痛", "発熱"]}, {"texts": ["疼痛", "頭痛"]}, {"texts": ["2型糖尿病"] * 6}]
+
+    with ThreadPoolExecutor(max_workers=len(payloads)) as executor:
+        results = list(executor.map(lambda payload: request(url + "/normalize", payload), payloads))
+
+    assert [len(result["results"]) for _, result in results] == [3, 2, 6]
+    sizes = sorted(len(call[0][0]) for call in normalize_batch.call_args_list)
+    assert sizes == [2, 3, 6]
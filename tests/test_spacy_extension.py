@@ -1,8 +1,16 @@
+import pickle
+import shutil
+import multiprocessing
+
 import pytest
+import spacy
 from spacy.tokens import Span
+from spacy.language import Language
 from spacy.lang.ja import Japanese
 
 from japanese_disease_normalizer.spacy_extension.manbyo_normalizer import ManbyoNormalizer
+from japanese_disease_normalizer.converter import exact_matcher
+from japanese_disease_normalizer.converter.cascade_converter import CascadeConverter
 from japanese_disease_normalizer.utils import DictEntry
 
 def test_manbyo_normalizer():
@@ -28,3 +36,125 @@ def test_manbyo_normalizer():
         assert norm.icd == true_entry.icd
         assert norm.norm == true_entry.norm
         assert norm.level == true_entry.level
+
+
+@Language.component("test_first_two_tokens")
+def first_two_tokens(doc):
+    doc.set_ents([Span(doc, 0, 2, "C")])
+    return doc
+
+
+def make_docs(nlp, texts):
+    for text in texts:
+        doc = nlp(text)
+        doc.set_ents([Span(doc, 0, 2, "C")])
+        yield doc
+
+
+def test_manbyo_normalizer_pipe(mocker):
+    nlp = Japanese()
+    component = ManbyoNormalizer(None, None)
+    texts = ["急性骨髄性白血病にて緊急入院", "AMLにて入院", "急性骨髄性白血病にて緊急入院", "AMLの疑い"]
+    normalize_batch = mocker.spy(component.normalizer, "normalize_batch")
+
+    docs = list(component.pipe(make_docs(nlp, texts), batch_size=3))
+    assert [doc.text for doc in docs] == texts
+    assert normalize_batch.call_count == 2
+    assert normalize_batch.call_args_list[0][0][0] == ["急性骨髄", "AMLにて"]
+    for doc in docs:
+        for ent in doc.ents:
+            assert ent._.norm == component.normalizer.normalize(ent.text)
+
+
+def test_manbyo_normalizer_n_process(manbyo_dict, tmp_path, mocker, monkeypatch):
+    mocker.patch("japanese_disease_normalizer.normalizer.Normalizer.load_manbyo_dict", return_value=manbyo_dict)
+    # worker processes that rebuilt the normalizer would download the dictionary here
+    monkeypatch.setenv("DEFAULT_CACHE_PATH", str(tmp_path))
+    nlp = Japanese()
+    nlp.add_pipe("test_first_two_tokens")
+    component = nlp.add_pipe("manbyo_normalizer")
+    texts = ["急性骨髄性白血病にて緊急入院", "AMLにて入院"] * 4
+
+    start_method = multiprocessing.get_start_method()
+    multiprocessing.set_start_method("spawn", force=True)
+    try:
+        docs = list(nlp.pipe(texts, n_process=2, batch_size=2))
+    finally:
+        multiprocessing.set_start_method(start_method, force=True)
+
+    assert not (tmp_path / "norm" / "MANBYO_SABC.csv").exists()
+    for doc in docs:
+        assert len(doc.ents) == 1
+        for ent in doc.ents:
+            assert ent._.norm == component.normalizer.normalize(ent.text)
+
+
+def test_manbyo_normalizer_pickle(manbyo_dict, mocker):
+    mocker.patch("japanese_disease_normalizer.normalizer.Normalizer.load_manbyo_dict", return_value=manbyo_dict)
+    component = ManbyoNormalizer(None, None)
+    assert component._normalizer is None
+    restored = pickle.loads(pickle.dumps(component))
+    assert component._normalizer is not None
+    assert restored._normalizer is not None
+    assert restored.normalizer.normalize("AML") == component.normalizer.normalize("AML")
+
+
+def test_manbyo_normalizer_config(manbyo_dict, mocker):
+    mocker.patch("japanese_disease_normalizer.normalizer.Normalizer.load_manbyo_dict", return_value=manbyo_dict)
+    nlp = Japanese()
+    component = nlp.add_pipe("manbyo_normalizer", config={
+        "preprocess_pipeline": "basic",
+        "converter": "cascade",
+        "cascade_stages": [["exact", 1], ["bigram", 0.5]],
+    })
+    assert component._normalizer is None
+    nlp.initialize()
+    assert component._normalizer is not None
+    assert type(component.normalizer.converter) == CascadeConverter
+    assert component.normalizer.converter.names == ["exact", "bigram"]
+    assert component.normalizer.normalize("頭痛だ").norm == "頭痛"
+
+
+def test_manbyo_normalizer_to_disk(manbyo_dict, tmpdir, mocker):
+    mocker.patch("japanese_disease_normalizer.normalizer.Normalizer.load_manbyo_dict", return_value=manbyo_dict)
+    nlp = Japanese()
+    nlp.add_pipe("test_first_two_tokens")
+    nlp.add_pipe("manbyo_normalizer", config={"preprocess_pipeline": "basic", "converter": "bigram"})
+    nlp.to_disk(str(tmpdir / "model"))
+    assert (tmpdir / "model" / "manbyo_normalizer" / "normalizer.pkl").exists()
+
+    load_manbyo_dict = mocker.patch("japanese_disease_normalizer.normalizer.Normalizer.load_manbyo_dict")
+    loaded = spacy.load(str(tmpdir / "model"))
+    component = loaded.get_pipe("manbyo_normalizer")
+    assert component._normalizer is not None
+    doc = loaded("頭痛だよ")
+    assert doc.ents[0]._.norm == nlp.get_pipe("manbyo_normalizer").normalizer.normalize(doc.ents[0].text)
+    assert load_manbyo_dict.call_count == 0
+
+
+def test_manbyo_normalizer_from_disk_config(manbyo_dict, tmpdir, mocker):
+    mocker.patch("japanese_disease_normalizer.normalizer.Normalizer.load_manbyo_dict", return_value=manbyo_dict)
+    component = ManbyoNormalizer(None, None, preprocess_pipeline="basic", converter="bigram")
+    component.to_disk(str(tmpdir / "component"))
+
+    same = ManbyoNormalizer(None, None, preprocess_pipeline="basic", converter="bigram").from_disk(str(tmpdir / "component"))
+    assert same._normalizer is not None
+
+    with pytest.warns(UserWarning):
+        other = ManbyoNormalizer(None, None, preprocess_pipeline="basic", converter="exact").from_disk(str(tmpdir / "component"))
+    assert other._normalizer is None
+    assert type(other.normalizer.converter) == exact_matcher.ExactMatchConverter
+
+
+def test_manbyo_normalizer_from_disk_missing_model(manbyo_dict, tmpdir, mocker, monkeypatch):
+    mocker.patch("japanese_disease_normalizer.normalizer.Normalizer.load_manbyo_dict", return_value=manbyo_dict)
+    monkeypatch.setenv("DEFAULT_CACHE_PATH", str(tmpdir / "cache"))
+    component = ManbyoNormalizer(None, None, preprocess_pipeline="basic", converter="dnorm")
+    component.to_disk(str(tmpdir / "component"))
+
+    # the saved dnorm model refers to the memory-mapped model, which is not on this host
+    shutil.rmtree(str(tmpdir / "cache" / "Dnorm" / "dnorm_mmap"))
+    with pytest.warns(UserWarning):
+        loaded = ManbyoNormalizer(None, None, preprocess_pipeline="basic", converter="dnorm").from_disk(str(tmpdir / "component"))
+    assert loaded._normalizer is None
+    assert loaded.normalizer.normalize("頭痛だ") == component.normalizer.normalize("頭痛だ")